@@ -5,11 +5,23 @@ from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 
+from app.assets import stylesheets
+from app.auth.credentials import credential_cache
+from app.auth.sessions import user_cache
+from app.caching import cache
+from app.fragments import fragment_cache
+from app.lookups import paste_cache
+from app.rendering import highlight_service
+from app.storage import blob_store
+from app.unique_ids import UniqueIdAllocator
+from app.view_counter import ViewCounter
 from config import config
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 migrate = Migrate()
+view_counter = ViewCounter()
+id_allocator = UniqueIdAllocator()
 
 
 def create_app(config_name=None):
@@ -23,18 +35,30 @@ def create_app(config_name=None):
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    migrate.init_app(
+        app, db, directory=os.path.join(os.path.dirname(app.root_path), "migrations")
+    )
+    view_counter.init_app(app)
+    cache.init_app(app)
+    credential_cache.init_app(app)
+    user_cache.init_app(app)
+    paste_cache.init_app(app)
+    fragment_cache.init_app(app)
+    id_allocator.init_app(app)
+    blob_store.init_app(app)
+    highlight_service.init_app(app)
+    stylesheets.init_app(app)
 
     login_manager.login_view = "auth.login"
     login_manager.login_message = "Please log in to access this page."
     login_manager.login_message_category = "info"
 
     # Import models after db initialization
-    from app.models import User
+    from app import models  # noqa: F401
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(int(user_id))
 
     # Register blueprints
     from app.api.routes import api_bp
@@ -45,4 +69,14 @@ def create_app(config_name=None):
     app.register_blueprint(api_bp, url_prefix="/api")
     app.register_blueprint(auth_bp, url_prefix="/auth")
 
+    # Keep the full-text search index in sync with pastes
+    from app import search
+
+    search.init_app(app)
+
+    # Register CLI commands
+    from app.commands import register_commands
+
+    register_commands(app)
+
     return app
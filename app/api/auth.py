@@ -1,8 +1,11 @@
 import base64
 from functools import wraps
 
-from flask import current_app, jsonify, request
+from flask import jsonify, request
 
+from app import db
+from app.api.tokens import verify_token
+from app.auth.sessions import UserSnapshot
 from app.models import User
 
 
@@ -43,18 +46,10 @@ def token_required(f):
         if not token:
             return jsonify({"error": "Token is missing"}), 401
 
-        # For now, we'll use a simple token system
-        # In production, you'd want to use proper JWT tokens
-        try:
-            # Simple token format: base64(username:secret)
-            decoded = base64.b64decode(token).decode("utf-8")
-            username, secret = decoded.split(":", 1)
-            user = User.query.filter_by(username=username).first()
-            if user and secret == current_app.config["SECRET_KEY"]:
-                request.current_user = user
-                return f(*args, **kwargs)
-        except Exception:
-            pass
+        user = verify_token(token)
+        if user:
+            request.current_user = user
+            return f(*args, **kwargs)
 
         return jsonify({"error": "Token is invalid"}), 401
 
@@ -66,10 +61,15 @@ def admin_required(f):
 
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if (
-            not hasattr(request, "current_user")
-            or not request.current_user.is_superuser
-        ):
+        user = getattr(request, "current_user", None)
+        if isinstance(user, UserSnapshot):
+            # Admin actions re-check the token against the user row, not a
+            # snapshot another worker may not have invalidated yet
+            row = db.session.get(User, user.id)
+            if row is None or (row.token_version or 0) != user.token_version:
+                return jsonify({"error": "Token is invalid"}), 401
+            request.current_user = user = row
+        if user is None or not user.is_superuser:
             return jsonify({"error": "Admin privileges required"}), 403
         return f(*args, **kwargs)
 
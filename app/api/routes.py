@@ -1,10 +1,16 @@
 import base64
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 
-from app import db
+from app import db, view_counter
 from app.api.auth import admin_required, token_required
-from app.models import Paste, User
+from app.api.tokens import generate_token, verify_token
+from app.conditional import add_validators, not_modified, raw_response
+from app.lookups import get_paste_or_404
+from app.models import Paste, User, insert_paste
+from app.pagination import InvalidCursor, next_cursor, paginate_pastes
+from app.search import format_snippet, paste_snippet, search_pastes
+from app.uploads import InvalidUpload, UploadTooLarge, receive_upload
 
 api_bp = Blueprint("api", __name__)
 
@@ -15,12 +21,24 @@ def api_not_found(error):
     return jsonify({"error": "Not found"}), 404
 
 
+@api_bp.errorhandler(401)
+def api_unauthorized(error):
+    """Return JSON for 401 errors in API routes"""
+    return jsonify({"error": "Token is invalid"}), 401
+
+
 @api_bp.errorhandler(403)
 def api_forbidden(error):
     """Return JSON for 403 errors in API routes"""
     return jsonify({"error": "Forbidden"}), 403
 
 
+@api_bp.errorhandler(InvalidCursor)
+def api_invalid_cursor(error):
+    """Return JSON for malformed pagination cursors"""
+    return jsonify({"error": "Invalid cursor"}), 400
+
+
 # Auth endpoints
 @api_bp.route("/auth/login", methods=["POST"])
 def api_login():
@@ -31,10 +49,8 @@ def api_login():
 
     user = User.query.filter_by(username=data["username"]).first()
     if user and user.check_password(data["password"]):
-        # Generate simple token (in production, use proper JWT)
-        token = base64.b64encode(
-            f"{user.username}:{request.app.config['SECRET_KEY']}".encode()
-        ).decode()
+        # Signed, expiring token verifiable without a database lookup
+        token = generate_token(user)
         return jsonify({"token": token, "user": user.to_dict()})
 
     return jsonify({"error": "Invalid credentials"}), 401
@@ -76,32 +92,54 @@ def get_pastes():
     page = request.args.get("page", 1, type=int)
     per_page = min(request.args.get("per_page", 20, type=int), 100)
     language = request.args.get("language")
-    search = request.args.get("search")
+    search = (request.args.get("search") or "").strip()
 
-    query = Paste.query.filter_by(is_public=True)
+    # Authors are eager-loaded so serializing a page never lazy-loads users
+    query = Paste.query.options(db.joinedload(Paste.author)).filter_by(is_public=True)
 
     # Filter by language if specified
     if language:
         query = query.filter_by(language=language)
 
-    # Search in title and content if specified
+    # Ranked full-text search in title and content if specified
     if search:
-        query = query.filter(
-            db.or_(Paste.title.contains(search), Paste.content.contains(search))
+        if "after" in request.args:
+            return (
+                jsonify({"error": "Cursor pagination is not supported for search"}),
+                400,
+            )
+        results = search_pastes(query, search).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        pastes = []
+        for paste in results.items:
+            data = paste.to_dict(include_content=False)
+            data["snippet"] = format_snippet(paste_snippet(paste, search))
+            pastes.append(data)
+        return jsonify(
+            {
+                "pastes": pastes,
+                "pagination": {
+                    "total": results.total,
+                    "pages": results.pages,
+                    "page": results.page,
+                    "per_page": per_page,
+                    "next_cursor": None,
+                },
+            }
         )
 
-    pastes = query.order_by(Paste.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    pastes = paginate_pastes(query, page, per_page, request.args.get("after"))
 
     return jsonify(
         {
-            "pastes": [paste.to_dict() for paste in pastes.items],
+            "pastes": [paste.to_dict(include_content=False) for paste in pastes.items],
             "pagination": {
                 "total": pastes.total,
                 "pages": pastes.pages,
-                "page": page,
+                "page": pastes.page,
                 "per_page": per_page,
+                "next_cursor": next_cursor(pastes),
             },
         }
     )
@@ -111,6 +149,12 @@ def get_pastes():
 @token_required
 def create_paste():
     """Create a new paste"""
+    max_size = current_app.config["MAX_PASTE_SIZE"]
+    if max_size and (request.content_length or 0) > max_size:
+        return _too_large(max_size)
+    if request.mimetype == "text/plain":
+        return create_paste_from_stream(max_size)
+
     data = request.get_json()
     if not data or not data.get("content"):
         return jsonify({"error": "Content is required"}), 400
@@ -122,12 +166,58 @@ def create_paste():
         is_public=data.get("is_public", True),
         user_id=request.current_user.id,
     )
+    paste.prerender()
+    return _created(paste)
+
+
+def create_paste_from_stream(max_size):
+    """Create a paste from a raw text/plain body read in chunks.
+
+    Metadata comes from the query string (title, language, is_public). The
+    body is hashed, measured and compressed into storage as it arrives, so
+    large uploads never sit in worker memory.
+    """
+    try:
+        upload = receive_upload(request.stream, max_size)
+    except UploadTooLarge:
+        return _too_large(max_size)
+    except InvalidUpload:
+        return jsonify({"error": "Content must be UTF-8 text"}), 400
+    if not upload.size:
+        return jsonify({"error": "Content is required"}), 400
+
+    paste = Paste(
+        title=request.args.get("title", "Untitled"),
+        language=request.args.get("language", "text"),
+        is_public=request.args.get("is_public", "true").lower()
+        not in ("0", "false", "no"),
+        user_id=request.current_user.id,
+    )
+    paste.attach_upload(upload)
+    # Windowed pastes render from the upload's head; other bodies in
+    # external storage are rendered on first view instead
+    if upload.location is None or paste.windowed:
+        paste.prerender()
+    # The body is not echoed back, so it is never loaded here
+    return _created(paste, include_content=False)
+
 
-    db.session.add(paste)
+def _too_large(max_size):
+    return (
+        jsonify({"error": f"Paste exceeds the maximum size of {max_size} bytes"}),
+        413,
+    )
+
+
+def _created(paste, include_content=True):
+    insert_paste(paste)
     db.session.commit()
 
     # Return response with URL as expected by tests
-    response = paste.to_dict()
+    response = paste.to_dict(
+        include_content=include_content,
+        authors={request.current_user.id: request.current_user.username},
+    )
     response["url"] = f"/paste/{paste.unique_id}"
     response["id"] = paste.unique_id  # Tests expect 'id' to be the unique_id
 
@@ -137,7 +227,7 @@ def create_paste():
 @api_bp.route("/pastes/<unique_id>", methods=["GET"])
 def get_paste(unique_id):
     """Get a specific paste"""
-    paste = Paste.query.filter_by(unique_id=unique_id).first_or_404()
+    paste = get_paste_or_404(unique_id, db.joinedload(Paste.blob))
 
     # Check if user can view this paste
     if not paste.is_public:
@@ -158,6 +248,8 @@ def get_paste(unique_id):
                         current_user = user
                 except Exception:
                     pass
+            elif auth_header.startswith("Bearer "):
+                current_user = verify_token(auth_header.split(" ", 1)[1])
 
         if not current_user or (
             current_user.id != paste.user_id and not current_user.is_superuser
@@ -167,14 +259,19 @@ def get_paste(unique_id):
                 404,
             )  # Return 404 for private pastes
 
+    # The body carries the view count, so it is revalidated on every use;
+    # a revalidation still counts as a view
+    cached = not_modified(paste, "json", public=False)
     paste.increment_views()
-    return jsonify(paste.to_dict())
+    if cached is not None:
+        return cached
+    return add_validators(jsonify(paste.to_dict()), paste, "json", public=False)
 
 
 @api_bp.route("/pastes/<unique_id>/raw", methods=["GET"])
 def get_paste_raw(unique_id):
     """Get raw content of a paste"""
-    paste = Paste.query.filter_by(unique_id=unique_id).first_or_404()
+    paste = get_paste_or_404(unique_id, db.joinedload(Paste.blob))
 
     # Check if user can view this paste
     if not paste.is_public:
@@ -184,7 +281,7 @@ def get_paste_raw(unique_id):
         ):
             return jsonify({"error": "This paste is private"}), 403
 
-    return paste.content, 200, {"Content-Type": "text/plain; charset=utf-8"}
+    return raw_response(paste)
 
 
 @api_bp.route("/pastes/<unique_id>", methods=["PUT"])
@@ -214,6 +311,7 @@ def update_paste(unique_id):
     if "is_public" in data:
         paste.is_public = data["is_public"]
 
+    paste.prerender()
     db.session.commit()
     return jsonify(paste.to_dict())
 
@@ -231,6 +329,7 @@ def delete_paste(unique_id):
     ):
         return jsonify({"error": "You can only delete your own pastes"}), 403
 
+    view_counter.discard(paste.id)
     db.session.delete(paste)
     db.session.commit()
     return jsonify({"message": "Paste deleted successfully"})
@@ -251,17 +350,22 @@ def get_user_pastes():
     page = request.args.get("page", 1, type=int)
     per_page = min(request.args.get("per_page", 20, type=int), 100)
 
-    pastes = request.current_user.pastes.order_by(Paste.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    pastes = paginate_pastes(
+        request.current_user.pastes, page, per_page, request.args.get("after")
     )
+    authors = {request.current_user.id: request.current_user.username}
 
     return jsonify(
         {
-            "pastes": [paste.to_dict() for paste in pastes.items],
+            "pastes": [
+                paste.to_dict(include_content=False, authors=authors)
+                for paste in pastes.items
+            ],
             "total": pastes.total,
             "pages": pastes.pages,
-            "current_page": page,
+            "current_page": pastes.page,
             "per_page": per_page,
+            "next_cursor": next_cursor(pastes),
         }
     )
 
@@ -312,7 +416,7 @@ def get_user_profile(username):
         {
             "username": user.username,
             "created_at": user.created_at.isoformat(),
-            "paste_count": user.pastes.count(),
+            "paste_count": user.paste_count,
         }
     )
 
@@ -324,11 +428,13 @@ def get_user_public_pastes(username):
     page = request.args.get("page", 1, type=int)
     per_page = min(request.args.get("per_page", 20, type=int), 100)
 
-    pastes = (
-        user.pastes.filter_by(is_public=True)
-        .order_by(Paste.created_at.desc())
-        .paginate(page=page, per_page=per_page, error_out=False)
+    pastes = paginate_pastes(
+        user.pastes.filter_by(is_public=True),
+        page,
+        per_page,
+        request.args.get("after"),
     )
+    authors = {user.id: user.username}
 
     return jsonify(
         {
@@ -336,10 +442,14 @@ def get_user_public_pastes(username):
                 "username": user.username,
                 "created_at": user.created_at.isoformat(),
             },
-            "pastes": [paste.to_dict() for paste in pastes.items],
+            "pastes": [
+                paste.to_dict(include_content=False, authors=authors)
+                for paste in pastes.items
+            ],
             "total": pastes.total,
             "pages": pastes.pages,
-            "current_page": page,
+            "current_page": pastes.page,
             "per_page": per_page,
+            "next_cursor": next_cursor(pastes),
         }
     )
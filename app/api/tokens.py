@@ -0,0 +1,38 @@
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from app.auth.sessions import user_cache
+
+TOKEN_SALT = "api-token"
+
+
+def _serializer():
+    # Not SECRET_KEY: tokens issued before signing exposed it to their holders
+    return URLSafeTimedSerializer(current_app.config["API_TOKEN_KEY"], salt=TOKEN_SALT)
+
+
+def generate_token(user):
+    """Issue a signed API token carrying the user's id and token version"""
+    return _serializer().dumps({"uid": user.id, "tv": user.token_version or 0})
+
+
+def verify_token(token):
+    """Verify a signed token, returning a snapshot of its user or None.
+
+    The signature is checked in memory and the token version against the
+    cached user snapshot, so a password change or a deleted account revokes
+    the token without a user query per request. The username and superuser
+    flag come from the snapshot, never from the token.
+    """
+    try:
+        payload = _serializer().loads(
+            token, max_age=current_app.config["API_TOKEN_MAX_AGE"]
+        )
+        user_id = int(payload["uid"])
+        version = int(payload["tv"])
+    except (BadSignature, KeyError, TypeError, ValueError):
+        return None
+    user = user_cache.load(user_id)
+    if user is None or user.token_version != version:
+        return None
+    return user
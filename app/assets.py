@@ -0,0 +1,83 @@
+import hashlib
+import os
+
+from flask import abort, make_response, request, url_for
+from pygments.formatters import HtmlFormatter
+
+from app.highlighting import HIGHLIGHT_OPTIONS, PREVIEW_OPTIONS
+
+# Far-future lifetime of fingerprinted assets; a new build gets a new URL
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Hex digits of the content hash kept in asset file names
+FINGERPRINT_LENGTH = 12
+
+
+def theme_css(theme):
+    """Pygments colours of a theme for full views and list previews"""
+    formatter = HtmlFormatter(style=theme)
+    rules = []
+    for options in (HIGHLIGHT_OPTIONS, PREVIEW_OPTIONS):
+        selector = f".{options['cssclass']}"
+        # Line number rules are left out: they include an unscoped
+        # "pre" rule, and app.css styles line numbers itself
+        rules += formatter.get_background_style_defs(selector)
+        rules += formatter.get_token_style_defs(selector)
+    return "\n".join(rules) + "\n"
+
+
+class Stylesheets:
+    """Site stylesheets built once at startup and served fingerprinted.
+
+    Each configured highlight theme gets one bundle: the theme's Pygments
+    rules followed by static/css/app.css. HIGHLIGHT_THEME is the theme pages
+    link by default; HIGHLIGHT_THEMES lists further themes to build bundles
+    for. Bundles are named after a hash of their content, so they can be
+    cached for a year and a new theme or stylesheet change simply produces
+    a new URL.
+    """
+
+    def __init__(self):
+        self.theme = None
+        self._bundles = {}
+        self._names = {}
+
+    def init_app(self, app):
+        self.theme = app.config.get("HIGHLIGHT_THEME", "tango")
+        themes = list(app.config.get("HIGHLIGHT_THEMES") or [])
+        if self.theme not in themes:
+            themes.insert(0, self.theme)
+
+        with open(os.path.join(app.static_folder, "css", "app.css"), "rb") as f:
+            site_css = f.read()
+        self._bundles = {}
+        self._names = {}
+        for theme in themes:
+            css = theme_css(theme).encode("utf-8") + site_css
+            digest = hashlib.sha256(css).hexdigest()[:FINGERPRINT_LENGTH]
+            name = f"site-{theme}.{digest}.css"
+            self._bundles[name] = (css, digest)
+            self._names[theme] = name
+
+        app.add_url_rule("/assets/<name>", "stylesheet", self.serve)
+        app.add_template_global(self.url, "stylesheet_url")
+
+    def url(self, theme=None):
+        """URL of the bundle for a theme (default: HIGHLIGHT_THEME)"""
+        return url_for("stylesheet", name=self._names[theme or self.theme])
+
+    def serve(self, name):
+        bundle = self._bundles.get(name)
+        if bundle is None:
+            abort(404)
+        css, digest = bundle
+        response = make_response(css)
+        response.mimetype = "text/css"
+        response.set_etag(digest)
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+        return response.make_conditional(request)
+
+
+stylesheets = Stylesheets()
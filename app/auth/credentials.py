@@ -0,0 +1,47 @@
+import hashlib
+import hmac
+import secrets
+
+from app.caching import TTLCache
+
+
+class CredentialCache:
+    """Short-lived cache of successful password verifications.
+
+    bcrypt is deliberately slow, so repeated Basic-auth requests from scripts
+    would otherwise pay for a full hash check every time. Entries are HMACs
+    over the user id, stored password hash and supplied password under a
+    per-process secret; plain passwords are never kept. Including the stored
+    hash means a password change can never match an old entry, even in
+    another worker.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self._secret = secrets.token_bytes(32)
+        self._entries = TTLCache(maxsize, ttl)
+
+    def init_app(self, app):
+        self._entries.maxsize = app.config.get("CREDENTIAL_CACHE_SIZE", 1024)
+        self._entries.ttl = app.config.get("CREDENTIAL_CACHE_TTL", 300)
+
+    def _digest(self, user, password):
+        message = f"{user.id}:{user.password_hash}:{password}".encode("utf-8")
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def is_verified(self, user, password):
+        """Return True if this password was recently verified for the user"""
+        if not self._entries.ttl or user.id is None:
+            return False
+        return self._entries.get(self._digest(user, password)) == user.id
+
+    def remember(self, user, password):
+        """Record a successful verification"""
+        if self._entries.ttl and user.id is not None:
+            self._entries.set(self._digest(user, password), user.id)
+
+    def invalidate(self, user_id):
+        """Forget every verification for a user"""
+        self._entries.delete_where(lambda cached_id: cached_id == user_id)
+
+
+credential_cache = CredentialCache()
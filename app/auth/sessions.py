@@ -0,0 +1,82 @@
+from flask_login import UserMixin
+
+from app.caching import cache
+
+
+class UserSnapshot(UserMixin):
+    """Lightweight stand-in for the logged-in user.
+
+    Carries the id, username, superuser flag and API token version, which is
+    all page views, templates and token checks need to identify the user.
+    Any other attribute loads the full User row on first access.
+    """
+
+    def __init__(self, user_id, username, is_superuser, token_version=0):
+        self.id = user_id
+        self.username = username
+        self.is_superuser = is_superuser
+        self.token_version = token_version
+        self._user = None
+
+    def _load(self):
+        if self._user is None:
+            from app import db
+            from app.models import User
+
+            self._user = db.session.get(User, self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        return f"<UserSnapshot {self.username}>"
+
+
+class UserCache:
+    """Bounded TTL cache of user snapshots behind Flask-Login's user_loader.
+
+    Session-authenticated page views would otherwise query the user table on
+    every request just to identify the visitor, and API tokens are checked
+    against the cached token version. Entries are dropped when the user row
+    is updated or deleted. With a shared cache backend that reaches every
+    worker at once; with the in-process backend the TTL bounds how long
+    other workers can serve a stale snapshot.
+    """
+
+    def __init__(self):
+        self._entries = None
+
+    def init_app(self, app):
+        self._entries = cache.namespace(
+            "user",
+            app.config.get("USER_CACHE_SIZE", 1024),
+            app.config.get("USER_CACHE_TTL", 60),
+        )
+
+    def load(self, user_id):
+        """Return a snapshot for the user id, or None if the user is gone"""
+        from app import db
+        from app.models import User
+
+        entry = self._entries.get(user_id) if self._entries.ttl else None
+        if entry is None:
+            row = db.session.execute(
+                db.select(User.username, User.is_superuser, User.token_version).where(
+                    User.id == user_id
+                )
+            ).first()
+            if row is None:
+                return None
+            entry = (row.username, bool(row.is_superuser), row.token_version or 0)
+            if self._entries.ttl:
+                self._entries.set(user_id, entry)
+        return UserSnapshot(user_id, *entry)
+
+    def invalidate(self, user_id):
+        self._entries.delete(user_id)
+
+
+user_cache = UserCache()
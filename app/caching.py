@@ -0,0 +1,256 @@
+import math
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded, thread-safe LRU mapping whose entries expire after a TTL"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Remove every entry whose value matches the predicate"""
+        with self._lock:
+            stale = [key for key, (value, _) in self._data.items() if predicate(value)]
+            for key in stale:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+class SQLiteCache:
+    """Cache kept in an SQLite file, shared by every worker on the host.
+
+    Each process opens its own connection per thread; WAL mode lets readers
+    proceed while another worker writes. Values are pickled. When the table
+    grows past maxsize the oldest writes are evicted.
+    """
+
+    name = "filesystem"
+
+    # Size is checked once per this many writes
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path, maxsize=10000):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+
+    @classmethod
+    def from_app(cls, app):
+        path = os.path.join(
+            app.instance_path, app.config.get("CACHE_PATH", "cache.sqlite3")
+        )
+        return cls(path, app.config.get("CACHE_SIZE", 10000))
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key, default=None):
+        row = (
+            self._connect()
+            .execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at),
+            )
+        self._writes += 1
+        if self._writes % self.PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def delete(self, key):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix):
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM cache WHERE key LIKE ? ESCAPE '\\'", (pattern + "%",)
+            )
+
+    def prune(self):
+        """Drop expired entries and the oldest ones beyond maxsize"""
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM cache WHERE expires_at <= ?", (time.time(),)
+            )
+            connection.execute(
+                "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache "
+                "ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+
+class RedisCache:
+    """Cache in a Redis (or Redis-protocol) server shared by every worker.
+
+    Takes any client with redis-py's get/set/delete/scan_iter methods, so a
+    local stand-in can replace the server. Values are pickled.
+    """
+
+    name = "redis"
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_app(cls, app):
+        try:
+            import redis
+        except ImportError as error:
+            raise RuntimeError(
+                "CACHE_BACKEND=redis needs the redis package (pip install redis)"
+            ) from error
+        return cls(redis.Redis.from_url(app.config["CACHE_URL"]))
+
+    def get(self, key, default=None):
+        value = self.client.get(key)
+        return default if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.client.set(key, data, ex=math.ceil(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def delete_prefix(self, prefix):
+        pattern = re.sub(r"([*?\[\]\\])", r"\\\1", prefix) + "*"
+        keys = list(self.client.scan_iter(match=pattern))
+        if keys:
+            self.client.delete(*keys)
+
+
+class CacheNamespace:
+    """One consumer's view of a shared backend, with its own key prefix and TTL.
+
+    Offers the TTLCache methods the consumers use, so they work unchanged
+    whether their entries live in process or in a shared store.
+    """
+
+    def __init__(self, backend, prefix, ttl):
+        self.backend = backend
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        return self.backend.get(f"{self.prefix}{key}", default)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(f"{self.prefix}{key}", value, self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        self.backend.delete(f"{self.prefix}{key}")
+
+    def clear(self):
+        self.backend.delete_prefix(self.prefix)
+
+
+SHARED_BACKENDS = {SQLiteCache.name: SQLiteCache, RedisCache.name: RedisCache}
+
+
+class Cache:
+    """Selects where the app's read-path caches keep their entries.
+
+    With CACHE_BACKEND = "memory" every namespace is a bounded in-process
+    LRU, duplicated per worker and empty after a restart. "filesystem"
+    shares an SQLite file across the workers on one host and "redis" a
+    Redis server across hosts, so entries are computed once and survive
+    restarts, and an invalidation in one worker applies to all of them.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.key_prefix = "pastebin:"
+
+    def init_app(self, app):
+        name = app.config.get("CACHE_BACKEND", "memory")
+        if name == "memory":
+            self.backend = None
+        elif name in SHARED_BACKENDS:
+            self.backend = SHARED_BACKENDS[name].from_app(app)
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND {name!r}")
+        self.key_prefix = app.config.get("CACHE_KEY_PREFIX", "pastebin:")
+
+    def namespace(self, name, maxsize, ttl):
+        """Return the store for one kind of entry.
+
+        maxsize only bounds in-process namespaces; shared backends are
+        bounded as a whole.
+        """
+        if self.backend is None:
+            return TTLCache(maxsize, ttl)
+        return CacheNamespace(self.backend, f"{self.key_prefix}{name}:", ttl)
+
+
+cache = Cache()
@@ -0,0 +1,115 @@
+import click
+
+from app import db
+
+
+def register_commands(app):
+    """Register maintenance commands on the Flask CLI"""
+
+    @app.cli.command("backfill-renders")
+    @click.option("--batch-size", default=500, help="Pastes rendered per commit.")
+    @click.option(
+        "--force", is_flag=True, help="Re-render pastes that are already current."
+    )
+    def backfill_renders(batch_size, force):
+        """Pre-render highlights and list previews for existing pastes."""
+        from app.models import Paste
+
+        rendered = 0
+        last_id = 0
+        while True:
+            batch = (
+                Paste.query.filter(Paste.id > last_id)
+                .order_by(Paste.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not batch:
+                break
+            for paste in batch:
+                if force:
+                    paste.highlight_key = None
+                # Queue the whole batch first so every highlight worker is busy
+                paste.submit_render()
+            for paste in batch:
+                if paste.prerender(budget=False):
+                    rendered += 1
+                if db.session.is_modified(paste):
+                    paste.keep_updated_at()
+            db.session.commit()
+            last_id = batch[-1].id
+
+        click.echo(f"Rendered {rendered} paste(s).")
+
+    @app.cli.command("reindex-search")
+    @click.option("--batch-size", default=500, help="Pastes indexed per commit.")
+    def reindex_search(batch_size):
+        """Rebuild the full-text search index from the paste table."""
+        from app.models import Paste
+        from app.search import create_search_index, drop_search_index, index_paste
+
+        # Start from empty tables: this also creates them for databases made
+        # before search existed, upgrades older layouts and drops entries
+        # left behind by deleted blobs
+        drop_search_index(Paste.__table__, db.session.connection())
+        create_search_index(Paste.__table__, db.session.connection())
+
+        indexed = 0
+        last_id = 0
+        while True:
+            batch = (
+                Paste.query.options(db.joinedload(Paste.blob))
+                .filter(Paste.id > last_id)
+                .order_by(Paste.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not batch:
+                break
+            connection = db.session.connection()
+            for paste in batch:
+                index_paste(connection, paste)
+                indexed += 1
+            db.session.commit()
+            last_id = batch[-1].id
+
+        click.echo(f"Indexed {indexed} paste(s).")
+
+    @app.cli.command("reconcile-paste-counts")
+    def reconcile_paste_counts_command():
+        """Recompute the denormalized paste_count of every user."""
+        from app.models import reconcile_paste_counts
+
+        fixed = reconcile_paste_counts()
+        click.echo(f"Corrected {fixed} user(s).")
+
+    @app.cli.command("prune-blob-files")
+    @click.option(
+        "--min-age",
+        default=24 * 3600,
+        help="Seconds a file must be untouched before it can be pruned.",
+    )
+    def prune_blob_files(min_age):
+        """Delete externally stored blobs no paste references any more."""
+        from app.models import ContentBlob
+        from app.storage import blob_store
+
+        backend = blob_store.backend
+        if backend is None:
+            click.echo("No external blob storage configured.")
+            return
+        # Blobs are released inside the paste transaction, but files are only
+        # removed here so a rolled-back delete can never lose a body. Files
+        # are written before their row is committed, so recent ones may
+        # belong to an upload still in progress and are left alone
+        referenced = set(
+            db.session.scalars(
+                db.select(ContentBlob.hash).where(ContentBlob.location == backend.name)
+            )
+        )
+        pruned = 0
+        for digest in list(backend.digests()):
+            if digest not in referenced and backend.age(digest) >= min_age:
+                backend.delete(digest)
+                pruned += 1
+        click.echo(f"Pruned {pruned} blob file(s).")
@@ -0,0 +1,187 @@
+import gzip
+import io
+import struct
+import zlib
+
+from app.highlighting import WINDOW_LINES, WINDOW_MAX_SIZE
+
+# Encoding of stored paste bodies, sent as-is in Content-Encoding
+CONTENT_ENCODING = "gzip"
+COMPRESS_LEVEL = 6
+
+# Bodies are stored as a single gzip member whose deflate stream is fully
+# flushed after every block of uncompressed bytes. A full flush resets the
+# compressor's history and aligns the output to a byte, so any byte range
+# can be read by inflating only the blocks it covers, starting at their
+# recorded offsets, while the whole body stays one gzip member that every
+# client can decode.
+BLOCK_SIZE = 64 * 1024
+
+# The seek index records where every LINE_INDEX_STEP-th line starts
+LINE_INDEX_STEP = 1000
+
+# gzip member header with no name and mtime 0, so output is deterministic
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+class WindowPlanner:
+    """Splits a body into render windows as its bytes stream past.
+
+    A window holds up to WINDOW_LINES lines and WINDOW_MAX_SIZE bytes and
+    ends after the last whole line that fits. A line longer than
+    WINDOW_MAX_SIZE is split, and the next window continues it. starts
+    lists the (byte offset, first line) of every window.
+    """
+
+    def __init__(self, lines=None, size=None):
+        self.lines = lines or WINDOW_LINES
+        self.size = size or WINDOW_MAX_SIZE
+        self.starts = [(0, 1)]
+        self._newlines = 0
+        self._window_lines = 0
+        self._last_break = 0
+
+    def feed(self, data, offset):
+        """Scan data, the body bytes starting at offset"""
+        end = offset + len(data)
+        position = 0
+        while True:
+            start = self.starts[-1][0]
+            limit = start + self.size
+            newline = data.find(b"\n", position)
+            if newline != -1 and offset + newline < limit:
+                position = newline + 1
+                self._newlines += 1
+                self._window_lines += 1
+                self._last_break = offset + position
+                if self._window_lines == self.lines:
+                    self._open(self._last_break)
+            elif limit < end:
+                if self._last_break > start:
+                    cut = self._last_break
+                else:
+                    # One line fills the window; split it between characters
+                    cut = limit
+                    while cut < end and data[cut - offset] & 0xC0 == 0x80:
+                        cut += 1
+                self._open(cut)
+                position = max(position, cut - offset)
+            else:
+                return
+
+    def _open(self, offset):
+        self.starts.append((offset, self._newlines + 1))
+        self._window_lines = 0
+        self._last_break = offset
+
+    def close(self, size):
+        """Return the window starts of a body of size bytes"""
+        if len(self.starts) > 1 and self.starts[-1][0] >= size:
+            self.starts.pop()
+        return [list(start) for start in self.starts]
+
+
+class BlockCompressor:
+    """Compresses a byte stream into flushed gzip blocks and builds its seek index.
+
+    The index maps uncompressed block numbers to compressed offsets and
+    line numbers (counted on "\\n") to uncompressed byte offsets, so slices
+    of large bodies cost O(slice) rather than O(body). It also records where
+    every render window starts (see WindowPlanner).
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.size = 0
+        self._pending = bytearray()
+        self._deflate = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._crc = 0
+        self._written = len(GZIP_HEADER)
+        self._blocks = []
+        self._newlines = 0
+        self._line_offsets = [0]
+        self._windows = WindowPlanner()
+        output.write(GZIP_HEADER)
+
+    def write(self, data):
+        start = 0
+        while (position := data.find(b"\n", start)) != -1:
+            self._newlines += 1
+            if self._newlines % LINE_INDEX_STEP == 0:
+                self._line_offsets.append(self.size + position + 1)
+            start = position + 1
+        self._windows.feed(data, self.size)
+        self.size += len(data)
+        self._crc = zlib.crc32(data, self._crc)
+        self._pending += data
+        while len(self._pending) >= BLOCK_SIZE:
+            self._write_block(self._pending[:BLOCK_SIZE], zlib.Z_FULL_FLUSH)
+            del self._pending[:BLOCK_SIZE]
+
+    def _write_block(self, block, mode):
+        self._blocks.append(self._written)
+        self._emit(self._deflate.compress(bytes(block)) + self._deflate.flush(mode))
+
+    def _emit(self, data):
+        self.output.write(data)
+        self._written += len(data)
+
+    def close(self):
+        """Finish the gzip member and return the seek index"""
+        if self._pending or not self._blocks:
+            self._write_block(self._pending, zlib.Z_FINISH)
+            self._pending = bytearray()
+        else:
+            # The last block was already flushed; end the deflate stream
+            self._emit(self._deflate.flush(zlib.Z_FINISH))
+        self._emit(struct.pack("<II", self._crc, self.size & 0xFFFFFFFF))
+        return {
+            "block_size": BLOCK_SIZE,
+            "blocks": self._blocks,
+            "line_step": LINE_INDEX_STEP,
+            "lines": self._line_offsets,
+            "newlines": self._newlines,
+            "windows": {
+                "lines": self._windows.lines,
+                "size": self._windows.size,
+                "starts": self._windows.close(self.size),
+            },
+        }
+
+
+def decompress_block(data):
+    """Decompress the stored bytes of one block, read from its offset"""
+    # Raw deflate from a flush point; a trailer after the last block is left
+    # unused
+    return zlib.decompressobj(-zlib.MAX_WBITS).decompress(data)
+
+
+def decompress_head(data, length):
+    """First length characters of a body, from a prefix of its stored bytes"""
+    # At most four bytes per character are inflated, however well the
+    # prefix compressed
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    head = inflater.decompress(data[len(GZIP_HEADER) :], length * 4)
+    return head.decode("utf-8", errors="ignore")[:length]
+
+
+def compress_text(text):
+    """Compress text for storage, returning the bytes and their seek index.
+
+    Output is deterministic, so equal text always gives equal bytes.
+    """
+    output = io.BytesIO()
+    compressor = BlockCompressor(output)
+    compressor.write(text.encode("utf-8"))
+    index = compressor.close()
+    return output.getvalue(), index
+
+
+def decompress_text(data):
+    """Inverse of compress_text"""
+    return gzip.decompress(data).decode("utf-8")
+
+
+def accepts_stored_encoding(request):
+    """True if the client will take the stored compressed bytes directly"""
+    return request.accept_encodings[CONTENT_ENCODING] > 0
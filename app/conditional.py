@@ -0,0 +1,179 @@
+from flask import current_app, make_response, request, send_file
+from werkzeug.http import is_resource_modified
+
+from app.compression import CONTENT_ENCODING, accepts_stored_encoding
+from app.highlighting import content_hash
+from app.slicing import (
+    InvalidLineRange,
+    iter_bytes,
+    iter_lines,
+    resolve_line_range,
+    total_lines,
+    validate_line_range,
+)
+from app.storage import blob_store, iter_decompressed
+
+
+def paste_etag(paste, variant=None):
+    """Strong validator for a paste representation.
+
+    Built from the stored content hash and updated_at, so it changes with any
+    edit but not with view counts. Representations that differ per viewer
+    (rendered pages) pass a variant so they never share an ETag.
+    """
+    digest = paste.content_hash or content_hash(paste.content)
+    stamp = paste.updated_at.strftime("%Y%m%d%H%M%S%f") if paste.updated_at else "0"
+    parts = [digest[:32], stamp]
+    if variant:
+        parts.append(str(variant))
+    return "-".join(parts)
+
+
+def not_modified(paste, variant=None, public=True):
+    """Return a 304 response if the client's cached copy is still current.
+
+    Called before the body is loaded or rendered, so revalidations cost one
+    indexed lookup. Returns None when the full response must be sent.
+    """
+    etag = paste_etag(paste, variant)
+    if is_resource_modified(request.environ, etag=etag, last_modified=paste.updated_at):
+        return None
+    response = make_response("", 304)
+    return add_validators(response, paste, variant, public)
+
+
+def add_validators(response, paste, variant=None, public=True):
+    """Attach ETag, Last-Modified and Cache-Control to a paste response"""
+    response = make_response(response)
+    response.set_etag(paste_etag(paste, variant))
+    if paste.updated_at:
+        response.last_modified = paste.updated_at
+    if public and paste.is_public:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get(
+            "PASTE_CACHE_MAX_AGE", 300
+        )
+    else:
+        # Private or per-viewer responses stay out of shared caches and are
+        # revalidated on every use
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+
+def no_store(response):
+    """Mark a stand-in response, such as a render fallback, as uncacheable.
+
+    It carries no validators, so no client can revalidate the stand-in
+    against the finished render later.
+    """
+    response = make_response(response)
+    response.cache_control.no_store = True
+    return response
+
+
+def raw_response(paste):
+    """Serve a paste body as text/plain with validators.
+
+    Clients that accept the storage encoding get the stored compressed bytes
+    as-is; only the others pay for decompression. Bodies in external blob
+    storage are streamed from there, so they are never held in memory.
+    """
+    lines = request.args.get("lines")
+    if lines is not None:
+        return _lines_response(paste, lines)
+
+    # Load the row first: Range and If-Range must be judged against the
+    # body that is served, not a snapshot cached before an edit
+    blob = paste.blob
+    byte_range = _requested_range(paste)
+    encoded = byte_range is None and accepts_stored_encoding(request)
+    variant = CONTENT_ENCODING if encoded else None
+    response = not_modified(paste, variant)
+    if response is None and byte_range is not None:
+        response = add_validators(_range_response(paste, byte_range), paste)
+    elif response is None:
+        if blob.location is not None:
+            response = _stream_blob(paste, blob, encoded)
+        elif encoded:
+            response = make_response(paste.compressed_content)
+        else:
+            response = make_response(paste.content)
+        if encoded:
+            response.content_encoding = CONTENT_ENCODING
+        response.content_type = "text/plain; charset=utf-8"
+        response = add_validators(response, paste, variant)
+    response.vary.add("Accept-Encoding")
+    response.accept_ranges = "bytes"
+    return response
+
+
+def _requested_range(paste):
+    """The single byte range to serve, or None to send the whole body"""
+    byte_range = request.range
+    if byte_range is None or byte_range.units != "bytes":
+        return None
+    if len(byte_range.ranges) != 1:
+        return None
+    if_range = request.if_range
+    if if_range.etag is not None and if_range.etag != paste_etag(paste):
+        return None
+    if if_range.date is not None and (
+        paste.updated_at is None
+        or if_range.date.replace(tzinfo=None) != paste.updated_at.replace(microsecond=0)
+    ):
+        return None
+    return byte_range
+
+
+def _range_response(paste, byte_range):
+    size = paste.size or 0
+    span = byte_range.range_for_length(size)
+    if span is None:
+        response = make_response("Requested range not satisfiable.", 416)
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return response
+    start, stop = span
+    response = current_app.response_class(
+        iter_bytes(paste, start, stop), status=206, mimetype="text/plain"
+    )
+    response.content_type = "text/plain; charset=utf-8"
+    response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+    response.content_length = stop - start
+    return response
+
+
+def _lines_response(paste, spec):
+    """Serve newline-delimited lines of the body, e.g. ?lines=100-200"""
+    try:
+        validate_line_range(spec)
+    except InvalidLineRange:
+        return make_response("Invalid line range.", 400)
+    variant = f"lines-{spec}"
+    response = not_modified(paste, variant)
+    if response is None:
+        count = total_lines(paste)
+        first, last = resolve_line_range(spec, count)
+        if first > last:
+            response = make_response("Requested lines not satisfiable.", 416)
+        else:
+            response = current_app.response_class(
+                iter_lines(paste, first, last), mimetype="text/plain"
+            )
+            response.content_type = "text/plain; charset=utf-8"
+            response = add_validators(response, paste, variant)
+        response.headers["X-Total-Lines"] = str(count)
+    return response
+
+
+def _stream_blob(paste, blob, encoded):
+    if encoded:
+        # A local path lets the server use sendfile / X-Sendfile
+        source = blob_store.local_path(blob) or blob_store.open(blob)
+        return send_file(source, mimetype="text/plain", conditional=False, etag=False)
+    response = current_app.response_class(
+        iter_decompressed(blob_store.open(blob)), mimetype="text/plain"
+    )
+    response.content_length = paste.size
+    return response
@@ -0,0 +1,118 @@
+import re
+
+from pygments.lexers import guess_lexer
+from pygments.util import ClassNotFound
+
+# Detection only ever looks at this many characters from each end of a paste,
+# so its cost does not grow with paste size.
+SAMPLE_SIZE = 4096
+MODELINE_LINES = 5
+
+SHEBANG_INTERPRETERS = {
+    "python": "python",
+    "python2": "python",
+    "python3": "python",
+    "sh": "bash",
+    "bash": "bash",
+    "zsh": "bash",
+    "ksh": "bash",
+    "dash": "bash",
+    "node": "javascript",
+    "nodejs": "javascript",
+    "deno": "typescript",
+    "ruby": "ruby",
+    "php": "php",
+    "perl": "perl",
+}
+
+MODELINE_PATTERNS = [
+    # vim: set ft=python :  /  vim: syntax=python
+    re.compile(r"\b(?:vim?|ex):.*?\b(?:ft|filetype|syntax)=([\w+-]+)"),
+    # -*- mode: python -*-  /  -*- python -*-
+    re.compile(r"-\*-\s*(?:.*?mode:\s*)?([\w+-]+)\s*(?:;.*?)?-\*-"),
+]
+
+FIRST_LINE_PREFIXES = [
+    ("<?php", "php"),
+    ("<?xml", "xml"),
+    ("<!doctype html", "html"),
+    ("<html", "html"),
+    ("diff --git", "diff"),
+    ("--- a/", "diff"),
+    ("%YAML", "yaml"),
+]
+
+# Dockerfiles open with "FROM <image> [AS <stage>]", written in upper case;
+# the case and shape keep Python's "from x import y" out
+DOCKERFILE_FROM = re.compile(
+    r"FROM\s+(?:--platform=\S+\s+)?[\w.\-/:@${}]+(?:\s+AS\s+[\w.-]+)?\s*$"
+)
+
+
+def _from_shebang(first_line):
+    if not first_line.startswith("#!"):
+        return None
+    parts = first_line[2:].strip().split()
+    if not parts:
+        return None
+    interpreter = parts[0].rsplit("/", 1)[-1]
+    if interpreter == "env" and len(parts) > 1:
+        interpreter = parts[1]
+    interpreter = re.sub(r"[\d.]+$", "", interpreter) or interpreter
+    return SHEBANG_INTERPRETERS.get(interpreter)
+
+
+def _from_modeline(lines):
+    for line in lines:
+        for pattern in MODELINE_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                return match.group(1).lower()
+    return None
+
+
+def _from_first_line(first_line, second_line):
+    stripped = first_line.lstrip()
+    for prefix, language in FIRST_LINE_PREFIXES:
+        if stripped.lower().startswith(prefix.lower()):
+            return language
+    if DOCKERFILE_FROM.match(stripped):
+        return "dockerfile"
+    if stripped.startswith("---"):
+        # Unified diffs without a git header open with "--- old" / "+++ new"
+        return "diff" if second_line.startswith("+++") else "yaml"
+    return None
+
+
+def detect_language(content):
+    """Detect the Pygments lexer name for content, looking only at a sample.
+
+    Cheap heuristics (shebang, editor modelines, well-known first lines) run
+    first; Pygments' guess_lexer is only consulted on the bounded head sample.
+    Returns "text" when nothing matches.
+    """
+    head = content[:SAMPLE_SIZE]
+    head_lines = head.lstrip("\ufeff").splitlines()
+    first_line = head_lines[0] if head_lines else ""
+
+    language = _from_shebang(first_line)
+    if language:
+        return language
+
+    tail_lines = []
+    if len(content) > SAMPLE_SIZE:
+        tail_lines = content[-SAMPLE_SIZE:].splitlines()[-MODELINE_LINES:]
+    language = _from_modeline(head_lines[:MODELINE_LINES] + tail_lines)
+    if language:
+        return language
+
+    second_line = head_lines[1] if len(head_lines) > 1 else ""
+    language = _from_first_line(first_line, second_line)
+    if language:
+        return language
+
+    try:
+        lexer = guess_lexer(head)
+    except ClassNotFound:
+        return "text"
+    return lexer.aliases[0] if lexer.aliases else "text"
@@ -0,0 +1,65 @@
+import uuid
+
+from flask import current_app
+
+from app.caching import cache
+
+
+def render_block(template_name, block, **context):
+    """Render one block of a template with the usual template context"""
+    template = current_app.jinja_env.get_template(template_name)
+    current_app.update_template_context(context)
+    return "".join(template.blocks[block](template.new_context(context)))
+
+
+class FragmentCache:
+    """Rendered page fragments shared by anonymous visitors.
+
+    Public listings change only when a public paste is created, edited,
+    made private or deleted, so their rendered HTML is reused until then.
+    Keys include a listings version; bumping it orphans every cached
+    fragment at once, and the orphans age out with the TTL, which also
+    bounds how stale view counts in a listing can be.
+
+    Fragments are only cached with a shared cache backend. With the memory
+    backend a version bump would only reach the worker that made the
+    change, and the others would keep serving their old listings.
+    """
+
+    def __init__(self):
+        self._entries = None
+
+    def init_app(self, app):
+        ttl = app.config.get("FRAGMENT_CACHE_TTL", 60)
+        self._entries = cache.namespace(
+            "fragment",
+            app.config.get("FRAGMENT_CACHE_SIZE", 256),
+            ttl if cache.backend is not None else 0,
+        )
+
+    def version(self):
+        version = self._entries.get("version")
+        if version is None:
+            version = self.invalidate()
+        return version
+
+    def invalidate(self):
+        """Start a new listings version; returns it"""
+        version = uuid.uuid4().hex
+        # The version itself never expires; only fragments do
+        self._entries.set("version", version, ttl=0)
+        return version
+
+    def get_or_render(self, key, render):
+        """Return the cached fragment for key, rendering it on a miss"""
+        if not self._entries.ttl:
+            return render()
+        key = f"{self.version()}:{key}"
+        html = self._entries.get(key)
+        if html is None:
+            html = render()
+            self._entries.set(key, html)
+        return html
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,160 @@
+import hashlib
+import json
+
+from markupsafe import escape
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
+
+from app.caching import TTLCache
+from app.detection import detect_language
+
+# Formatter options used for full paste views and list previews. They are part
+# of the highlight cache key, so changing them invalidates every stored render.
+HIGHLIGHT_OPTIONS = {"cssclass": "highlight", "linenos": True}
+PREVIEW_OPTIONS = {"cssclass": "highlight-preview", "nowrap": True}
+PREVIEW_LENGTH = 120
+# Characters of a paste a list preview is cut from
+PREVIEW_SOURCE_LENGTH = PREVIEW_LENGTH * 8
+
+# Pastes with more lines than WINDOWED_MIN_LINES or more bytes than
+# WINDOWED_MIN_SIZE are not rendered as one page; they are highlighted and
+# served in windows of at most WINDOW_LINES lines and WINDOW_MAX_SIZE bytes
+WINDOWED_MIN_LINES = 2000
+WINDOWED_MIN_SIZE = 512 * 1024
+WINDOW_LINES = 500
+WINDOW_MAX_SIZE = 256 * 1024
+
+# Characters shown by the plain-text stand-in while a render is pending
+FALLBACK_LENGTH = 64 * 1024
+
+
+def content_hash(content):
+    """Return the SHA-256 hex digest of paste content"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def highlight_cache_key(digest, language, options=None):
+    """Build the cache key for a rendering of content with the given digest"""
+    if options is None:
+        options = {
+            "highlight": HIGHLIGHT_OPTIONS,
+            "preview": PREVIEW_OPTIONS,
+            "preview_length": PREVIEW_LENGTH,
+        }
+    key = f"{digest}:{language}:{json.dumps(options, sort_keys=True)}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def window_cache_key(digest, language, number):
+    """Build the cache key for one window of a windowed render"""
+    options = {
+        "highlight": HIGHLIGHT_OPTIONS,
+        "window_lines": WINDOW_LINES,
+        "window_size": WINDOW_MAX_SIZE,
+    }
+    return f"{highlight_cache_key(digest, language, options)}:{number}"
+
+
+# Lexers and formatters are stateless between calls, so one instance per
+# (language, options) is built per process and shared by every render
+_lexers = TTLCache(maxsize=256, ttl=0)
+_formatters = TTLCache(maxsize=256, ttl=0)
+
+
+def get_lexer(language):
+    """Shared lexer for a language, or the plain-text lexer if it is unknown"""
+    lexer = _lexers.get(language)
+    if lexer is None:
+        try:
+            lexer = get_lexer_by_name(language)
+        except ClassNotFound:
+            # Unknown names are not cached, so junk input cannot fill the registry
+            return get_lexer("text")
+        _lexers.set(language, lexer)
+    return lexer
+
+
+def get_formatter(**options):
+    """Shared HtmlFormatter for a set of options"""
+    key = json.dumps(options, sort_keys=True)
+    formatter = _formatters.get(key)
+    if formatter is None:
+        formatter = HtmlFormatter(**options)
+        _formatters.set(key, formatter)
+    return formatter
+
+
+def warm_highlighters(languages):
+    """Build the lexers and formatters for languages ahead of the first render"""
+    for language in languages:
+        get_lexer(language)
+    get_formatter(**HIGHLIGHT_OPTIONS)
+    get_formatter(**PREVIEW_OPTIONS)
+
+
+def highlight_code(content, language, detect=True):
+    """Highlight code using Pygments"""
+    if language == "text" and detect:
+        language = detect_language(content)
+    return highlight(content, get_lexer(language), get_formatter(**HIGHLIGHT_OPTIONS))
+
+
+def highlight_code_preview(content, language, max_length=PREVIEW_LENGTH, detect=True):
+    """Generate a highlighted code preview for list views"""
+    if language == "text" and detect:
+        language = detect_language(content)
+
+    # Use a simple formatter without line numbers for previews
+    return highlight(
+        preview_text(content, max_length),
+        get_lexer(language),
+        get_formatter(**PREVIEW_OPTIONS),
+    )
+
+
+def preview_text(content, max_length=PREVIEW_LENGTH):
+    """Single-line, truncated text of a list preview"""
+    # Convert newlines to spaces and truncate content for single-line preview.
+    # Only a bounded head is normalized so huge pastes stay cheap.
+    head = content[: max_length * 8]
+    preview_content = head.replace("\n", " ").replace("\r", " ").replace("\t", " ")
+    preview_content = " ".join(preview_content.split())  # Normalize whitespace
+    preview_content = preview_content[:max_length]
+    if len(content) > max_length:
+        preview_content += "..."
+    return preview_content
+
+
+def highlight_window(content, language, first_line):
+    """Highlight a window of lines, numbering them from first_line"""
+    formatter = get_formatter(**HIGHLIGHT_OPTIONS, linenostart=first_line)
+    return highlight(content, get_lexer(language), formatter)
+
+
+def render_paste(content, language, windowed=False):
+    """Return the (full highlight, list preview) pair stored on a paste.
+
+    Windowed pastes get no full highlight; their windows are rendered on
+    demand with highlight_window(), so for them content need only be the
+    first PREVIEW_SOURCE_LENGTH characters. Runs in highlight worker
+    processes.
+    """
+    html = None if windowed else highlight_code(content, language, detect=False)
+    return html, highlight_code_preview(content, language, detect=False)
+
+
+def plain_render(content, windowed=False):
+    """Escaped plain-text stand-in for the output of render_paste().
+
+    Shown while a render misses its time budget, so it does no lexing and
+    shows at most FALLBACK_LENGTH characters however long the paste is.
+    """
+    html = None
+    if not windowed:
+        text = content[:FALLBACK_LENGTH]
+        if len(content) > FALLBACK_LENGTH:
+            text += "\n…"
+        html = f'<div class="{HIGHLIGHT_OPTIONS["cssclass"]}"><pre>{escape(text)}</pre></div>'
+    return html, str(escape(preview_text(content)))
@@ -0,0 +1,152 @@
+from flask import abort
+
+from app.caching import TTLCache, cache
+
+# Cached in place of a snapshot for unique IDs that do not exist
+_MISSING = False
+
+
+class PasteSnapshot:
+    """Lightweight stand-in for a paste looked up by unique_id.
+
+    Carries what access checks and HTTP validators need, so a 304 or a
+    refused private paste costs no query. Any other attribute loads the full
+    Paste row on first access; if the row no longer matches the snapshot,
+    the cached entry is dropped and the validators are taken from the row.
+    """
+
+    def __init__(
+        self,
+        paste_id,
+        unique_id,
+        user_id,
+        is_public,
+        content_hash,
+        updated_at,
+        size,
+        options=(),
+    ):
+        self.id = paste_id
+        self.unique_id = unique_id
+        self.user_id = user_id
+        self.is_public = is_public
+        self.content_hash = content_hash
+        self.updated_at = updated_at
+        self.size = size
+        self._options = options
+        self._paste = None
+
+    def _load(self):
+        if self._paste is None:
+            from app import db
+            from app.models import Paste
+
+            paste = db.session.get(Paste, self.id, options=self._options)
+            if paste is None or (
+                (paste.is_public, paste.user_id) != (self.is_public, self.user_id)
+            ):
+                # Deleted or made private by another worker since it was
+                # cached, so the caller's access check cannot be trusted
+                paste_cache.invalidate(self.unique_id)
+                abort(404)
+            current = (paste.content_hash, paste.updated_at, paste.size)
+            if current != (self.content_hash, self.updated_at, self.size):
+                # Edited by another worker since it was cached; validators
+                # built from here on must describe the body actually served
+                paste_cache.invalidate(self.unique_id)
+                self.content_hash, self.updated_at, self.size = current
+            self._paste = paste
+        return self._paste
+
+    def increment_views(self):
+        """Increment view count without loading the paste"""
+        from app import view_counter
+
+        view_counter.increment(self.id)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        return f"<PasteSnapshot {self.unique_id}>"
+
+
+class PasteCache:
+    """Bounded TTL cache of paste snapshots keyed by unique_id.
+
+    Every paste route starts by resolving the unique_id, and popular pastes
+    are resolved thousands of times a minute. IDs that do not exist are
+    cached too, for a shorter time, so probing random IDs does not cost a
+    query each. Entries are dropped when the paste is updated or deleted and
+    missing entries when a paste is inserted. With an in-process cache
+    backend that only reaches this worker, and the TTL bounds how long
+    other workers can serve a stale snapshot.
+    """
+
+    def __init__(self, maxsize=4096, ttl=30, negative_ttl=10):
+        self._entries = TTLCache(maxsize, ttl)
+        self.negative_ttl = negative_ttl
+
+    def init_app(self, app):
+        self._entries = cache.namespace(
+            "paste",
+            app.config.get("PASTE_LOOKUP_CACHE_SIZE", 4096),
+            app.config.get("PASTE_LOOKUP_CACHE_TTL", 30),
+        )
+        self.negative_ttl = app.config.get("PASTE_LOOKUP_NEGATIVE_TTL", 10)
+
+    def load(self, unique_id, options=()):
+        """Return a snapshot for the unique_id, or None if no paste has it.
+
+        Loader options (such as joinedload(Paste.blob)) apply when the full
+        paste is loaded.
+        """
+        from app import db
+        from app.models import Paste
+
+        entry = self._entries.get(unique_id) if self._entries.ttl else None
+        if entry is None:
+            row = db.session.execute(
+                db.select(
+                    Paste.id,
+                    Paste.user_id,
+                    Paste.is_public,
+                    Paste.content_hash,
+                    Paste.updated_at,
+                    Paste.size,
+                ).where(Paste.unique_id == unique_id)
+            ).first()
+            entry = tuple(row) if row is not None else _MISSING
+            if self._entries.ttl:
+                ttl = self.negative_ttl if entry is _MISSING else None
+                if ttl != 0:
+                    self._entries.set(unique_id, entry, ttl)
+        if entry is _MISSING:
+            return None
+        paste_id, user_id, is_public, digest, updated_at, size = entry
+        return PasteSnapshot(
+            paste_id,
+            unique_id,
+            user_id,
+            bool(is_public),
+            digest,
+            updated_at,
+            size,
+            options,
+        )
+
+    def invalidate(self, unique_id):
+        self._entries.delete(unique_id)
+
+
+paste_cache = PasteCache()
+
+
+def get_paste_or_404(unique_id, *options):
+    """Look up a paste snapshot by unique_id, aborting with 404 if missing"""
+    snapshot = paste_cache.load(unique_id, options)
+    if snapshot is None:
+        abort(404)
+    return snapshot
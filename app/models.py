@@ -1,11 +1,55 @@
-import random
-import string
+import io
 from datetime import datetime
 
 import bcrypt
 from flask_login import UserMixin
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.hybrid import Comparator, hybrid_property
 
-from app import db
+from app import db, id_allocator, view_counter
+from app.auth.credentials import credential_cache
+from app.auth.sessions import user_cache
+from app.compression import BLOCK_SIZE, GZIP_HEADER, compress_text, decompress_text
+from app.detection import detect_language
+from app.fragments import fragment_cache
+from app.highlighting import (
+    PREVIEW_SOURCE_LENGTH,
+    WINDOWED_MIN_LINES,
+    WINDOWED_MIN_SIZE,
+    content_hash,
+    highlight_cache_key,
+    highlight_window,
+    plain_render,
+    render_paste,
+    window_cache_key,
+)
+from app.lookups import paste_cache
+from app.rendering import highlight_service
+from app.slicing import count_lines, iter_bytes, window_starts
+from app.storage import HEAD_LENGTH, blob_store
+
+# Characters of content kept on the row for list views
+EXCERPT_LENGTH = 200
+
+# Stored bytes covering the first block of a body even if it did not
+# compress, enough to inflate its head without loading the rest
+HEAD_DATA_LENGTH = len(GZIP_HEADER) + BLOCK_SIZE + 1024
+
+
+class _ContentComparator(Comparator):
+    """Compare paste content through its stored hash.
+
+    Bodies live in compressed blobs keyed by their sha256, so equality is a
+    comparison of digests.
+    """
+
+    def __eq__(self, other):
+        return self.__clause_element__() == content_hash(other)
+
+    def __ne__(self, other):
+        return self.__clause_element__() != content_hash(other)
 
 
 class User(UserMixin, db.Model):
@@ -15,6 +59,10 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(128))
     is_superuser = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped to revoke every API token issued to the user
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Denormalized count of the user's pastes, maintained by Paste mapper events
+    paste_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     # Relationship with pastes
     pastes = db.relationship(
@@ -27,14 +75,22 @@ class User(UserMixin, db.Model):
         self.password_hash = bcrypt.hashpw(password.encode("utf-8"), salt).decode(
             "utf-8"
         )
+        credential_cache.invalidate(self.id)
+        # Changing the password revokes existing API tokens
+        self.token_version = (self.token_version or 0) + 1
 
     def check_password(self, password):
         """Check if provided password matches hash"""
         if not self.password_hash:
             return False
-        return bcrypt.checkpw(
+        if credential_cache.is_verified(self, password):
+            return True
+        valid = bcrypt.checkpw(
             password.encode("utf-8"), self.password_hash.encode("utf-8")
         )
+        if valid:
+            credential_cache.remember(self, password)
+        return valid
 
     def to_dict(self):
         return {
@@ -43,18 +99,69 @@ class User(UserMixin, db.Model):
             "email": self.email,
             "is_superuser": self.is_superuser,
             "created_at": self.created_at.isoformat(),
-            "paste_count": self.pastes.count(),
+            "paste_count": self.paste_count,
         }
 
     def __repr__(self):
         return f"<User {self.username}>"
 
 
+class ContentBlob(db.Model):
+    """Compressed paste body shared by every paste with the same text.
+
+    Keyed by the SHA-256 of the text; refcount tracks the pastes pointing at
+    it and is maintained by Paste mapper events, which drop the blob when
+    the last reference goes.
+    """
+
+    hash = db.Column(db.String(64), primary_key=True)
+    # Inline gzip bytes, or NULL when the body lives in the external blob
+    # storage named by location (large pastes, see app.storage)
+    data = db.Column(db.LargeBinary)
+    # The start of data, loaded only where asked for (search results)
+    head_data = db.deferred(db.func.substr(data, 1, HEAD_DATA_LENGTH))
+    location = db.Column(db.String(32))
+    # Block and line offsets for reading slices (see app.compression)
+    seek_index = db.Column(db.JSON)
+    refcount = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    def open(self):
+        """Open the stored compressed bytes for reading"""
+        if self.location is None:
+            return io.BytesIO(self.data)
+        return blob_store.open(self)
+
+    def __repr__(self):
+        return f"<ContentBlob {self.hash[:12]} refs={self.refcount}>"
+
+
 class Paste(db.Model):
+    # Composite indexes backing keyset pagination of listings
+    __table_args__ = (
+        db.Index("ix_paste_public_created_id", "is_public", "created_at", "id"),
+        db.Index("ix_paste_user_created_id", "user_id", "created_at", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     unique_id = db.Column(db.String(16), unique=True, nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    # The body lives in a shared, content-addressed blob (see the content
+    # property) so list queries never load it; they use the bounded excerpt
+    # and stored size/line count instead. Active history keeps the previous
+    # hash available so its blob reference can be released.
+    content_hash = db.column_property(
+        db.Column(
+            db.String(64),
+            db.ForeignKey("content_blob.hash"),
+            nullable=False,
+            index=True,
+        ),
+        active_history=True,
+    )
+    blob = db.relationship("ContentBlob")
+    excerpt = db.Column(db.String(EXCERPT_LENGTH))
+    size = db.Column(db.Integer)
+    line_count = db.Column(db.Integer)
     language = db.Column(db.String(50), default="text")
     is_public = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -63,8 +170,24 @@ class Paste(db.Model):
     )
     views = db.Column(db.Integer, default=0)
 
-    # Foreign key to User
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    # Lexer detected once for "text" pastes, so guessing never reruns per view
+    detected_language = db.Column(db.String(50))
+
+    # Pre-rendered highlight cache, keyed by content hash, language and
+    # formatter options; pastes with equal keys share one render
+    highlight_key = db.Column(db.String(64), index=True)
+    highlighted_html = db.deferred(db.Column(db.Text))
+    preview_html = db.Column(db.Text)
+    # Set when the last refresh fell back to plain text (see _refresh_highlight)
+    render_pending = False
+    fallback_html = None
+
+    # Foreign key to User; active history keeps the previous owner available
+    # to the paste_count bookkeeping when a paste changes hands
+    user_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True),
+        active_history=True,
+    )
 
     def __init__(self, **kwargs):
         super(Paste, self).__init__(**kwargs)
@@ -73,31 +196,494 @@ class Paste(db.Model):
 
     @staticmethod
     def generate_unique_id(length=8):
-        """Generate a unique ID for the paste"""
-        characters = string.ascii_letters + string.digits
-        while True:
-            unique_id = "".join(random.choice(characters) for _ in range(length))
-            if not Paste.query.filter_by(unique_id=unique_id).first():
-                return unique_id
+        """Generate a candidate unique ID for the paste.
+
+        Collisions are caught by the unique index when the paste is inserted
+        with insert_paste(), so no lookup is made here.
+        """
+        return id_allocator.next_id(length)
+
+    @hybrid_property
+    def content(self):
+        """Decompressed paste text, decoded once per loaded blob"""
+        return self._body()[0]
+
+    @content.setter
+    def content(self, value):
+        value = value or ""
+        digest = content_hash(value)
+        data, index = compress_text(value)
+        self.__dict__["_body_cache"] = (digest, value, data)
+        # Kept until flush, where the blob is stored or its refcount bumped
+        self.__dict__["_pending_blob"] = (digest, data, None, index)
+        # A new hash makes the stored highlight stale; detection reruns
+        self.content_hash = digest
+        self.detected_language = None
+        self.update_content_stats(value)
+
+    @content.comparator
+    def content(cls):
+        return _ContentComparator(cls.content_hash)
+
+    def attach_upload(self, upload):
+        """Point the paste at a body received by app.uploads.receive_upload"""
+        self.content_hash = upload.digest
+        self.detected_language = None
+        self.size = upload.size
+        self.line_count = upload.line_count
+        self.excerpt = upload.head[:EXCERPT_LENGTH]
+        if upload.location is None:
+            # Small enough to keep in memory, like an assigned body
+            self.__dict__["_body_cache"] = (upload.digest, upload.text, upload.data)
+        self.__dict__["_pending_upload"] = upload
+        self.__dict__["_pending_blob"] = (
+            upload.digest,
+            upload.data,
+            upload.location,
+            upload.index,
+        )
+
+    @property
+    def search_text(self):
+        """Body text for the search index; external blobs index their head"""
+        cached = self.__dict__.get("_body_cache")
+        if cached is not None and cached[0] == self.content_hash:
+            return cached[1]
+        upload = self.__dict__.get("_pending_upload")
+        if upload is not None and upload.digest == self.content_hash:
+            return upload.head
+        if self.blob.location is None:
+            return self.content
+        return self.head
+
+    @property
+    def head(self):
+        """First HEAD_LENGTH characters of the body, without decoding the rest"""
+        cached = self.__dict__.get("_body_cache")
+        if cached is not None and cached[0] == self.content_hash:
+            return cached[1][:HEAD_LENGTH]
+        upload = self.__dict__.get("_pending_upload")
+        if upload is not None and upload.digest == self.content_hash:
+            return upload.head
+        return blob_store.read_head(self.blob, HEAD_LENGTH)
+
+    @property
+    def compressed_content(self):
+        """Stored gzip bytes of the body, for serving without decompression"""
+        return self._body()[1]
+
+    def _body(self):
+        if self.content_hash is None:
+            return None, None
+        cached = self.__dict__.get("_body_cache")
+        if cached is None or cached[0] != self.content_hash:
+            blob = self.blob
+            data = blob.data if blob.location is None else blob_store.read(blob)
+            cached = (self.content_hash, decompress_text(data), data)
+            self.__dict__["_body_cache"] = cached
+        return cached[1], cached[2]
+
+    @property
+    def effective_language(self):
+        """Language used for highlighting, detecting it for plain-text pastes"""
+        if self.language != "text":
+            return self.language
+        if self.detected_language is None:
+            # Windowed pastes are never decoded whole; their head will do
+            sample = self.head if self.windowed else self.content
+            self.detected_language = detect_language(sample)
+        return self.detected_language
+
+    def update_content_stats(self, content=None):
+        """Store the excerpt, byte size and line count of the content"""
+        if content is None:
+            content = self.content or ""
+        self.excerpt = content[:EXCERPT_LENGTH]
+        self.size = len(content.encode("utf-8"))
+        self.line_count = count_lines(content)
+
+    def prerender(self, budget=True):
+        """Fill content stats and refresh the stored highlight if it is stale.
+
+        Pass budget=False to wait for the highlight however long it takes,
+        instead of storing a plain-text fallback for now.
+        """
+        if self.size is None:
+            self.update_content_stats()
+        return self._refresh_highlight(budget)
+
+    @property
+    def windowed(self):
+        """True if the paste is too long or too big to render as a single page"""
+        return (self.line_count or 0) > WINDOWED_MIN_LINES or (
+            self.size or 0
+        ) > WINDOWED_MIN_SIZE
+
+    def _highlight_current(self, key):
+        return (
+            key == self.highlight_key
+            and self.preview_html is not None
+            and (self.windowed or self.highlighted_html is not None)
+        )
+
+    def submit_render(self):
+        """Start rendering a stale highlight in the background.
+
+        prerender() later collects the result, so batch jobs can keep every
+        highlight worker busy.
+        """
+        if self.size is None:
+            self.update_content_stats()
+        language = self.effective_language
+        key = highlight_cache_key(self.content_hash, language)
+        if not self._highlight_current(key):
+            highlight_service.submit(key, render_paste, *self._render_args(language))
+
+    def _render_args(self, language):
+        """Arguments of render_paste() for the paste.
+
+        Windowed pastes only store a list preview, so only the start of the
+        body is read and sent to the highlight workers.
+        """
+        if self.windowed:
+            return self.head[:PREVIEW_SOURCE_LENGTH], language, True
+        return self.content, language, False
+
+    def _refresh_highlight(self, budget=True, store_fallback=True):
+        """Bring the stored highlight up to date; True if the row changed.
+
+        A render that is not finished yet leaves a plain-text fallback in
+        self.fallback_html and sets render_pending. The fallback is only
+        stored on the row with store_fallback, for writes that save the row
+        anyway; the stale key makes the next request collect the render.
+        """
+        self.render_pending = False
+        language = self.effective_language
+        key = highlight_cache_key(self.content_hash, language)
+        if self._highlight_current(key):
+            return False
+        shared = self._shared_render(key)
+        if shared is not None:
+            self.highlighted_html, self.preview_html = shared
+            self.highlight_key = key
+            return True
+        text, _, windowed = args = self._render_args(language)
+        (html, preview), complete = highlight_service.render(
+            key,
+            render_paste,
+            args,
+            fallback=lambda: plain_render(text, windowed),
+            budget=budget,
+        )
+        if complete:
+            self.highlighted_html, self.preview_html = html, preview
+            self.highlight_key = key
+            return True
+        self.render_pending = True
+        self.fallback_html = html
+        if not store_fallback:
+            return False
+        self.highlighted_html, self.preview_html = html, preview
+        return True
+
+    def _shared_render(self, key):
+        """Reuse the render of a duplicate paste with the same highlight key"""
+        query = db.session.query(Paste.highlighted_html, Paste.preview_html).filter(
+            Paste.highlight_key == key, Paste.preview_html.is_not(None)
+        )
+        if not self.windowed:
+            query = query.filter(Paste.highlighted_html.is_not(None))
+        if self.id is not None:
+            query = query.filter(Paste.id != self.id)
+        with db.session.no_autoflush:
+            return query.first()
+
+    @property
+    def window_count(self):
+        """Number of render windows of a windowed paste"""
+        return len(window_starts(self))
+
+    def render_window(self, number):
+        """Return (HTML, first line, complete) of one window, or None past the end.
+
+        Windows hold up to WINDOW_LINES lines and WINDOW_MAX_SIZE bytes and
+        start where the previous one stopped, as recorded in the seek index.
+        Only the window's bytes are read from the stored body, and finished
+        windows are cached in process, so a request costs one window of work
+        however long the paste is. complete is False while the HTML is a
+        plain-text fallback.
+        """
+        starts = window_starts(self)
+        if not 0 <= number < len(starts):
+            return None
+        start, first = starts[number]
+        stop = starts[number + 1][0] if number + 1 < len(starts) else self.size
+        text = b"".join(iter_bytes(self, start, stop)).decode("utf-8", "replace")
+        language = self.effective_language
+        html, complete = highlight_service.render(
+            window_cache_key(self.content_hash, language, number),
+            highlight_window,
+            (text, language, first),
+            fallback=lambda: highlight_window(text, "text", first),
+            cache=True,
+        )
+        return html, first, complete
+
+    def get_highlighted(self):
+        """Return highlighted HTML, rendering and storing it on a cache miss.
+
+        Until the render is finished a plain-text fallback is returned and
+        render_pending is set; the row is only written once a real render
+        exists. Windowed pastes have no full highlight; None is returned for
+        them.
+        """
+        if self.size is None:
+            self.update_content_stats()
+        stale = self._refresh_highlight(store_fallback=False)
+        if stale:
+            self.keep_updated_at()
+            db.session.commit()
+        if self.render_pending:
+            return self.fallback_html
+        return self.highlighted_html
+
+    def keep_updated_at(self):
+        """Leave updated_at untouched on the next flush.
+
+        For writes of derived data only (renders, hashes), which are not
+        edits and must not change the paste's HTTP validators.
+        """
+        self.updated_at = Paste.__table__.c.updated_at
+
+    @property
+    def total_views(self):
+        """Stored view count plus views buffered in this process"""
+        return (self.views or 0) + view_counter.pending(self.id)
 
     def increment_views(self):
         """Increment view count"""
-        self.views += 1
-        db.session.commit()
+        view_counter.increment(self.id)
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_content=True, authors=None):
+        """Serialize the paste; authors maps user ids to preloaded usernames"""
+        if authors is not None:
+            author = authors.get(self.user_id) or "Anonymous"
+        else:
+            author = self.author.username if self.author else "Anonymous"
+        data = {
             "id": self.unique_id,
             "unique_id": self.unique_id,
             "title": self.title,
-            "content": self.content,
             "language": self.language,
             "is_public": self.is_public,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
-            "views": self.views,
-            "author": self.author.username if self.author else "Anonymous",
+            "views": self.total_views,
+            "size": self.size,
+            "line_count": self.line_count,
+            "author": author,
         }
+        if include_content:
+            data["content"] = self.content
+        else:
+            # List views only ship the stored excerpt, never the full body
+            data["excerpt"] = self.excerpt
+        return data
 
     def __repr__(self):
         return f"<Paste {self.unique_id}: {self.title}>"
+
+
+@db.event.listens_for(User, "after_update")
+@db.event.listens_for(User, "after_delete")
+def _invalidate_user_snapshot(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
+@db.event.listens_for(Paste, "after_insert")
+@db.event.listens_for(Paste, "after_update")
+@db.event.listens_for(Paste, "after_delete")
+def _invalidate_paste_snapshot(mapper, connection, target):
+    # Inserts drop a cached "missing" entry for the new unique_id
+    paste_cache.invalidate(target.unique_id)
+
+
+@db.event.listens_for(Paste, "after_insert")
+@db.event.listens_for(Paste, "after_update")
+@db.event.listens_for(Paste, "after_delete")
+def _mark_listings_changed(mapper, connection, target):
+    was_public = True in db.inspect(target).attrs.is_public.history.deleted
+    if target.is_public or was_public:
+        db.session.info["listings_changed"] = True
+
+
+@db.event.listens_for(User, "after_update")
+@db.event.listens_for(User, "after_delete")
+def _mark_author_changed(mapper, connection, target):
+    # Listings show author names
+    db.session.info["listings_changed"] = True
+
+
+@db.event.listens_for(db.session, "after_commit")
+def _invalidate_listings(session):
+    # After the commit, so no request can cache the old listing under the
+    # new version before the change is visible
+    if session.info.pop("listings_changed", False):
+        fragment_cache.invalidate()
+
+
+@db.event.listens_for(db.session, "after_rollback")
+def _discard_listings_change(session):
+    session.info.pop("listings_changed", None)
+
+
+def _retain_blob(connection, digest, data, size, location=None, index=None):
+    """Store a blob or, if it already exists, take another reference to it"""
+    blobs = ContentBlob.__table__
+    values = None
+    if data is not None or location is not None:
+        if location is None and blob_store.offloads(size):
+            # Written before the row; content addressing makes this idempotent
+            location = blob_store.write(digest, data)
+            data = None
+        values = {
+            "hash": digest,
+            "data": data,
+            "location": location,
+            "seek_index": index,
+            "refcount": 1,
+        }
+    dialect = connection.dialect.name
+    if values is not None and dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        connection.execute(
+            insert(blobs)
+            .values(**values)
+            .on_conflict_do_update(
+                index_elements=[blobs.c.hash],
+                set_={"refcount": blobs.c.refcount + 1},
+            )
+        )
+        return
+    updated = connection.execute(
+        blobs.update()
+        .where(blobs.c.hash == digest)
+        .values(refcount=blobs.c.refcount + 1)
+    ).rowcount
+    if not updated and values is not None:
+        connection.execute(blobs.insert().values(**values))
+
+
+def _release_blob(connection, digest):
+    """Drop a reference to a blob, deleting it once nothing points at it"""
+    if digest is None:
+        return
+    blobs = ContentBlob.__table__
+    connection.execute(
+        blobs.update()
+        .where(blobs.c.hash == digest)
+        .values(refcount=blobs.c.refcount - 1)
+    )
+    connection.execute(
+        blobs.delete().where(blobs.c.hash == digest, blobs.c.refcount <= 0)
+    )
+
+
+def _store_pending_blob(connection, target):
+    """Retain the blob for the paste's current body"""
+    data = location = index = None
+    pending = target.__dict__.get("_pending_blob")
+    if pending is not None and pending[0] == target.content_hash:
+        _, data, location, index = pending
+    _retain_blob(connection, target.content_hash, data, target.size, location, index)
+
+
+@db.event.listens_for(Paste, "before_insert")
+def _store_inserted_blob(mapper, connection, target):
+    _store_pending_blob(connection, target)
+
+
+@db.event.listens_for(Paste, "before_update")
+def _store_updated_blob(mapper, connection, target):
+    if db.inspect(target).attrs.content_hash.history.has_changes():
+        _store_pending_blob(connection, target)
+
+
+@db.event.listens_for(Paste, "after_update")
+def _release_replaced_blob(mapper, connection, target):
+    history = db.inspect(target).attrs.content_hash.history
+    if history.has_changes():
+        for old_digest in history.deleted:
+            _release_blob(connection, old_digest)
+
+
+@db.event.listens_for(Paste, "after_delete")
+def _release_deleted_blob(mapper, connection, target):
+    _release_blob(connection, target.content_hash)
+
+
+def _adjust_paste_count(connection, user_id, delta):
+    if user_id is None:
+        return
+    users = User.__table__
+    connection.execute(
+        users.update()
+        .where(users.c.id == user_id)
+        .values(paste_count=users.c.paste_count + delta)
+    )
+
+
+@db.event.listens_for(Paste, "after_insert")
+def _count_inserted_paste(mapper, connection, target):
+    _adjust_paste_count(connection, target.user_id, 1)
+
+
+@db.event.listens_for(Paste, "after_delete")
+def _count_deleted_paste(mapper, connection, target):
+    _adjust_paste_count(connection, target.user_id, -1)
+
+
+@db.event.listens_for(Paste, "after_update")
+def _count_reassigned_paste(mapper, connection, target):
+    history = db.inspect(target).attrs.user_id.history
+    if history.has_changes():
+        for old_user_id in history.deleted:
+            _adjust_paste_count(connection, old_user_id, -1)
+        _adjust_paste_count(connection, target.user_id, 1)
+
+
+def insert_paste(paste, attempts=5):
+    """Add and flush a new paste, drawing a fresh unique_id on conflict.
+
+    Each attempt runs in a savepoint so a colliding insert (and the index
+    and counter updates riding on it) rolls back without touching the rest
+    of the transaction. The caller commits.
+    """
+    for attempt in range(attempts):
+        try:
+            with db.session.begin_nested():
+                db.session.add(paste)
+            return paste
+        except IntegrityError:
+            taken = db.session.scalar(
+                db.select(Paste.id).where(Paste.unique_id == paste.unique_id)
+            )
+            if taken is None or attempt == attempts - 1:
+                raise
+            paste.unique_id = Paste.generate_unique_id()
+
+
+def reconcile_paste_counts():
+    """Recompute every user's paste_count from the paste table"""
+    users = User.__table__
+    pastes = Paste.__table__
+    actual = (
+        db.select(db.func.count(pastes.c.id))
+        .where(pastes.c.user_id == users.c.id)
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        users.update().where(users.c.paste_count != actual).values(paste_count=actual)
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,88 @@
+import base64
+from datetime import datetime
+
+from app import db
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(paste):
+    """Encode an opaque cursor pointing just past the given paste"""
+    raw = f"{paste.created_at.isoformat()}|{paste.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into its (created_at, id) position"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        created_at, paste_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), int(paste_id)
+    except (ValueError, UnicodeError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+class KeysetPage:
+    """A page of pastes fetched by cursor rather than by OFFSET"""
+
+    # Cursor pages never run COUNT(*), so totals are unknown
+    page = None
+    pages = None
+    total = None
+
+    def __init__(self, items, per_page, next_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def newest_first(query):
+    """Order pastes newest first with a stable tiebreaker on id"""
+    from app.models import Paste
+
+    return query.order_by(Paste.created_at.desc(), Paste.id.desc())
+
+
+def keyset_paginate(query, after, per_page):
+    """Return the page of pastes after a cursor, newest first.
+
+    Seeks on (created_at, id) so deep pages cost the same as the first one
+    and no COUNT query is issued. An empty cursor starts at the newest paste.
+    """
+    from app.models import Paste
+
+    if after:
+        created_at, paste_id = decode_cursor(after)
+        query = query.filter(
+            db.tuple_(Paste.created_at, Paste.id) < db.tuple_(created_at, paste_id)
+        )
+
+    items = newest_first(query).limit(per_page + 1).all()
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1])
+    return KeysetPage(items, per_page, next_cursor)
+
+
+def paginate_pastes(query, page, per_page, after=None):
+    """Paginate by cursor when one is given, otherwise by page number"""
+    if after is not None:
+        return keyset_paginate(query, after, per_page)
+    return newest_first(query).paginate(page=page, per_page=per_page, error_out=False)
+
+
+def next_cursor(pagination):
+    """Cursor for the page after this one, for cursor and OFFSET pages alike"""
+    if isinstance(pagination, KeysetPage):
+        return pagination.next_cursor
+    if pagination.has_next and pagination.items:
+        return encode_cursor(pagination.items[-1])
+    return None
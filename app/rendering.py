@@ -0,0 +1,223 @@
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from app.caching import TTLCache, cache
+from app.highlighting import warm_highlighters
+from app.web.forms import LANGUAGES
+
+logger = logging.getLogger(__name__)
+
+# Longest wait before a failed render is tried again; the wait doubles with
+# every failure from HIGHLIGHT_RETRY_DELAY up to this
+MAX_RETRY_DELAY = 24 * 3600
+
+# Seconds a finished job's result waits to be collected before it is dropped
+UNCOLLECTED_JOB_TTL = 300
+
+
+class HighlightService:
+    """Runs Pygments highlighting in worker processes under a time budget.
+
+    Highlighting is pure-Python CPU work, so doing it on the request thread
+    ties up a sync worker for as long as the paste takes to lex. Jobs are
+    submitted to a process pool under a key (the highlight cache key); a
+    request waits at most HIGHLIGHT_TIMEOUT seconds and then shows a
+    plain-text fallback while the job keeps running. The finished result is
+    kept under its key, so the next request for the same render picks it up
+    instead of starting over. With HIGHLIGHT_WORKERS = 0 jobs run inline.
+
+    A job still running after HIGHLIGHT_JOB_LIMIT seconds is stuck: the
+    worker processes are killed and the pool restarted. Stuck and failed
+    jobs are not submitted again until a retry delay has passed, doubling
+    with each failure, so a few pathological pastes cannot keep every
+    worker busy.
+    """
+
+    def __init__(self):
+        self.workers = 0
+        self.timeout = 2.0
+        self.job_limit = 30.0
+        self.retry_delay = 60.0
+        self.languages = []
+        self._executor = None
+        self._lock = threading.Lock()
+        # Submitted jobs by key as (future, submitted at), kept until their
+        # result is collected
+        self._jobs = {}
+        # Finished renders that are not stored anywhere else (windows)
+        self.results = TTLCache(maxsize=256, ttl=3600)
+        # Failed renders by key as (failures, retry at)
+        self.failures = TTLCache(maxsize=4096, ttl=2 * MAX_RETRY_DELAY)
+
+    def init_app(self, app):
+        self.shutdown()
+        self.workers = app.config.get("HIGHLIGHT_WORKERS", 0)
+        self.languages = [code for code, _ in LANGUAGES]
+        warm_highlighters(self.languages)
+        self.timeout = app.config.get("HIGHLIGHT_TIMEOUT", 2.0)
+        self.job_limit = app.config.get("HIGHLIGHT_JOB_LIMIT", 30.0)
+        self.retry_delay = app.config.get("HIGHLIGHT_RETRY_DELAY", 60.0)
+        self.results = cache.namespace(
+            "render",
+            app.config.get("RENDER_CACHE_SIZE", 256),
+            app.config.get("RENDER_CACHE_TTL", 3600),
+        )
+        # Shared, so a render that failed in one worker is not retried by all
+        self.failures = cache.namespace("render-failure", 4096, 2 * MAX_RETRY_DELAY)
+
+    def submit(self, key, function, *args):
+        """Start a job in the background for a later render() to collect.
+
+        Does nothing without worker processes; render() then runs it inline.
+        """
+        if not self.workers:
+            return
+        self._reap()
+        if not self.backing_off(key):
+            self._submit(key, function, args)
+
+    def render(self, key, function, args, fallback, budget=True, cache=False):
+        """Return (result, complete) for a job, waiting within the budget.
+
+        When the job misses its budget, fails or is backing off after a
+        failure, fallback() is returned with complete False; callers must
+        not store it as the final render. With budget False the call waits
+        up to the job limit, as batch jobs do. With cache True finished
+        results are kept in self.results.
+        """
+        if cache:
+            result = self.results.get(key)
+            if result is not None:
+                return result, True
+        if self.workers:
+            self._reap()
+        if self.backing_off(key):
+            return fallback(), False
+        future, started = self._submit(key, function, args)
+        if not budget:
+            timeout = self.job_limit
+        elif started:
+            timeout = self.timeout
+        else:
+            # Another request is already waiting on this job; don't stack up
+            timeout = 0
+        try:
+            result = future.result(timeout)
+        except FutureTimeout:
+            logger.info("Highlight job %s exceeded its budget", key)
+            if not budget:
+                # Waited out the whole job limit, so the job is stuck
+                self.record_failure(key)
+                self.shutdown(kill=True)
+            return fallback(), False
+        except (BrokenProcessPool, CancelledError):
+            # The pool was restarted under this job; it may run again
+            self._forget(key, future)
+            return fallback(), False
+        except Exception:
+            logger.exception("Highlight job %s failed", key)
+            self._forget(key, future)
+            self.record_failure(key)
+            return fallback(), False
+        self._forget(key, future)
+        if cache:
+            self.results.set(key, result)
+        return result, True
+
+    def backing_off(self, key):
+        """True while a failed render waits to be tried again"""
+        failure = self.failures.get(key)
+        return failure is not None and time.time() < failure[1]
+
+    def record_failure(self, key):
+        failures = (self.failures.get(key) or (0, 0))[0] + 1
+        delay = min(self.retry_delay * 2 ** (failures - 1), MAX_RETRY_DELAY)
+        self.failures.set(key, (failures, time.time() + delay))
+
+    def _submit(self, key, function, args):
+        if not self.workers:
+            return self._run_inline(function, args), True
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                return job[0], False
+            try:
+                future = self._pool().submit(function, *args)
+            except RuntimeError:
+                # Broken or shut down pool (a worker died); start a fresh one
+                self._executor = None
+                future = self._pool().submit(function, *args)
+            self._jobs[key] = (future, time.monotonic())
+            return future, True
+
+    def _forget(self, key, future):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job[0] is future:
+                del self._jobs[key]
+
+    def _reap(self):
+        """Drop uncollected results and restart the pool if a job is stuck.
+
+        Jobs are timed from submission, so only running ones can be stuck;
+        queued jobs are only waiting their turn.
+        """
+        now = time.monotonic()
+        stuck = []
+        with self._lock:
+            for key, (future, submitted) in list(self._jobs.items()):
+                age = now - submitted
+                if future.done():
+                    if age > UNCOLLECTED_JOB_TTL:
+                        del self._jobs[key]
+                elif age > self.job_limit and future.running():
+                    stuck.append(key)
+        if stuck:
+            logger.warning("Highlight jobs %s are stuck; restarting", stuck)
+            for key in stuck:
+                self.record_failure(key)
+            self.shutdown(kill=True)
+
+    def _run_inline(self, function, args):
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def _pool(self):
+        if self._executor is None:
+            # Spawned workers never inherit the parent's database connections
+            # or background threads; each warms its own lexer registry
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_highlighters,
+                initargs=(self.languages,),
+            )
+        return self._executor
+
+    def shutdown(self, kill=False):
+        """Stop the worker processes, abandoning queued jobs.
+
+        With kill the workers are terminated at once, which is the only way
+        to stop a job that is stuck in a worker.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._jobs.clear()
+        if executor is None:
+            return
+        if kill:
+            for process in list((executor._processes or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+highlight_service = HighlightService()
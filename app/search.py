@@ -0,0 +1,287 @@
+# Full-text search over paste titles and content. SQLite indexes titles per
+# paste in an FTS5 table and bodies per content blob in a contentless FTS5
+# table; PostgreSQL keeps a GIN-indexed tsvector per paste. Neither stores a
+# copy of the body text, so snippets are cut from the head of the stored
+# blob. Both are kept in sync by mapper events. Other databases fall back to
+# LIKE matching.
+import re
+
+from markupsafe import Markup, escape
+
+from app import db
+from app.compression import decompress_head
+from app.models import ContentBlob, Paste
+from app.storage import blob_store
+
+# Control characters used as highlight markers in snippets; they are replaced
+# with <mark> tags after the snippet text has been HTML-escaped.
+MARK_START = "\x02"
+MARK_END = "\x03"
+SNIPPET_WORDS = 16
+
+# Characters at the start of a body searched for snippet matches
+SNIPPET_SOURCE_LENGTH = 16 * 1024
+
+# Title matches count this many times a body match in the ranking
+TITLE_WEIGHT = 10.0
+
+# Words as FTS5's unicode61 tokenizer sees them, near enough for snippets
+WORD_PATTERN = re.compile(r"\w+")
+
+fts_table = db.table("paste_fts", db.column("rowid"), db.column("title"))
+blob_fts_table = db.table("blob_fts", db.column("rowid"), db.column("content"))
+blob_keys = db.table("blob_search", db.column("id"), db.column("hash"))
+pg_table = db.table("paste_search", db.column("paste_id"), db.column("document"))
+
+# Bodies are indexed once per content blob under a blob_search id. Blob text
+# never changes, so entries are never updated; ids are never reused either,
+# so entries left behind by deleted blobs can only go stale, never wrong, and
+# reindex-search drops them.
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS paste_fts "
+    "USING fts5(title, tokenize='unicode61')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS blob_fts "
+    "USING fts5(content, content='', tokenize='unicode61')",
+    "CREATE TABLE IF NOT EXISTS blob_search ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, hash VARCHAR(64) NOT NULL UNIQUE)",
+]
+POSTGRESQL_DDL = [
+    "CREATE TABLE IF NOT EXISTS paste_search ("
+    "paste_id INTEGER PRIMARY KEY REFERENCES paste (id) ON DELETE CASCADE, "
+    "document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_paste_search_document "
+    "ON paste_search USING GIN (document)",
+]
+SEARCH_TABLES = {
+    "sqlite": ["paste_fts", "blob_fts", "blob_search"],
+    "postgresql": ["paste_search"],
+}
+PG_TITLE = "setweight(to_tsvector('english', :title), 'A')"
+PG_DOCUMENT = f"{PG_TITLE} || setweight(to_tsvector('english', :content), 'B')"
+
+
+def _dialect(bind):
+    return bind.dialect.name
+
+
+def create_search_index(target, connection, **kwargs):
+    """Create the search structures alongside the paste table"""
+    ddl = {"sqlite": SQLITE_DDL, "postgresql": POSTGRESQL_DDL}
+    for statement in ddl.get(_dialect(connection), []):
+        connection.execute(db.text(statement))
+
+
+def drop_search_index(target, connection, **kwargs):
+    """Drop the search structures before the paste table goes away"""
+    for table in SEARCH_TABLES.get(_dialect(connection), []):
+        connection.execute(db.text(f"DROP TABLE IF EXISTS {table}"))
+
+
+def index_paste(connection, paste):
+    """Insert or replace the search entry for a paste"""
+    dialect = _dialect(connection)
+    if dialect == "sqlite":
+        params = {"paste_id": paste.id, "title": paste.title}
+        connection.execute(
+            db.text("DELETE FROM paste_fts WHERE rowid = :paste_id"), params
+        )
+        connection.execute(
+            db.text("INSERT INTO paste_fts (rowid, title) VALUES (:paste_id, :title)"),
+            params,
+        )
+        index_blob(connection, paste)
+    elif dialect == "postgresql":
+        connection.execute(
+            db.text(
+                "INSERT INTO paste_search (paste_id, document) "
+                f"VALUES (:paste_id, {PG_DOCUMENT}) "
+                "ON CONFLICT (paste_id) DO UPDATE SET document = EXCLUDED.document"
+            ),
+            {"paste_id": paste.id, "title": paste.title, "content": paste.search_text},
+        )
+
+
+def index_blob(connection, paste):
+    """Index the body of the paste's blob unless an earlier paste did (SQLite)"""
+    claimed = connection.execute(
+        db.text("INSERT OR IGNORE INTO blob_search (hash) VALUES (:hash)"),
+        {"hash": paste.content_hash},
+    ).rowcount
+    if not claimed:
+        # Duplicate body: already indexed, and its text is not even read
+        return
+    connection.execute(
+        db.text(
+            "INSERT INTO blob_fts (rowid, content) "
+            "SELECT id, :content FROM blob_search WHERE hash = :hash"
+        ),
+        {"hash": paste.content_hash, "content": paste.search_text},
+    )
+
+
+def reindex_title(connection, paste_id, title):
+    """Update only the indexed title of a paste"""
+    dialect = _dialect(connection)
+    params = {"paste_id": paste_id, "title": title}
+    if dialect == "sqlite":
+        connection.execute(
+            db.text("UPDATE paste_fts SET title = :title WHERE rowid = :paste_id"),
+            params,
+        )
+    elif dialect == "postgresql":
+        # Keep the body lexemes (weight B) and replace the title's
+        connection.execute(
+            db.text(
+                f"UPDATE paste_search SET document = {PG_TITLE} || "
+                "ts_filter(document, '{b}') WHERE paste_id = :paste_id"
+            ),
+            params,
+        )
+
+
+def remove_paste(connection, paste_id):
+    """Remove a paste from the search index"""
+    dialect = _dialect(connection)
+    if dialect == "sqlite":
+        statement = "DELETE FROM paste_fts WHERE rowid = :paste_id"
+    elif dialect == "postgresql":
+        statement = "DELETE FROM paste_search WHERE paste_id = :paste_id"
+    else:
+        return
+    connection.execute(db.text(statement), {"paste_id": paste_id})
+
+
+def _after_insert(mapper, connection, target):
+    index_paste(connection, target)
+
+
+def _after_update(mapper, connection, target):
+    state = db.inspect(target)
+    if state.attrs.content_hash.history.has_changes():
+        index_paste(connection, target)
+    elif state.attrs.title.history.has_changes():
+        reindex_title(connection, target.id, target.title)
+
+
+def _after_delete(mapper, connection, target):
+    remove_paste(connection, target.id)
+
+
+def init_app(app):
+    """Keep the search index in sync with the paste table"""
+    listeners = [
+        (Paste.__table__, "after_create", create_search_index),
+        (Paste.__table__, "before_drop", drop_search_index),
+        (Paste, "after_insert", _after_insert),
+        (Paste, "after_update", _after_update),
+        (Paste, "after_delete", _after_delete),
+    ]
+    for target, identifier, fn in listeners:
+        if not db.event.contains(target, identifier, fn):
+            db.event.listen(target, identifier, fn)
+
+
+def _fts_query(term):
+    """Quote each word so user input can never be parsed as FTS5 syntax"""
+    words = term.split()
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+def make_snippet(text, term):
+    """Cut about SNIPPET_WORDS words of text around the first search hit.
+
+    Hits are wrapped in MARK_START/MARK_END. Text without a hit (the match
+    was in the title or past the searched head) gives its opening words.
+    """
+    wanted = {word.lower() for word in WORD_PATTERN.findall(term)}
+    words = list(WORD_PATTERN.finditer(text))
+    if not words:
+        return None
+    first_hit = next(
+        (n for n, word in enumerate(words) if word.group().lower() in wanted), 0
+    )
+    start = max(min(first_hit - 2, len(words) - SNIPPET_WORDS), 0)
+    shown = words[start : start + SNIPPET_WORDS]
+    parts = ["…"] if start else []
+    position = shown[0].start() if start else 0
+    for word in shown:
+        parts.append(text[position : word.start()])
+        if word.group().lower() in wanted:
+            parts.append(f"{MARK_START}{word.group()}{MARK_END}")
+        else:
+            parts.append(word.group())
+        position = word.end()
+    if start + SNIPPET_WORDS < len(words):
+        parts.append("…")
+    else:
+        parts.append(text[position:])
+    return "".join(parts)
+
+
+def paste_snippet(paste, term):
+    """Snippet for a search result, read from the head of its stored body"""
+    blob = paste.blob
+    if blob.location is None:
+        head = decompress_head(blob.head_data, SNIPPET_SOURCE_LENGTH)
+    else:
+        head = blob_store.read_head(blob, SNIPPET_SOURCE_LENGTH)
+    return make_snippet(head, term)
+
+
+def format_snippet(snippet):
+    """Escape a raw snippet and turn its markers into <mark> tags"""
+    if snippet is None:
+        return None
+    html = str(escape(snippet))
+    return Markup(html.replace(MARK_START, "<mark>").replace(MARK_END, "</mark>"))
+
+
+def search_pastes(query, term):
+    """Restrict a paste query to search matches, best matches first.
+
+    Matching blobs are loaded with the pastes so paste_snippet() can read
+    their heads; only the start of inline bodies is selected.
+    """
+    query = query.options(
+        db.joinedload(Paste.blob).defer(ContentBlob.data).undefer(ContentBlob.head_data)
+    )
+    dialect = _dialect(db.session.get_bind())
+    if dialect == "sqlite":
+        match = _fts_query(term)
+        title_fts = db.literal_column("paste_fts")
+        titles = (
+            db.select(fts_table.c.rowid, db.func.bm25(title_fts).label("rank"))
+            .where(title_fts.op("MATCH")(match))
+            .subquery()
+        )
+        body_fts = db.literal_column("blob_fts")
+        bodies = (
+            db.select(blob_keys.c.hash, db.func.bm25(body_fts).label("rank"))
+            .select_from(
+                blob_fts_table.join(blob_keys, blob_keys.c.id == blob_fts_table.c.rowid)
+            )
+            .where(body_fts.op("MATCH")(match))
+            .subquery()
+        )
+        # bm25() is negative, lower is better
+        rank = TITLE_WEIGHT * db.func.coalesce(titles.c.rank, 0) + db.func.coalesce(
+            bodies.c.rank, 0
+        )
+        return (
+            query.outerjoin(titles, titles.c.rowid == Paste.id)
+            .outerjoin(bodies, bodies.c.hash == Paste.content_hash)
+            .filter(db.or_(titles.c.rowid.is_not(None), bodies.c.hash.is_not(None)))
+            .order_by(rank, Paste.id.desc())
+        )
+    if dialect == "postgresql":
+        tsquery = db.func.websearch_to_tsquery("english", term)
+        rank = db.func.ts_rank(pg_table.c.document, tsquery)
+        return (
+            query.join(pg_table, pg_table.c.paste_id == Paste.id)
+            .filter(pg_table.c.document.op("@@")(tsquery))
+            .order_by(rank.desc(), Paste.id.desc())
+        )
+    # Bodies are stored compressed, so the fallback matches titles and excerpts
+    return query.filter(
+        db.or_(Paste.title.contains(term), Paste.excerpt.contains(term))
+    ).order_by(Paste.created_at.desc(), Paste.id.desc())
@@ -0,0 +1,111 @@
+import re
+
+from app.compression import WindowPlanner, decompress_block
+from app.highlighting import WINDOW_LINES, WINDOW_MAX_SIZE
+
+# ?lines= values: "100-200", "100-", "100" or "-50" (the last 50 lines)
+LINE_RANGE_PATTERN = re.compile(r"^(\d*)-(\d*)$|^(\d+)$")
+
+
+class InvalidLineRange(ValueError):
+    """Raised for malformed ?lines= values"""
+
+
+def iter_bytes(paste, start, stop):
+    """Yield body bytes [start, stop), decompressing only the blocks covered"""
+    index = paste.blob.seek_index
+    block_size, blocks = index["block_size"], index["blocks"]
+    with paste.blob.open() as stored:
+        for number in range(start // block_size, len(blocks)):
+            block_start = number * block_size
+            if block_start >= stop:
+                break
+            stored.seek(blocks[number])
+            if number + 1 < len(blocks):
+                compressed = stored.read(blocks[number + 1] - blocks[number])
+            else:
+                compressed = stored.read()
+            block = decompress_block(compressed)
+            yield block[max(start - block_start, 0) : stop - block_start]
+
+
+def line_offset(paste, line):
+    """Byte offset where a 0-based newline-delimited line starts"""
+    index = paste.blob.seek_index
+    step = index["line_step"]
+    sample = min(line // step, len(index["lines"]) - 1)
+    offset = index["lines"][sample]
+    remaining = line - sample * step
+    if remaining == 0:
+        return offset
+    chunks = iter_bytes(paste, offset, paste.size)
+    try:
+        for chunk in chunks:
+            position = -1
+            while remaining and (position := chunk.find(b"\n", position + 1)) != -1:
+                remaining -= 1
+            if not remaining:
+                return offset + position + 1
+            offset += len(chunk)
+    finally:
+        chunks.close()
+    return paste.size
+
+
+def total_lines(paste):
+    """Number of newline-delimited lines, counting an unterminated last line"""
+    if not paste.size:
+        return 0
+    newlines = paste.blob.seek_index["newlines"]
+    last = b"".join(iter_bytes(paste, paste.size - 1, paste.size))
+    return newlines + (last != b"\n")
+
+
+def count_lines(text):
+    """Number of newline-delimited lines in text, as total_lines() counts them"""
+    return text.count("\n") + (bool(text) and not text.endswith("\n"))
+
+
+def validate_line_range(spec):
+    """Check the syntax of a ?lines= value"""
+    match = LINE_RANGE_PATTERN.match(spec)
+    if not match or spec == "-":
+        raise InvalidLineRange(spec)
+    return match.groups()
+
+
+def resolve_line_range(spec, count):
+    """Resolve a ?lines= value to 1-based inclusive (first, last).
+
+    The result is empty (first > last) when no line of a body with count
+    lines falls in the range.
+    """
+    start, end, single = validate_line_range(spec)
+    if single:
+        first = last = int(single)
+    elif not start:
+        first, last = max(count - int(end) + 1, 1), count
+    else:
+        first, last = int(start), int(end) if end else count
+    return max(first, 1), min(last, count)
+
+
+def iter_lines(paste, first, last):
+    """Yield the bytes of lines first..last (1-based, inclusive)"""
+    start = line_offset(paste, first - 1)
+    stop = line_offset(paste, last)
+    return iter_bytes(paste, start, stop)
+
+
+def window_starts(paste):
+    """(byte offset, first line) of every render window of the body"""
+    windows = paste.blob.seek_index["windows"]
+    if (windows["lines"], windows["size"]) == (WINDOW_LINES, WINDOW_MAX_SIZE):
+        return windows["starts"]
+    # Planned under other window settings; plan again from the body
+    planner = WindowPlanner()
+    offset = 0
+    for chunk in iter_bytes(paste, 0, paste.size):
+        planner.feed(chunk, offset)
+        offset += len(chunk)
+    return planner.close(paste.size)
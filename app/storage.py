@@ -0,0 +1,152 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import time
+
+# Bytes read per chunk when streaming stored bodies
+CHUNK_SIZE = 64 * 1024
+
+# Characters of an externally stored body kept for the search index
+HEAD_LENGTH = 64 * 1024
+
+
+class FilesystemStorage:
+    """Keeps compressed blobs as files on local disk.
+
+    Files are content-addressed (root/ab/cd/<sha256>.gz), so writes are
+    idempotent and a blob shared by many pastes is stored once. Any object
+    store can stand in for this class by providing the same methods.
+    """
+
+    name = "filesystem"
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.gz")
+
+    def write(self, digest, data):
+        """Store the bytes under the digest unless they are already there"""
+        self.write_stream(digest, io.BytesIO(data))
+
+    def write_stream(self, digest, stream):
+        """Copy a binary stream under the digest unless it is already there"""
+        path = self.path(digest)
+        if os.path.exists(path):
+            # Reused: make it new again so prune leaves it for the grace period
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                shutil.copyfileobj(stream, tmp, CHUNK_SIZE)
+            # Atomic, so readers never see a partial file
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def open(self, digest):
+        return open(self.path(digest), "rb")
+
+    def age(self, digest):
+        """Seconds since the blob was last written"""
+        return time.time() - os.path.getmtime(self.path(digest))
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def digests(self):
+        """Yield the digest of every stored blob"""
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                if filename.endswith(".gz"):
+                    yield filename[: -len(".gz")]
+
+
+def iter_decompressed(stored):
+    """Yield the decompressed bytes of an open blob in bounded chunks"""
+    with stored, gzip.GzipFile(fileobj=stored) as body:
+        while chunk := body.read(CHUNK_SIZE):
+            yield chunk
+
+
+BACKENDS = {FilesystemStorage.name: FilesystemStorage}
+
+
+class BlobStore:
+    """Routes large paste bodies to an external storage backend.
+
+    Bodies whose text exceeds BLOB_STORAGE_THRESHOLD bytes are written to
+    the configured backend and only referenced from the content_blob row,
+    so serving them never loads them into worker memory. Smaller bodies
+    stay inline in the database.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.threshold = None
+
+    def init_app(self, app):
+        name = app.config.get("BLOB_STORAGE")
+        if not name:
+            self.backend = None
+            return
+        root = os.path.join(
+            app.instance_path, app.config.get("BLOB_STORAGE_PATH", "blobs")
+        )
+        self.backend = BACKENDS[name](root)
+        self.threshold = app.config.get("BLOB_STORAGE_THRESHOLD", 1024 * 1024)
+
+    def offloads(self, size):
+        """True if a body of this many bytes belongs in external storage"""
+        return self.backend is not None and size is not None and size > self.threshold
+
+    def backend_for(self, location):
+        if self.backend is None or self.backend.name != location:
+            raise LookupError(f"Blob storage {location!r} is not configured")
+        return self.backend
+
+    def write(self, digest, data):
+        self.backend.write(digest, data)
+        return self.backend.name
+
+    def write_stream(self, digest, stream):
+        self.backend.write_stream(digest, stream)
+        return self.backend.name
+
+    def read_head(self, blob, length):
+        """Decompress only the first length characters of a blob"""
+        head = b""
+        chunks = iter_decompressed(blob.open())
+        try:
+            for chunk in chunks:
+                head += chunk
+                if len(head) >= length * 4:
+                    break
+        finally:
+            chunks.close()
+        return head.decode("utf-8", errors="ignore")[:length]
+
+    def read(self, blob):
+        with self.open(blob) as stored:
+            return stored.read()
+
+    def open(self, blob):
+        """Open the stored compressed bytes of an external blob"""
+        return self.backend_for(blob.location).open(blob.hash)
+
+    def local_path(self, blob):
+        """Filesystem path of an external blob, for sendfile, or None"""
+        backend = self.backend_for(blob.location)
+        return backend.path(blob.hash) if hasattr(backend, "path") else None
+
+
+blob_store = BlobStore()
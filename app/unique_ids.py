@@ -0,0 +1,56 @@
+import secrets
+import string
+import threading
+from collections import deque
+
+ALPHABET = string.ascii_letters + string.digits
+UNIQUE_ID_LENGTH = 8
+
+
+def random_unique_id(length=UNIQUE_ID_LENGTH):
+    """Draw a paste ID from the operating system CSPRNG"""
+    return "".join(secrets.choice(ALPHABET) for _ in range(length))
+
+
+class UniqueIdAllocator:
+    """Hands out paste unique IDs without a per-ID existence check.
+
+    Uniqueness is enforced by the unique index on paste.unique_id; callers
+    insert with insert_paste(), which draws a fresh ID on the rare conflict.
+    With a block size configured, each worker also pre-reserves a block of
+    candidates and filters out taken ones with a single query per block, so
+    conflicts are practically limited to races between workers.
+    """
+
+    def __init__(self, block_size=0):
+        self.block_size = block_size
+        self._block = deque()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.block_size = app.config.get("UNIQUE_ID_BLOCK_SIZE", 0)
+        self.discard()
+
+    def next_id(self, length=UNIQUE_ID_LENGTH):
+        """Return the next candidate ID"""
+        if not self.block_size or length != UNIQUE_ID_LENGTH:
+            return random_unique_id(length)
+        with self._lock:
+            while not self._block:
+                self._block.extend(self._reserve_block())
+            return self._block.popleft()
+
+    def _reserve_block(self):
+        from app import db
+        from app.models import Paste
+
+        candidates = {random_unique_id() for _ in range(self.block_size)}
+        taken = db.session.scalars(
+            db.select(Paste.unique_id).where(Paste.unique_id.in_(candidates))
+        )
+        return candidates.difference(taken)
+
+    def discard(self):
+        """Drop any reserved IDs"""
+        with self._lock:
+            self._block.clear()
@@ -0,0 +1,84 @@
+import codecs
+import hashlib
+import tempfile
+
+from app.compression import BlockCompressor, decompress_text
+from app.storage import CHUNK_SIZE, HEAD_LENGTH, blob_store
+
+
+class UploadTooLarge(ValueError):
+    """Raised as soon as an upload passes the configured maximum size"""
+
+
+class InvalidUpload(ValueError):
+    """Raised when an upload is not valid UTF-8 text"""
+
+
+class StreamedUpload:
+    """A paste body received in chunks and already stored compressed.
+
+    Hash, size and line count are computed while reading, so the full text
+    is never held in memory. Bodies over the blob storage threshold are
+    written straight to external storage (location is set); smaller ones
+    keep their compressed bytes in data.
+    """
+
+    def __init__(self, digest, size, line_count, head, index):
+        self.digest = digest
+        self.size = size
+        self.line_count = line_count
+        self.head = head
+        self.index = index
+        self.data = None
+        self.location = None
+
+    @property
+    def text(self):
+        """Full text of an inline upload"""
+        return decompress_text(self.data)
+
+
+def receive_upload(stream, max_size):
+    """Read a text body from a stream into storage in bounded chunks"""
+    hasher = hashlib.sha256()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    head = []
+    head_length = 0
+    size = 0
+    last = b""
+
+    spool = tempfile.SpooledTemporaryFile(max_size=blob_store.threshold or CHUNK_SIZE)
+    with spool:
+        compressor = BlockCompressor(spool)
+        while chunk := stream.read(CHUNK_SIZE):
+            size += len(chunk)
+            if max_size and size > max_size:
+                raise UploadTooLarge(max_size)
+            text = _decode(decoder, chunk)
+            hasher.update(chunk)
+            compressor.write(chunk)
+            last = chunk[-1:]
+            if head_length < HEAD_LENGTH:
+                head.append(text[: HEAD_LENGTH - head_length])
+                head_length += len(head[-1])
+        _decode(decoder, b"", final=True)
+
+        index = compressor.close()
+        # Newline-delimited lines, counting an unterminated last line
+        line_count = index["newlines"] + (bool(last) and last != b"\n")
+        upload = StreamedUpload(
+            hasher.hexdigest(), size, line_count, "".join(head), index
+        )
+        spool.seek(0)
+        if blob_store.offloads(size):
+            upload.location = blob_store.write_stream(upload.digest, spool)
+        else:
+            upload.data = spool.read()
+    return upload
+
+
+def _decode(decoder, chunk, final=False):
+    try:
+        return decoder.decode(chunk, final)
+    except UnicodeDecodeError as error:
+        raise InvalidUpload(str(error)) from error
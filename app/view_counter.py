@@ -0,0 +1,109 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """Write-behind buffer for paste view counts.
+
+    Views are aggregated in process and written with one batched
+    ``UPDATE paste SET views = views + n`` per flush, so reading a paste never
+    opens a write transaction. Buffered views are flushed when the threshold
+    is reached, every ``VIEW_FLUSH_INTERVAL`` seconds and at interpreter exit.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.flush_interval = 10.0
+        self.flush_threshold = 100
+        self._pending = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._timer = None
+        atexit.register(self.flush)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config.get("VIEW_FLUSH_INTERVAL", 10.0)
+        self.flush_threshold = app.config.get("VIEW_FLUSH_THRESHOLD", 100)
+
+    def increment(self, paste_id, count=1):
+        """Record views for a paste, flushing if the buffer is due"""
+        with self._lock:
+            self._pending[paste_id] += count
+            self._pending_total += count
+            due = self._pending_total >= self.flush_threshold or (
+                self.flush_interval
+                and time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+        else:
+            self._ensure_timer()
+
+    def pending(self, paste_id):
+        """Return views recorded for a paste but not yet written"""
+        with self._lock:
+            return self._pending.get(paste_id, 0)
+
+    def discard(self, paste_id):
+        """Drop buffered views for a paste that is being deleted"""
+        with self._lock:
+            self._pending_total -= self._pending.pop(paste_id, 0)
+
+    def flush(self):
+        """Write all buffered views in a single batched UPDATE"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._pending_total = 0
+            self._last_flush = time.monotonic()
+        if not pending or self.app is None:
+            return 0
+
+        from app import db
+        from app.models import Paste
+
+        table = Paste.__table__
+        statement = (
+            table.update().where(table.c.id == db.bindparam("paste_id"))
+            # Keep updated_at: views are not edits, and it backs HTTP validators
+            .values(
+                views=table.c.views + db.bindparam("count"),
+                updated_at=table.c.updated_at,
+            )
+        )
+        params = [
+            {"paste_id": paste_id, "count": count}
+            for paste_id, count in pending.items()
+        ]
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(statement, params)
+        except Exception:
+            logger.exception("Failed to flush %d paste view counts", len(params))
+            with self._lock:
+                self._pending.update(pending)
+                self._pending_total += sum(pending.values())
+            return 0
+        return len(params)
+
+    def _ensure_timer(self):
+        if not self.flush_interval or self._timer is not None:
+            return
+        self._timer = threading.Thread(
+            target=self._run_timer, name="view-counter-flush", daemon=True
+        )
+        self._timer.start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
@@ -1,79 +1,75 @@
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import (
+    Blueprint,
+    abort,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
 from flask_login import current_user, login_required
-from pygments import highlight
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import get_lexer_by_name, guess_lexer
-from pygments.util import ClassNotFound
 
-from app import db
-from app.models import Paste, User
+from app import db, view_counter
+from app.conditional import add_validators, no_store, not_modified, raw_response
+from app.fragments import fragment_cache, render_block
+from app.lookups import get_paste_or_404
+from app.models import Paste, User, insert_paste
+from app.pagination import InvalidCursor, newest_first, next_cursor, paginate_pastes
 from app.web.forms import PasteForm
 
 web_bp = Blueprint("web", __name__)
 
 
-def highlight_code(content, language):
-    """Highlight code using Pygments"""
-    try:
-        if language == "text":
-            lexer = guess_lexer(content)
-        else:
-            lexer = get_lexer_by_name(language)
-        formatter = HtmlFormatter(cssclass="highlight", linenos=True)
-        return highlight(content, lexer, formatter)
-    except ClassNotFound:
-        # Fallback to plain text
-        lexer = get_lexer_by_name("text")
-        formatter = HtmlFormatter(cssclass="highlight", linenos=True)
-        return highlight(content, lexer, formatter)
-
-
-def highlight_code_preview(content, language, max_length=120):
-    """Generate a highlighted code preview for list views"""
-    try:
-        # Convert newlines to spaces and truncate content for single-line preview
-        preview_content = (
-            content.replace("\n", " ").replace("\r", " ").replace("\t", " ")
-        )
-        preview_content = " ".join(preview_content.split())  # Normalize whitespace
-        preview_content = preview_content[:max_length]
-        if len(content) > max_length:
-            preview_content += "..."
+@web_bp.errorhandler(InvalidCursor)
+def invalid_cursor(error):
+    return "Invalid pagination cursor.", 400
 
-        if language == "text":
-            lexer = guess_lexer(preview_content)
-        else:
-            lexer = get_lexer_by_name(language)
 
-        # Use a simple formatter without line numbers for previews
-        formatter = HtmlFormatter(cssclass="highlight-preview", nowrap=True)
-        return highlight(preview_content, lexer, formatter)
-    except ClassNotFound:
-        # Fallback to plain text with basic formatting
-        lexer = get_lexer_by_name("text")
-        formatter = HtmlFormatter(cssclass="highlight-preview", nowrap=True)
-        return highlight(preview_content, lexer, formatter)
+def render_missing_previews(pastes):
+    """Render and store previews for pastes created before they were stored"""
+    stale = [paste for paste in pastes if paste.preview_html is None]
+    for paste in stale:
+        paste.prerender()
+    if stale:
+        db.session.commit()
+
+
+def render_listing(template_name, key, listing, **context):
+    """Render a public listing page, sharing its content between visitors.
+
+    listing() returns the context of the content block. Anonymous visitors
+    get that block from the fragment cache, so most hits skip the query.
+    """
+    if current_user.is_authenticated:
+        return render_template(template_name, **context, **listing())
+    content = fragment_cache.get_or_render(
+        key, lambda: render_block(template_name, "content", **context, **listing())
+    )
+    return render_template(template_name, content_fragment=content, **context)
 
 
 @web_bp.route("/")
 def index():
     page = request.args.get("page", 1, type=int)
+    after = request.args.get("after")
     per_page = 20
 
-    # Get public pastes
-    pastes = (
-        Paste.query.filter_by(is_public=True)
-        .order_by(Paste.created_at.desc())
-        .paginate(page=page, per_page=per_page, error_out=False)
-    )
-
-    # Add highlighted previews to each paste
-    for paste in pastes.items:
-        paste.highlighted_preview = highlight_code_preview(
-            paste.content, paste.language
+    def listing():
+        # Get public pastes, by cursor (?after=) for constant-time deep paging
+        pastes = paginate_pastes(
+            Paste.query.options(db.joinedload(Paste.author)).filter_by(is_public=True),
+            page,
+            per_page,
+            after,
         )
 
-    return render_template("index.html", pastes=pastes)
+        # Previews are stored at write time; only legacy rows are rendered here
+        render_missing_previews(pastes.items)
+
+        return {"pastes": pastes, "next_cursor": next_cursor(pastes)}
+
+    return render_listing("index.html", f"index:{page}:{after}", listing)
 
 
 @web_bp.route("/create", methods=["GET", "POST"])
@@ -95,7 +91,8 @@ def create_paste():
             is_public=is_public,
             user_id=current_user.id,
         )
-        db.session.add(paste)
+        paste.prerender()
+        insert_paste(paste)
         db.session.commit()
         flash("Paste created successfully!", "success")
         return redirect(url_for("web.view_paste", unique_id=paste.unique_id))
@@ -105,7 +102,7 @@ def create_paste():
 
 @web_bp.route("/paste/<unique_id>")
 def view_paste(unique_id):
-    paste = Paste.query.filter_by(unique_id=unique_id).first_or_404()
+    paste = get_paste_or_404(unique_id)
 
     # Check if user can view this paste
     if not paste.is_public:
@@ -113,24 +110,79 @@ def view_paste(unique_id):
             current_user.id != paste.user_id and not current_user.is_superuser
         ):
             # Return 404 for private pastes to unauthorized users
-            from flask import abort
-
             abort(404)
 
+    # The page differs per viewer, so it is revalidated on every use;
+    # a revalidation still counts as a view
+    variant = f"html-{current_user.id}" if current_user.is_authenticated else "html"
+    cached = not_modified(paste, variant, public=False)
+    if cached is not None:
+        paste.increment_views()
+        return cached
+
+    # Serve the stored highlight; only legacy or stale rows are rendered here.
+    # Long pastes show their first window and load the rest on scroll
+    highlighted_content = paste.get_highlighted()
+    complete = not paste.render_pending
+    window_count = 0
+    if paste.windowed:
+        highlighted_content, _, complete = paste.render_window(0)
+        window_count = paste.window_count
+
     # Increment view count
     paste.increment_views()
 
-    # Highlight the code
-    highlighted_content = highlight_code(paste.content, paste.language)
+    page = render_template(
+        "view_paste.html",
+        paste=paste,
+        highlighted_content=highlighted_content,
+        window_count=window_count,
+    )
+    if not complete:
+        # The plain-text fallback must not be reused once the render is done
+        return no_store(page)
+    return add_validators(page, paste, variant, public=False)
 
-    return render_template(
-        "view_paste.html", paste=paste, highlighted_content=highlighted_content
+
+@web_bp.route("/paste/<unique_id>/windows/<int:number>")
+def paste_window(unique_id, number):
+    """Highlighted HTML of one window of a long paste, as JSON"""
+    paste = get_paste_or_404(unique_id, db.joinedload(Paste.blob))
+
+    if not paste.is_public:
+        if not current_user.is_authenticated or (
+            current_user.id != paste.user_id and not current_user.is_superuser
+        ):
+            abort(404)
+
+    # Windows are the same for every viewer, so public ones can be cached
+    variant = f"window-{number}"
+    cached = not_modified(paste, variant)
+    if cached is not None:
+        return cached
+
+    window = paste.render_window(number) if paste.windowed else None
+    if window is None:
+        abort(404)
+
+    html, first_line, complete = window
+    window_count = paste.window_count
+    response = jsonify(
+        {
+            "window": number,
+            "first_line": first_line,
+            "html": html,
+            "next": number + 1 if number + 1 < window_count else None,
+        }
     )
+    if not complete:
+        return no_store(response)
+    return add_validators(response, paste, variant)
 
 
 @web_bp.route("/paste/<unique_id>/raw")
 def raw_paste(unique_id):
-    paste = Paste.query.filter_by(unique_id=unique_id).first_or_404()
+    paste = get_paste_or_404(unique_id, db.joinedload(Paste.blob))
 
     # Check if user can view this paste
     if not paste.is_public:
@@ -139,7 +191,7 @@ def raw_paste(unique_id):
         ):
             return "This paste is private.", 403
 
-    return paste.content, 200, {"Content-Type": "text/plain; charset=utf-8"}
+    return raw_response(paste)
 
 
 @web_bp.route("/paste/<unique_id>/edit", methods=["GET", "POST"])
@@ -165,6 +217,7 @@ def edit_paste(unique_id):
         paste.content = form.content.data
         paste.language = form.language.data
         paste.is_public = is_public
+        paste.prerender()
         db.session.commit()
         flash("Paste updated successfully!", "success")
         return redirect(url_for("web.view_paste", unique_id=unique_id))
@@ -184,6 +237,7 @@ def delete_paste(unique_id):
         flash("You can only delete your own pastes.", "error")
         return redirect(url_for("web.view_paste", unique_id=unique_id))
 
+    view_counter.discard(paste.id)
     db.session.delete(paste)
     db.session.commit()
     flash("Paste deleted successfully!", "success")
@@ -201,11 +255,18 @@ def user_profile(username):
     if not current_user.is_authenticated or current_user.id != user.id:
         query = query.filter_by(is_public=True)
 
-    pastes = query.order_by(Paste.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    pastes = newest_first(query).paginate(page=page, per_page=per_page, error_out=False)
+
+    # Sum views in the database instead of loading every paste
+    total_views = (
+        db.session.query(db.func.coalesce(db.func.sum(Paste.views), 0))
+        .filter(Paste.user_id == user.id)
+        .scalar()
     )
 
-    return render_template("user_profile.html", user=user, pastes=pastes)
+    return render_template(
+        "user_profile.html", user=user, pastes=pastes, total_views=total_views
+    )
 
 
 @web_bp.route("/api-docs")
@@ -226,22 +287,22 @@ def language_filter(language):
     page = request.args.get("page", 1, type=int)
     per_page = 20
 
-    # Get public pastes for the specific language
-    pastes = (
-        Paste.query.filter_by(is_public=True, language=language)
-        .order_by(Paste.created_at.desc())
-        .paginate(page=page, per_page=per_page, error_out=False)
-    )
+    def listing():
+        # Get public pastes for the specific language
+        pastes = newest_first(
+            Paste.query.options(db.joinedload(Paste.author)).filter_by(
+                is_public=True, language=language
+            )
+        ).paginate(page=page, per_page=per_page, error_out=False)
 
-    # Add highlighted previews to each paste
-    for paste in pastes.items:
-        paste.highlighted_preview = highlight_code_preview(
-            paste.content, paste.language
-        )
+        # Previews are stored at write time; only legacy rows are rendered here
+        render_missing_previews(pastes.items)
 
-    return render_template(
+        return {"pastes": pastes, "language": language}
+
+    return render_listing(
         "language_filter.html",
-        pastes=pastes,
-        language=language,
+        f"language:{language}:{page}",
+        listing,
         title=f"{language.title()} Pastes",
     )
@@ -19,7 +19,86 @@ class Config:
     # Pagination
     PASTES_PER_PAGE = 20
 
-    # API
+    # View counts are buffered in process and flushed in batches
+    VIEW_FLUSH_INTERVAL = float(os.environ.get("VIEW_FLUSH_INTERVAL", 10))
+    VIEW_FLUSH_THRESHOLD = int(os.environ.get("VIEW_FLUSH_THRESHOLD", 100))
+
+    # Successful Basic-auth password checks are cached to skip repeat bcrypt
+    CREDENTIAL_CACHE_TTL = int(os.environ.get("CREDENTIAL_CACHE_TTL", 300))
+    CREDENTIAL_CACHE_SIZE = int(os.environ.get("CREDENTIAL_CACHE_SIZE", 1024))
+
+    # Snapshots of users are cached to skip the user_loader query and the
+    # token version check; with CACHE_BACKEND=memory another worker may
+    # accept a revoked API token for up to USER_CACHE_TTL seconds
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 60))
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 1024))
+
+    # Where read-path caches (paste snapshots, rendered HTML, listings) live:
+    # "memory" per worker, "filesystem" in an SQLite file under the instance
+    # folder shared by the workers on one host, or "redis" at CACHE_URL
+    CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+    CACHE_PATH = os.environ.get("CACHE_PATH", "cache.sqlite3")
+    CACHE_URL = os.environ.get("CACHE_URL", "redis://localhost:6379/0")
+    CACHE_SIZE = int(os.environ.get("CACHE_SIZE", 10000))
+    CACHE_KEY_PREFIX = os.environ.get("CACHE_KEY_PREFIX", "pastebin:")
+
+    # Rendered listing pages shared by anonymous visitors; the TTL bounds
+    # how stale their view counts can get. Only used with a shared
+    # CACHE_BACKEND, as invalidations must reach every worker
+    FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", 256))
+    FRAGMENT_CACHE_TTL = int(os.environ.get("FRAGMENT_CACHE_TTL", 60))
+
+    # Snapshots of pastes looked up by unique_id are cached per worker;
+    # unknown IDs are remembered for the shorter negative TTL
+    PASTE_LOOKUP_CACHE_SIZE = int(os.environ.get("PASTE_LOOKUP_CACHE_SIZE", 4096))
+    PASTE_LOOKUP_CACHE_TTL = int(os.environ.get("PASTE_LOOKUP_CACHE_TTL", 30))
+    PASTE_LOOKUP_NEGATIVE_TTL = int(os.environ.get("PASTE_LOOKUP_NEGATIVE_TTL", 10))
+
+    # Paste IDs pre-reserved per worker with one query (0 disables blocks)
+    UNIQUE_ID_BLOCK_SIZE = int(os.environ.get("UNIQUE_ID_BLOCK_SIZE", 0))
+
+    # Seconds shared caches may serve public raw pastes before revalidating
+    PASTE_CACHE_MAX_AGE = int(os.environ.get("PASTE_CACHE_MAX_AGE", 300))
+
+    # Bodies larger than the threshold (bytes) are kept in external blob
+    # storage under the instance folder and streamed from there; an empty
+    # BLOB_STORAGE keeps every body in the database
+    BLOB_STORAGE = os.environ.get("BLOB_STORAGE", "filesystem")
+    BLOB_STORAGE_PATH = os.environ.get("BLOB_STORAGE_PATH", "blobs")
+    BLOB_STORAGE_THRESHOLD = int(os.environ.get("BLOB_STORAGE_THRESHOLD", 1024 * 1024))
+
+    # Highlighting runs in this many worker processes per app process, and
+    # requests wait at most HIGHLIGHT_TIMEOUT seconds before showing plain
+    # text (0 workers highlights inline on the request thread)
+    HIGHLIGHT_WORKERS = int(os.environ.get("HIGHLIGHT_WORKERS", 2))
+    HIGHLIGHT_TIMEOUT = float(os.environ.get("HIGHLIGHT_TIMEOUT", 2.0))
+    # Jobs still running after HIGHLIGHT_JOB_LIMIT seconds are killed; failed
+    # renders wait HIGHLIGHT_RETRY_DELAY seconds, doubling per failure,
+    # before they are tried again
+    HIGHLIGHT_JOB_LIMIT = float(os.environ.get("HIGHLIGHT_JOB_LIMIT", 30.0))
+    HIGHLIGHT_RETRY_DELAY = float(os.environ.get("HIGHLIGHT_RETRY_DELAY", 60.0))
+
+    # Pygments style of the site stylesheet; every theme listed in
+    # HIGHLIGHT_THEMES also gets a bundle of its own under /assets/
+    HIGHLIGHT_THEME = os.environ.get("HIGHLIGHT_THEME", "tango")
+    HIGHLIGHT_THEMES = [
+        theme
+        for theme in os.environ.get("HIGHLIGHT_THEMES", "tango,monokai").split(",")
+        if theme
+    ]
+
+    # Rendered windows of long pastes kept in process
+    RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", 256))
+    RENDER_CACHE_TTL = int(os.environ.get("RENDER_CACHE_TTL", 3600))
+
+    # Largest accepted paste body in bytes (0 disables the limit)
+    MAX_PASTE_SIZE = int(os.environ.get("MAX_PASTE_SIZE", 50 * 1024 * 1024))
+
+    # API tokens are signed with their own key, never SECRET_KEY
+    API_TOKEN_KEY = (
+        os.environ.get("API_TOKEN_KEY") or "dev-api-token-key-change-in-production"
+    )
+    API_TOKEN_MAX_AGE = int(os.environ.get("API_TOKEN_MAX_AGE", 7 * 24 * 3600))
     API_BASE_URL = os.environ.get("API_BASE_URL") or "http://localhost:5000"
 
 
@@ -40,6 +119,10 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
     WTF_CSRF_ENABLED = False
+    VIEW_FLUSH_INTERVAL = 0
+    VIEW_FLUSH_THRESHOLD = 1
+    BLOB_STORAGE = ""
+    HIGHLIGHT_WORKERS = 0
 
 
 config = {
@@ -0,0 +1,56 @@
+"""Baseline schema: users and pastes with inline content
+
+Revision ID: 2f6d0c1a9b3e
+Revises:
+Create Date: 2026-10-18 16:00:00.000000
+
+Databases created with db.create_all() before migrations were tracked have
+exactly this schema; run.py stamps them with this revision before upgrading.
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "2f6d0c1a9b3e"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(length=80), nullable=False),
+        sa.Column("email", sa.String(length=120), nullable=False),
+        sa.Column("password_hash", sa.String(length=128), nullable=True),
+        sa.Column("is_superuser", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+        sa.UniqueConstraint("username"),
+    )
+    op.create_table(
+        "paste",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("unique_id", sa.String(length=16), nullable=False),
+        sa.Column("title", sa.String(length=200), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("language", sa.String(length=50), nullable=True),
+        sa.Column("is_public", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.Column("views", sa.Integer(), nullable=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_paste_unique_id", "paste", ["unique_id"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_paste_unique_id", table_name="paste")
+    op.drop_table("paste")
+    op.drop_table("user")
@@ -0,0 +1,251 @@
+"""Content blobs, stored renders, search index and denormalized counters
+
+Revision ID: 8c3e5b7a1d42
+Revises: 2f6d0c1a9b3e
+Create Date: 2026-10-18 16:05:00.000000
+
+Moves paste bodies out of paste.content into compressed, content-addressed
+content_blob rows shared by every paste with the same text, and fills in
+the columns the app now derives from a body (hash, excerpt, size, line
+count). Adds the stored-render and language-detection columns, the listing
+indexes, the API token version and the per-user paste count, and builds
+the full-text search index. Rendered HTML is left empty; run
+`flask backfill-renders` afterwards or let first views render it.
+
+"""
+
+from types import SimpleNamespace
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.compression import compress_text, decompress_text
+from app.highlighting import content_hash
+from app.search import create_search_index, drop_search_index, index_paste
+from app.slicing import count_lines
+from app.storage import HEAD_LENGTH, blob_store
+
+# revision identifiers, used by Alembic.
+revision = "8c3e5b7a1d42"
+down_revision = "2f6d0c1a9b3e"
+branch_labels = None
+depends_on = None
+
+# Pastes converted per query; bounds memory on large databases
+BATCH_SIZE = 500
+EXCERPT_LENGTH = 200
+
+user = sa.table("user", sa.column("id", sa.Integer), sa.column("paste_count"))
+paste = sa.table(
+    "paste",
+    sa.column("id", sa.Integer),
+    sa.column("title", sa.String),
+    sa.column("content", sa.Text),
+    sa.column("content_hash", sa.String),
+    sa.column("excerpt", sa.String),
+    sa.column("size", sa.Integer),
+    sa.column("line_count", sa.Integer),
+    sa.column("user_id", sa.Integer),
+)
+content_blob = sa.table(
+    "content_blob",
+    sa.column("hash", sa.String),
+    sa.column("data", sa.LargeBinary),
+    sa.column("location", sa.String),
+    sa.column("seek_index", sa.JSON),
+    sa.column("refcount", sa.Integer),
+)
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    with op.batch_alter_table("user") as batch_op:
+        batch_op.add_column(
+            sa.Column("token_version", sa.Integer(), nullable=False, server_default="0")
+        )
+        batch_op.add_column(
+            sa.Column("paste_count", sa.Integer(), nullable=False, server_default="0")
+        )
+
+    op.create_table(
+        "content_blob",
+        sa.Column("hash", sa.String(length=64), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=True),
+        sa.Column("location", sa.String(length=32), nullable=True),
+        sa.Column("seek_index", sa.JSON(), nullable=True),
+        sa.Column("refcount", sa.Integer(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("hash"),
+    )
+
+    with op.batch_alter_table("paste") as batch_op:
+        batch_op.add_column(sa.Column("content_hash", sa.String(64), nullable=True))
+        batch_op.add_column(sa.Column("excerpt", sa.String(EXCERPT_LENGTH)))
+        batch_op.add_column(sa.Column("size", sa.Integer()))
+        batch_op.add_column(sa.Column("line_count", sa.Integer()))
+        batch_op.add_column(sa.Column("detected_language", sa.String(50)))
+        batch_op.add_column(sa.Column("highlight_key", sa.String(64)))
+        batch_op.add_column(sa.Column("highlighted_html", sa.Text()))
+        batch_op.add_column(sa.Column("preview_html", sa.Text()))
+
+    drop_search_index(None, connection)
+    create_search_index(None, connection)
+    _move_content_to_blobs(connection)
+
+    with op.batch_alter_table("paste") as batch_op:
+        batch_op.alter_column(
+            "content_hash", existing_type=sa.String(64), nullable=False
+        )
+        batch_op.create_foreign_key(
+            "fk_paste_content_hash_content_blob",
+            "content_blob",
+            ["content_hash"],
+            ["hash"],
+        )
+        batch_op.drop_column("content")
+        batch_op.create_index("ix_paste_content_hash", ["content_hash"])
+        batch_op.create_index("ix_paste_highlight_key", ["highlight_key"])
+        batch_op.create_index(
+            "ix_paste_public_created_id", ["is_public", "created_at", "id"]
+        )
+        batch_op.create_index(
+            "ix_paste_user_created_id", ["user_id", "created_at", "id"]
+        )
+
+    connection.execute(
+        user.update().values(
+            paste_count=sa.select(sa.func.count(paste.c.id))
+            .where(paste.c.user_id == user.c.id)
+            .scalar_subquery()
+        )
+    )
+
+
+def _move_content_to_blobs(connection):
+    """Store every body as a blob, one reference per paste, and index it"""
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(paste.c.id, paste.c.title, paste.c.content)
+            .where(paste.c.id > last_id)
+            .order_by(paste.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            text = row.content or ""
+            digest = content_hash(text)
+            size = len(text.encode("utf-8"))
+            location = _retain_blob(connection, digest, text, size)
+            connection.execute(
+                paste.update()
+                .where(paste.c.id == row.id)
+                .values(
+                    content_hash=digest,
+                    excerpt=text[:EXCERPT_LENGTH],
+                    size=size,
+                    line_count=count_lines(text),
+                )
+            )
+            # External bodies are indexed by their head, as the app does
+            search_text = text if location is None else text[:HEAD_LENGTH]
+            index_paste(
+                connection,
+                SimpleNamespace(
+                    id=row.id,
+                    title=row.title,
+                    content_hash=digest,
+                    search_text=search_text,
+                ),
+            )
+        last_id = rows[-1].id
+
+
+def _retain_blob(connection, digest, text, size):
+    """Take a reference to the blob for text, storing it on first use.
+
+    Returns the blob's external storage location, or None if inline.
+    """
+    existing = connection.execute(
+        sa.select(content_blob.c.location).where(content_blob.c.hash == digest)
+    ).first()
+    if existing is not None:
+        connection.execute(
+            content_blob.update()
+            .where(content_blob.c.hash == digest)
+            .values(refcount=content_blob.c.refcount + 1)
+        )
+        return existing.location
+    data, index = compress_text(text)
+    location = None
+    if blob_store.offloads(size):
+        location = blob_store.write(digest, data)
+        data = None
+    connection.execute(
+        content_blob.insert().values(
+            hash=digest, data=data, location=location, seek_index=index, refcount=1
+        )
+    )
+    return location
+
+
+def downgrade():
+    connection = op.get_bind()
+    drop_search_index(None, connection)
+
+    with op.batch_alter_table("paste") as batch_op:
+        batch_op.add_column(sa.Column("content", sa.Text(), nullable=True))
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(
+                paste.c.id,
+                content_blob.c.hash,
+                content_blob.c.data,
+                content_blob.c.location,
+            )
+            .join(content_blob, content_blob.c.hash == paste.c.content_hash)
+            .where(paste.c.id > last_id)
+            .order_by(paste.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            data = row.data
+            if row.location is not None:
+                data = blob_store.read(row)
+            connection.execute(
+                paste.update()
+                .where(paste.c.id == row.id)
+                .values(content=decompress_text(data))
+            )
+        last_id = rows[-1].id
+
+    # Dropping content_hash takes its foreign key and index with it
+    with op.batch_alter_table("paste") as batch_op:
+        batch_op.alter_column("content", existing_type=sa.Text(), nullable=False)
+        batch_op.drop_index("ix_paste_user_created_id")
+        batch_op.drop_index("ix_paste_public_created_id")
+        batch_op.drop_index("ix_paste_highlight_key")
+        batch_op.drop_index("ix_paste_content_hash")
+        for column in (
+            "preview_html",
+            "highlighted_html",
+            "highlight_key",
+            "detected_language",
+            "line_count",
+            "size",
+            "excerpt",
+            "content_hash",
+        ):
+            batch_op.drop_column(column)
+
+    # Files of external blobs are left in place
+    op.drop_table("content_blob")
+
+    with op.batch_alter_table("user") as batch_op:
+        batch_op.drop_column("paste_count")
+        batch_op.drop_column("token_version")
@@ -5,14 +5,53 @@ JJ Pastebin - Main application runner
 
 import os
 
+from flask_migrate import stamp, upgrade
+
 from app import create_app, db
 from app.models import User
 
+# Revision matching databases created with db.create_all() before schema
+# migrations were tracked
+BASELINE_REVISION = "2f6d0c1a9b3e"
+
+# PostgreSQL advisory lock held while migrating, as every Gunicorn worker
+# runs deploy() when it starts
+MIGRATION_LOCK_KEY = 7215
+
+
+def migrate_database():
+    """Create the schema for a new database or migrate an existing one"""
+    with db.engine.connect() as connection:
+        locking = connection.dialect.name == "postgresql"
+        if locking:
+            connection.execute(
+                db.text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+            )
+        try:
+            _migrate_database()
+        finally:
+            if locking:
+                connection.execute(
+                    db.text("SELECT pg_advisory_unlock(:key)"),
+                    {"key": MIGRATION_LOCK_KEY},
+                )
+
+
+def _migrate_database():
+    inspector = db.inspect(db.engine)
+    if not inspector.has_table("paste"):
+        db.create_all()
+        stamp()
+        return
+    if not inspector.has_table("alembic_version"):
+        stamp(revision=BASELINE_REVISION)
+    upgrade()
+
 
 def deploy():
     """Run deployment tasks."""
-    # Create database tables
-    db.create_all()
+    # Create or upgrade database tables
+    migrate_database()
 
     # Create a default admin user if it doesn't exist
     admin_user = User.query.filter_by(username="admin").first()
@@ -2,12 +2,16 @@
 Pytest configuration and fixtures for JJ Pastebin tests.
 """
 
+import contextlib
 import os
 import tempfile
 
 import pytest
 
 from app import create_app, db
+from app.caching import cache
+from app.fragments import fragment_cache
+from app.lookups import paste_cache
 from app.models import Paste, User
 
 
@@ -26,6 +30,7 @@ def app():
             "TESTING": True,
             "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
             "SECRET_KEY": "test-secret-key",
+            "API_TOKEN_KEY": "test-api-token-key",
             "WTF_CSRF_ENABLED": False,  # Disable CSRF for testing
         }
     )
@@ -51,6 +56,44 @@ def runner(app):
     return app.test_cli_runner()
 
 
+@pytest.fixture
+def record_queries(app):
+    """Context manager collecting the SQL statements run inside it."""
+    with app.app_context():
+        engine = db.engine
+
+    @contextlib.contextmanager
+    def record():
+        statements = []
+
+        def collect(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        db.event.listen(engine, "before_cursor_execute", collect)
+        try:
+            yield statements
+        finally:
+            db.event.remove(engine, "before_cursor_execute", collect)
+
+    return record
+
+
+@pytest.fixture
+def shared_cache(app, tmp_path):
+    """Switch the app's caches to an SQLite file for one test."""
+    app.config.update(CACHE_BACKEND="filesystem", CACHE_PATH=str(tmp_path / "c.db"))
+    _init_caches(app)
+    yield cache
+    app.config["CACHE_BACKEND"] = "memory"
+    _init_caches(app)
+
+
+def _init_caches(app):
+    cache.init_app(app)
+    paste_cache.init_app(app)
+    fragment_cache.init_app(app)
+
+
 @pytest.fixture
 def auth(client):
     """Authentication helper."""
@@ -6,6 +6,7 @@ import base64
 import json
 
 from app import db
+from app.auth.sessions import user_cache
 from app.models import Paste, User
 
 
@@ -86,6 +87,47 @@ class TestAPIPastes:
         for field in expected_fields:
             assert field in paste_data
 
+    def test_list_pastes_excludes_content(self, client, test_paste, api_headers):
+        """Test that list responses carry an excerpt instead of full content."""
+        response = client.get("/api/pastes", headers=api_headers)
+
+        assert response.status_code == 200
+        paste_data = json.loads(response.data)["pastes"][0]
+        assert "content" not in paste_data
+        assert paste_data["excerpt"] == test_paste.content
+        assert paste_data["size"] == len(test_paste.content)
+        assert paste_data["line_count"] == 1
+
+    def test_list_pastes_constant_queries(
+        self, client, app, api_headers, record_queries
+    ):
+        """Test that listing pastes does not issue a query per author."""
+
+        def add_pastes(count, offset):
+            with app.app_context():
+                for i in range(offset, offset + count):
+                    user = User(username=f"author{i}", email=f"author{i}@example.com")
+                    db.session.add(user)
+                    db.session.flush()
+                    db.session.add(
+                        Paste(title=f"Paste {i}", content="x", user_id=user.id)
+                    )
+                db.session.commit()
+
+        def count_queries():
+            with record_queries() as statements:
+                response = client.get("/api/pastes?per_page=100", headers=api_headers)
+            assert response.status_code == 200
+            return len(statements), len(json.loads(response.data)["pastes"])
+
+        add_pastes(2, 0)
+        few_queries, few_pastes = count_queries()
+        add_pastes(10, 2)
+        many_queries, many_pastes = count_queries()
+
+        assert (few_pastes, many_pastes) == (2, 12)
+        assert many_queries == few_queries
+
     def test_get_paste_by_id(self, client, test_paste, api_headers):
         """Test GET /api/pastes/<id> - get specific paste."""
         response = client.get(
@@ -276,6 +318,27 @@ class TestAPIPastes:
         data = json.loads(response.data)
         assert "error" in data
 
+    def test_get_paste_raw_conditional_get(self, client, test_paste):
+        """Test that the raw endpoint answers revalidations with 304."""
+        url = f"/api/pastes/{test_paste.unique_id}/raw"
+        etag = client.get(url).headers["ETag"]
+
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_get_private_paste_not_publicly_cacheable(
+        self, client, private_paste, api_headers
+    ):
+        """Test that private pastes are never marked cacheable by shared caches."""
+        auth_string = base64.b64encode(b"testuser:testpass").decode("utf-8")
+        headers = {**api_headers, "Authorization": f"Basic {auth_string}"}
+        response = client.get(f"/api/pastes/{private_paste.unique_id}", headers=headers)
+
+        assert response.status_code == 200
+        assert response.cache_control.private
+        assert response.cache_control.no_cache
+        assert response.headers["ETag"]
+
 
 class TestAPIUsers:
     """Test API user endpoints."""
@@ -407,3 +470,320 @@ class TestAPIFiltering:
         # Should find Flask paste
         flask_pastes = [p for p in data["pastes"] if "Flask" in p["title"]]
         assert len(flask_pastes) >= 1
+
+    def test_cursor_pagination(self, client, app, test_user, api_headers):
+        """Test keyset pagination with ?after= cursors."""
+        with app.app_context():
+            for i in range(15):
+                db.session.add(
+                    Paste(
+                        title=f"Paste {i}", content=f"content {i}", user_id=test_user.id
+                    )
+                )
+            db.session.commit()
+
+        response = client.get("/api/pastes?after=&per_page=10", headers=api_headers)
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert len(data["pastes"]) == 10
+        assert data["pagination"]["total"] is None
+        cursor = data["pagination"]["next_cursor"]
+        assert cursor
+
+        response = client.get(
+            f"/api/pastes?after={cursor}&per_page=10", headers=api_headers
+        )
+        data2 = json.loads(response.data)
+        assert len(data2["pastes"]) == 5
+        assert data2["pagination"]["next_cursor"] is None
+
+        seen = {p["id"] for p in data["pastes"]} | {p["id"] for p in data2["pastes"]}
+        assert len(seen) == 15
+
+    def test_page_response_includes_cursor(self, client, app, test_user, api_headers):
+        """Test that page-number responses offer a cursor to continue from."""
+        with app.app_context():
+            for i in range(3):
+                db.session.add(
+                    Paste(
+                        title=f"Paste {i}", content=f"content {i}", user_id=test_user.id
+                    )
+                )
+            db.session.commit()
+
+        response = client.get("/api/pastes?page=1&per_page=2", headers=api_headers)
+        first = json.loads(response.data)
+        cursor = first["pagination"]["next_cursor"]
+
+        response = client.get(
+            f"/api/pastes?after={cursor}&per_page=2", headers=api_headers
+        )
+        data = json.loads(response.data)
+        assert [p["title"] for p in data["pastes"]] == ["Paste 0"]
+
+    def test_invalid_cursor(self, client, api_headers):
+        """Test that malformed cursors are rejected."""
+        response = client.get("/api/pastes?after=not-a-cursor", headers=api_headers)
+
+        assert response.status_code == 400
+        assert "error" in json.loads(response.data)
+
+
+class TestAPITokens:
+    """Test signed API tokens."""
+
+    def login(self, client, api_headers):
+        response = client.post(
+            "/api/auth/login",
+            headers=api_headers,
+            data=json.dumps({"username": "testuser", "password": "testpass"}),
+        )
+        assert response.status_code == 200
+        return json.loads(response.data)["token"]
+
+    def test_token_creates_paste_without_user_query(
+        self, client, test_user, api_headers, record_queries
+    ):
+        """Test that a signed token is checked without a user query per request."""
+        token = self.login(client, api_headers)
+        headers = {**api_headers, "Authorization": f"Bearer {token}"}
+        # The first request caches the user snapshot
+        client.post(
+            "/api/pastes",
+            headers=headers,
+            data=json.dumps({"title": "Warm up", "content": "x"}),
+        )
+        with record_queries() as statements:
+            response = client.post(
+                "/api/pastes",
+                headers=headers,
+                data=json.dumps({"title": "Token paste", "content": "x"}),
+            )
+
+        assert response.status_code == 201
+        assert not any(
+            s.lstrip().upper().startswith("SELECT") and "FROM user" in s
+            for s in statements
+        )
+
+    def test_token_lazily_loads_user(self, client, test_user, api_headers):
+        """Test that handlers needing the full user still work."""
+        token = self.login(client, api_headers)
+        headers = {**api_headers, "Authorization": f"Bearer {token}"}
+
+        response = client.get("/api/users/me", headers=headers)
+
+        assert response.status_code == 200
+        assert json.loads(response.data)["username"] == "testuser"
+
+    def test_tampered_token_rejected(self, client, test_user, api_headers):
+        """Test that a modified token fails verification."""
+        token = self.login(client, api_headers)
+        headers = {**api_headers, "Authorization": f"Bearer {token[:-2]}xx"}
+
+        response = client.get("/api/users/me", headers=headers)
+
+        assert response.status_code == 401
+
+    def test_password_change_revokes_token(self, client, app, test_user, api_headers):
+        """Test that bumping the token version revokes issued tokens."""
+        token = self.login(client, api_headers)
+        with app.app_context():
+            user = User.query.get(test_user.id)
+            user.set_password("changed")
+            db.session.commit()
+
+        headers = {**api_headers, "Authorization": f"Bearer {token}"}
+        response = client.get("/api/users/me", headers=headers)
+
+        assert response.status_code == 401
+
+    def revoke(self, app, user_id):
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            user.set_password("changed")
+            db.session.commit()
+
+    def test_revoked_token_cannot_create_paste(
+        self, client, app, test_user, api_headers
+    ):
+        """Test that revocation covers handlers that never load the user."""
+        token = self.login(client, api_headers)
+        headers = {**api_headers, "Authorization": f"Bearer {token}"}
+        data = json.dumps({"title": "Token paste", "content": "x"})
+        assert client.post("/api/pastes", headers=headers, data=data).status_code == 201
+
+        self.revoke(app, test_user.id)
+
+        response = client.post("/api/pastes", headers=headers, data=data)
+        assert response.status_code == 401
+
+    def test_revoked_token_cannot_delete_paste(
+        self, client, app, test_user, test_paste, api_headers
+    ):
+        """Test that a revoked token cannot delete the owner's pastes."""
+        token = self.login(client, api_headers)
+        headers = {**api_headers, "Authorization": f"Bearer {token}"}
+        self.revoke(app, test_user.id)
+
+        response = client.delete(f"/api/pastes/{test_paste.unique_id}", headers=headers)
+
+        assert response.status_code == 401
+        with app.app_context():
+            assert Paste.query.filter_by(unique_id=test_paste.unique_id).count() == 1
+
+    def test_deleted_user_token_rejected(self, client, app, test_user, api_headers):
+        """Test that a token outlives neither its user nor their pastes."""
+        token = self.login(client, api_headers)
+        headers = {**api_headers, "Authorization": f"Bearer {token}"}
+        with app.app_context():
+            db.session.delete(db.session.get(User, test_user.id))
+            db.session.commit()
+
+        response = client.post(
+            "/api/pastes",
+            headers=headers,
+            data=json.dumps({"title": "Orphan", "content": "x"}),
+        )
+
+        assert response.status_code == 401
+        with app.app_context():
+            assert Paste.query.count() == 0
+
+    def test_admin_token_checked_against_user_row(
+        self, client, app, admin_user, api_headers
+    ):
+        """Test that admin endpoints use the current flag and token version."""
+        response = client.post(
+            "/api/auth/login",
+            headers=api_headers,
+            data=json.dumps({"username": "admin", "password": "adminpass"}),
+        )
+        token = json.loads(response.data)["token"]
+        headers = {**api_headers, "Authorization": f"Bearer {token}"}
+        assert client.get("/api/users", headers=headers).status_code == 200
+
+        with app.app_context():
+            admin = db.session.get(User, admin_user.id)
+            admin.is_superuser = False
+            db.session.commit()
+        assert client.get("/api/users", headers=headers).status_code == 403
+
+        with app.app_context():
+            username, _, version = user_cache._entries.get(admin_user.id)
+        self.revoke(app, admin_user.id)
+        with app.app_context():
+            # A stale snapshot from another worker is not enough
+            user_cache._entries.set(admin_user.id, (username, True, version))
+        assert client.get("/api/users", headers=headers).status_code == 401
+
+    def test_token_reads_private_paste(
+        self, client, test_user, private_paste, api_headers
+    ):
+        """Test that bearer tokens can read the owner's private pastes."""
+        token = self.login(client, api_headers)
+        headers = {**api_headers, "Authorization": f"Bearer {token}"}
+
+        response = client.get(f"/api/pastes/{private_paste.unique_id}", headers=headers)
+
+        assert response.status_code == 200
+
+    def test_legacy_token_rejected(self, client, test_user, api_headers):
+        """Test that base64(username:SECRET_KEY) tokens no longer authenticate."""
+        token = base64.b64encode(b"testuser:test-secret-key").decode("utf-8")
+        headers = {**api_headers, "Authorization": f"Bearer {token}"}
+
+        response = client.get("/api/users/me", headers=headers)
+
+        assert response.status_code == 401
+
+    def test_token_signed_with_secret_key_rejected(
+        self, client, app, test_user, api_headers
+    ):
+        """Test that knowing SECRET_KEY is not enough to forge a token."""
+        from itsdangerous import URLSafeTimedSerializer
+
+        from app.api.tokens import TOKEN_SALT
+
+        forged = URLSafeTimedSerializer(
+            app.config["SECRET_KEY"], salt=TOKEN_SALT
+        ).dumps({"uid": test_user.id, "tv": 0})
+        headers = {**api_headers, "Authorization": f"Bearer {forged}"}
+
+        response = client.get("/api/users/me", headers=headers)
+
+        assert response.status_code == 401
+
+
+class TestAPIStreamingUpload:
+    """Test text/plain uploads streamed straight to storage."""
+
+    TEXT = "first\r\nsecond\rthird\nété  last line"
+
+    def _headers(self):
+        auth_string = base64.b64encode(b"testuser:testpass").decode("utf-8")
+        return {"Content-Type": "text/plain", "Authorization": f"Basic {auth_string}"}
+
+    def test_upload_creates_paste(self, client, app, test_user, monkeypatch):
+        """Test that a raw body becomes a paste with exact stats."""
+        import app.uploads as uploads
+
+        # Tiny chunks exercise multibyte characters and \r\n across chunks
+        monkeypatch.setattr(uploads, "CHUNK_SIZE", 3)
+        response = client.post(
+            "/api/pastes?title=Build%20log&language=text&is_public=false",
+            headers=self._headers(),
+            data=self.TEXT.encode("utf-8"),
+        )
+
+        assert response.status_code == 201
+        data = json.loads(response.data)
+        assert data["title"] == "Build log"
+        assert data["is_public"] is False
+        assert "content" not in data
+        with app.app_context():
+            paste = Paste.query.filter_by(unique_id=data["id"]).one()
+            assert paste.content == self.TEXT
+            assert paste.size == len(self.TEXT.encode("utf-8"))
+            # Only newlines end lines; a lone \r does not
+            assert paste.line_count == 3
+            assert paste.excerpt == self.TEXT
+            assert paste.preview_html is not None
+
+    def test_upload_shares_blob_with_json_paste(self, client, app, test_user):
+        """Test that streamed and JSON bodies deduplicate to one blob."""
+        from app.models import ContentBlob
+
+        client.post(
+            "/api/pastes", headers=self._headers(), data=self.TEXT.encode("utf-8")
+        )
+        headers = {**self._headers(), "Content-Type": "application/json"}
+        client.post(
+            "/api/pastes", headers=headers, data=json.dumps({"content": self.TEXT})
+        )
+
+        with app.app_context():
+            assert ContentBlob.query.one().refcount == 2
+
+    def test_upload_over_limit_rejected(self, client, app, test_user):
+        """Test that bodies past MAX_PASTE_SIZE get 413 without a paste."""
+        app.config["MAX_PASTE_SIZE"] = 10
+        response = client.post("/api/pastes", headers=self._headers(), data=b"x" * 11)
+
+        assert response.status_code == 413
+        with app.app_context():
+            assert Paste.query.count() == 0
+
+    def test_upload_rejects_invalid_utf8(self, client, test_user):
+        """Test that undecodable bodies are refused."""
+        response = client.post(
+            "/api/pastes", headers=self._headers(), data=b"ok \xff\xfe"
+        )
+
+        assert response.status_code == 400
+
+    def test_empty_upload_rejected(self, client, test_user):
+        """Test that an empty body is refused like empty JSON content."""
+        response = client.post("/api/pastes", headers=self._headers(), data=b"")
+
+        assert response.status_code == 400
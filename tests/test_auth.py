@@ -2,6 +2,8 @@
 Tests for authentication system.
 """
 
+from app import db
+from app.auth.sessions import user_cache
 from app.models import User
 
 
@@ -363,3 +365,87 @@ class TestPasswordSecurity:
         # Should work if case insensitive, fail if case sensitive
         # Adjust based on actual implementation
         assert response.status_code in [200, 302]
+
+
+class TestCredentialCache:
+    """Test caching of successful password verifications."""
+
+    def test_repeat_check_skips_bcrypt(self, app, test_user, monkeypatch):
+        """Test that a verified password is not re-hashed on the next request."""
+        import bcrypt
+
+        with app.app_context():
+            user = User.query.get(test_user.id)
+            assert user.check_password("testpass")
+
+            def fail(*args):
+                raise AssertionError("bcrypt should not run on a cache hit")
+
+            monkeypatch.setattr(bcrypt, "checkpw", fail)
+            assert user.check_password("testpass")
+
+    def test_wrong_password_never_cached(self, app, test_user):
+        """Test that failed verifications are not cached."""
+        with app.app_context():
+            user = User.query.get(test_user.id)
+            assert user.check_password("testpass")
+            assert not user.check_password("wrong")
+            assert not user.check_password("wrong")
+
+    def test_set_password_invalidates(self, app, test_user):
+        """Test that changing the password drops cached verifications."""
+        with app.app_context():
+            user = User.query.get(test_user.id)
+            assert user.check_password("testpass")
+
+            user.set_password("newpass")
+            db.session.commit()
+
+            assert not user.check_password("testpass")
+            assert user.check_password("newpass")
+
+
+class TestUserCache:
+    """Test the session user cache behind Flask-Login's user_loader."""
+
+    def test_repeat_load_skips_query(self, app, test_user, record_queries):
+        """Test that a cached user is identified without touching the database."""
+        with app.app_context():
+            with record_queries() as statements:
+                snapshot = user_cache.load(test_user.id)
+            assert statements
+            assert snapshot.is_authenticated
+            assert snapshot.get_id() == str(test_user.id)
+            assert snapshot.username == "testuser"
+            assert not snapshot.is_superuser
+
+            with record_queries() as statements:
+                snapshot = user_cache.load(test_user.id)
+            assert statements == []
+            assert snapshot.username == "testuser"
+
+    def test_update_invalidates_snapshot(self, app, test_user):
+        """Test that changes to the user are seen on the next load."""
+        with app.app_context():
+            assert not user_cache.load(test_user.id).is_superuser
+
+            user = db.session.get(User, test_user.id)
+            user.is_superuser = True
+            db.session.commit()
+
+            assert user_cache.load(test_user.id).is_superuser
+
+    def test_delete_invalidates_snapshot(self, app, test_user):
+        """Test that a deleted user can no longer be loaded."""
+        with app.app_context():
+            assert user_cache.load(test_user.id) is not None
+
+            db.session.delete(db.session.get(User, test_user.id))
+            db.session.commit()
+
+            assert user_cache.load(test_user.id) is None
+
+    def test_snapshot_loads_other_attributes(self, app, test_user):
+        """Test that attributes outside the snapshot fall back to the row."""
+        with app.app_context():
+            assert user_cache.load(test_user.id).email == "test@example.com"
@@ -0,0 +1,121 @@
+"""
+Tests for the pluggable cache backends.
+"""
+
+import fnmatch
+import time
+
+import pytest
+
+from app import db
+from app.caching import (
+    Cache,
+    CacheNamespace,
+    RedisCache,
+    SQLiteCache,
+    TTLCache,
+)
+from app.lookups import PasteCache
+from app.models import Paste
+
+
+class FakeRedis:
+    """Local stand-in for a Redis client, with the calls RedisCache makes"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value, time.time() + ex if ex else None)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+
+@pytest.fixture(params=["filesystem", "redis"])
+def backend(request, tmp_path):
+    if request.param == "filesystem":
+        return SQLiteCache(str(tmp_path / "cache.sqlite3"), maxsize=100)
+    return RedisCache(FakeRedis())
+
+
+class TestSharedBackends:
+    """Test the backends that are shared between workers."""
+
+    def test_round_trip_and_expiry(self, backend):
+        """Test that values survive pickling and expire after their TTL."""
+        backend.set("snapshot", (1, "abc", None))
+        backend.set("short", "html", ttl=0.05)
+
+        assert backend.get("snapshot") == (1, "abc", None)
+        assert backend.get("short") == "html"
+        time.sleep(1.1 if isinstance(backend, RedisCache) else 0.1)
+        assert backend.get("short") is None
+        assert backend.get("missing", "default") == "default"
+
+    def test_namespaces_clear_independently(self, backend):
+        """Test that clearing one namespace leaves the others alone."""
+        pastes = CacheNamespace(backend, "app:paste_1:", ttl=60)
+        renders = CacheNamespace(backend, "app:paste_10:", ttl=60)
+        pastes.set("a", 1)
+        renders.set("a", 2)
+
+        pastes.clear()
+
+        assert pastes.get("a") is None
+        assert renders.get("a") == 2
+
+    def test_sqlite_cache_is_shared_and_bounded(self, tmp_path):
+        """Test that workers see each other's writes and old entries go."""
+        path = str(tmp_path / "cache.sqlite3")
+        first, second = SQLiteCache(path, maxsize=3), SQLiteCache(path, maxsize=3)
+
+        for number in range(5):
+            first.set(f"key{number}", number)
+        assert second.get("key4") == 4
+
+        second.prune()
+        assert first.get("key0") is None
+        assert first.get("key2") == 2
+
+
+class TestCacheWiring:
+    """Test how create_app and the consumers use the cache."""
+
+    def test_memory_namespaces_are_in_process(self):
+        """Test that the memory backend hands out bounded LRUs."""
+        namespace = Cache().namespace("paste", maxsize=10, ttl=30)
+
+        assert isinstance(namespace, TTLCache)
+        assert namespace.maxsize == 10
+
+    def test_unknown_backend_is_rejected(self, app):
+        """Test that a typo in CACHE_BACKEND fails at startup."""
+        app.config["CACHE_BACKEND"] = "memcache"
+
+        with pytest.raises(ValueError):
+            Cache().init_app(app)
+
+    def test_invalidation_reaches_other_workers(self, app, test_paste, shared_cache):
+        """Test that an edit drops the snapshot every worker reads."""
+        other_worker = PasteCache()
+        other_worker.init_app(app)
+
+        with app.app_context():
+            assert other_worker.load(test_paste.unique_id).is_public is True
+
+            paste = db.session.get(Paste, test_paste.id)
+            paste.is_public = False
+            db.session.commit()
+
+            assert other_worker.load(test_paste.unique_id).is_public is False
@@ -0,0 +1,96 @@
+"""
+Tests for Flask CLI maintenance commands.
+"""
+
+import json
+
+from app import db
+from app.models import Paste, User
+
+BASELINE_REVISION = "2f6d0c1a9b3e"
+LEGACY_BODY = "print('legacy needle')\nprint('done')\n"
+
+
+class TestBackfillRenders:
+    """Test the backfill-renders command."""
+
+    def test_backfill_renders(self, app, runner, test_paste):
+        """Test that existing pastes get stored highlights and previews."""
+        with app.app_context():
+            assert Paste.query.get(test_paste.id).preview_html is None
+
+        result = runner.invoke(args=["backfill-renders"])
+
+        assert result.exit_code == 0
+        assert "Rendered 1 paste(s)." in result.output
+        with app.app_context():
+            paste = Paste.query.get(test_paste.id)
+            assert paste.preview_html is not None
+            assert paste.highlighted_html is not None
+
+        # A second run has nothing left to do
+        result = runner.invoke(args=["backfill-renders"])
+        assert "Rendered 0 paste(s)." in result.output
+
+
+class TestMigrations:
+    """Test migrating databases created before bodies moved into blobs."""
+
+    def legacy_database(self, app, runner):
+        with app.app_context():
+            db.drop_all()
+        result = runner.invoke(args=["db", "upgrade", BASELINE_REVISION])
+        assert result.exit_code == 0, result.output
+        with app.app_context():
+            db.session.execute(
+                db.text(
+                    "INSERT INTO user (id, username, email) "
+                    "VALUES (1, 'old', 'old@example.com')"
+                )
+            )
+            for paste_id, title in [(1, "First"), (2, "Copy")]:
+                db.session.execute(
+                    db.text(
+                        "INSERT INTO paste (id, unique_id, title, content, "
+                        "language, is_public, user_id, created_at, updated_at) "
+                        "VALUES (:id, :unique_id, :title, :content, 'python', 1, 1, "
+                        "'2024-01-01 00:00:00', '2024-01-01 00:00:00')"
+                    ),
+                    {
+                        "id": paste_id,
+                        "unique_id": f"legacy{paste_id}",
+                        "title": title,
+                        "content": LEGACY_BODY,
+                    },
+                )
+            db.session.commit()
+
+    def test_upgrade_moves_content_into_blobs(self, app, runner, client):
+        """Test that legacy bodies become shared blobs with derived columns."""
+        self.legacy_database(app, runner)
+
+        result = runner.invoke(args=["db", "upgrade"])
+
+        assert result.exit_code == 0, result.output
+        with app.app_context():
+            first, copy = Paste.query.order_by(Paste.id).all()
+            assert first.content == copy.content == LEGACY_BODY
+            assert first.content_hash == copy.content_hash
+            assert first.blob.refcount == 2
+            assert first.excerpt == LEGACY_BODY
+            assert (first.size, first.line_count) == (len(LEGACY_BODY), 2)
+            assert db.session.get(User, 1).paste_count == 2
+        response = client.get("/api/pastes?search=needle")
+        assert len(json.loads(response.data)["pastes"]) == 2
+
+    def test_downgrade_restores_inline_content(self, app, runner):
+        """Test that downgrading puts the bodies back on the paste rows."""
+        self.legacy_database(app, runner)
+        assert runner.invoke(args=["db", "upgrade"]).exit_code == 0
+
+        result = runner.invoke(args=["db", "downgrade", BASELINE_REVISION])
+
+        assert result.exit_code == 0, result.output
+        with app.app_context():
+            rows = db.session.execute(db.text("SELECT content FROM paste")).all()
+            assert [row.content for row in rows] == [LEGACY_BODY, LEGACY_BODY]
@@ -0,0 +1,79 @@
+"""
+Tests for language detection.
+"""
+
+from app import db
+from app.detection import SAMPLE_SIZE, detect_language
+from app.models import Paste
+
+
+class TestDetectLanguage:
+    """Test the bounded language detection heuristics."""
+
+    def test_shebang(self):
+        """Test detection from a shebang line."""
+        assert detect_language("#!/usr/bin/env python3\nprint(1)") == "python"
+        assert detect_language("#!/bin/bash\necho hi") == "bash"
+
+    def test_modeline(self):
+        """Test detection from an editor modeline."""
+        assert detect_language("x = 1\n# vim: set ft=ruby :\n") == "ruby"
+        assert detect_language("/* -*- mode: c -*- */\nint x;") == "c"
+
+    def test_modeline_at_end_of_large_content(self):
+        """Test that trailing modelines are found without scanning everything."""
+        content = "a = 1\n" * SAMPLE_SIZE + "# vim: ft=python\n"
+        assert detect_language(content) == "python"
+
+    def test_first_line(self):
+        """Test detection from well-known first lines."""
+        assert detect_language("<?php echo 1; ?>") == "php"
+        assert detect_language("<!DOCTYPE html>\n<html></html>") == "html"
+        assert detect_language("diff --git a/x b/x\n") == "diff"
+        assert detect_language("FROM python:3.11-slim AS build\nRUN pip\n") == (
+            "dockerfile"
+        )
+        assert detect_language("---\nname: app\n") == "yaml"
+
+    def test_first_line_lookalikes(self):
+        """Test that Python imports and plain unified diffs are not misread."""
+        assert detect_language("from django.db import models\n") == "python"
+        assert detect_language("FROM x import y\n") != "dockerfile"
+        diff = "--- old.txt\t2024-01-01\n+++ new.txt\t2024-01-02\n@@ -1 +1 @@\n"
+        assert detect_language(diff) == "diff"
+
+    def test_fallback_to_text(self):
+        """Test that undetectable content falls back to text."""
+        assert detect_language("") == "text"
+
+
+class TestPasteDetection:
+    """Test that detection results are stored on pastes."""
+
+    def test_detected_language_cached(self, app, test_user):
+        """Test that plain-text pastes store their detected language."""
+        with app.app_context():
+            paste = Paste(
+                title="Script",
+                content="#!/bin/sh\necho hello",
+                language="text",
+                user_id=test_user.id,
+            )
+            paste.prerender()
+            db.session.add(paste)
+            db.session.commit()
+
+            assert paste.detected_language == "bash"
+            assert paste.effective_language == "bash"
+
+            paste.content = "<?php echo 1; ?>"
+            assert paste.detected_language is None
+            paste.prerender()
+            assert paste.detected_language == "php"
+
+    def test_explicit_language_skips_detection(self, app, test_paste):
+        """Test that pastes with an explicit language are never detected."""
+        with app.app_context():
+            paste = Paste.query.get(test_paste.id)
+            assert paste.effective_language == "python"
+            assert paste.detected_language is None
@@ -2,10 +2,19 @@
 Tests for database models.
 """
 
+import time
 from datetime import datetime
 
+import pytest
+
 from app import db
-from app.models import Paste, User
+from app.highlighting import content_hash
+from app.lookups import paste_cache
+from app.models import ContentBlob, Paste, User, insert_paste
+from app.rendering import HighlightService, highlight_service
+from app.slicing import total_lines
+from app.unique_ids import UniqueIdAllocator
+from app.view_counter import ViewCounter
 
 
 class TestUser:
@@ -64,6 +73,38 @@ class TestUser:
             assert user.pastes[0].title in ["Paste 1", "Paste 2"]
             assert user.pastes[1].title in ["Paste 1", "Paste 2"]
 
+    def test_paste_count_maintained(self, app, test_user, admin_user):
+        """Test that paste_count follows creates, deletes and reassignment."""
+        with app.app_context():
+            paste1 = Paste(title="Paste 1", content="content1", user_id=test_user.id)
+            paste2 = Paste(title="Paste 2", content="content2", user_id=test_user.id)
+            db.session.add_all([paste1, paste2])
+            db.session.commit()
+            assert User.query.get(test_user.id).paste_count == 2
+
+            paste1.user_id = admin_user.id
+            db.session.commit()
+            assert User.query.get(test_user.id).paste_count == 1
+            assert User.query.get(admin_user.id).paste_count == 1
+
+            db.session.delete(paste2)
+            db.session.commit()
+            assert User.query.get(test_user.id).paste_count == 0
+
+    def test_reconcile_paste_counts(self, app, runner, test_paste, test_user):
+        """Test that the reconcile command repairs drifted counts."""
+        with app.app_context():
+            user = User.query.get(test_user.id)
+            user.paste_count = 7
+            db.session.commit()
+
+        result = runner.invoke(args=["reconcile-paste-counts"])
+
+        assert result.exit_code == 0
+        assert "Corrected 1 user(s)." in result.output
+        with app.app_context():
+            assert User.query.get(test_user.id).paste_count == 1
+
 
 class TestPaste:
     """Test Paste model."""
@@ -106,6 +147,29 @@ class TestPaste:
             assert len(paste1.unique_id) == 8
             assert len(paste2.unique_id) == 8
 
+    def test_unique_id_generation_skips_lookup(self, app, test_user, record_queries):
+        """Test that drawing an ID never queries the paste table."""
+        with app.app_context():
+            with record_queries() as statements:
+                Paste(title="No lookup", content="x", user_id=test_user.id)
+            assert statements == []
+
+    def test_insert_paste_retries_on_collision(self, app, test_paste, test_user):
+        """Test that a colliding unique_id is replaced at insert time."""
+        with app.app_context():
+            paste = Paste(
+                title="Clash",
+                content="x",
+                user_id=test_user.id,
+                unique_id=test_paste.unique_id,
+            )
+            insert_paste(paste)
+            db.session.commit()
+
+            assert paste.id is not None
+            assert paste.unique_id != test_paste.unique_id
+            assert db.session.get(User, test_user.id).paste_count == 2
+
     def test_paste_repr(self, app, test_user):
         """Test paste string representation."""
         with app.app_context():
@@ -229,3 +293,448 @@ class TestPaste:
             assert len(js_pastes) == 1
             assert python_pastes[0].title == "Python Code"
             assert js_pastes[0].title == "JavaScript Code"
+
+    def test_paste_prerender_stores_highlight(self, app, test_user):
+        """Test that prerendering stores highlighted HTML and its cache key."""
+        with app.app_context():
+            paste = Paste(
+                title="Rendered",
+                content='print("hi")',
+                language="python",
+                user_id=test_user.id,
+            )
+            assert paste.prerender() is True
+            db.session.add(paste)
+            db.session.commit()
+
+            assert paste.content_hash is not None
+            assert paste.highlight_key is not None
+            assert 'class="highlight"' in paste.highlighted_html
+
+            # Nothing changed, so nothing is re-rendered
+            assert paste.prerender() is False
+
+    def test_paste_highlight_invalidated_on_update(self, app, test_paste):
+        """Test that changing content or language invalidates the highlight."""
+        with app.app_context():
+            paste = Paste.query.get(test_paste.id)
+            old_key = paste.highlight_key
+
+            paste.content = "console.log('hi')"
+            assert paste.content_hash == content_hash("console.log('hi')")
+            paste.language = "javascript"
+            assert paste.prerender() is True
+            assert paste.highlight_key != old_key
+            assert "console" in paste.highlighted_html
+
+    def test_paste_content_stats(self, app, test_user):
+        """Test that excerpt, size and line count track the content."""
+        with app.app_context():
+            paste = Paste(
+                title="Stats",
+                content="héllo\nworld\n" + "x" * 500,
+                user_id=test_user.id,
+            )
+            db.session.add(paste)
+            db.session.commit()
+
+            assert paste.size == len(paste.content.encode("utf-8"))
+            assert paste.line_count == 3
+            assert len(paste.excerpt) == 200
+            assert paste.content.startswith(paste.excerpt)
+
+    def test_line_count_matches_slicing(self, app, test_user):
+        """Test that only newlines end lines, as in ?lines= slicing."""
+        with app.app_context():
+            paste = Paste(title="Lines", content="a\rb\r\nc\n\nd", user_id=test_user.id)
+            db.session.add(paste)
+            db.session.commit()
+
+            assert paste.line_count == 4
+            assert paste.line_count == total_lines(paste)
+
+    def test_paste_content_stored_compressed(self, app, test_user):
+        """Test that bodies are stored gzip-compressed and read back as text."""
+        import gzip
+
+        text = "2024-01-01 INFO request handled\n" * 500
+        with app.app_context():
+            paste = Paste(title="Log", content=text, user_id=test_user.id)
+            db.session.add(paste)
+            db.session.commit()
+            paste_id = paste.id
+
+            db.session.expire_all()
+            paste = db.session.get(Paste, paste_id)
+            assert gzip.decompress(paste.blob.data).decode("utf-8") == text
+            assert len(paste.compressed_content) * 10 < len(text)
+            assert paste.content == text
+            assert Paste.query.filter_by(content=text).one().id == paste_id
+
+    def test_paste_content_deferred(self, app, test_paste):
+        """Test that list queries do not load paste content."""
+        with app.app_context():
+            db.session.expunge_all()
+            paste = Paste.query.filter_by(is_public=True).first()
+
+            assert "blob" not in paste.__dict__
+            assert paste.excerpt == test_paste.content
+
+
+class TestContentBlobs:
+    """Test content-addressed deduplication of paste bodies."""
+
+    def _blob(self, text):
+        return db.session.get(ContentBlob, content_hash(text))
+
+    def test_duplicate_pastes_share_blob(self, app, test_user):
+        """Test that equal bodies are stored once and reference-counted."""
+        with app.app_context():
+            for title in ("First", "Second"):
+                paste = Paste(
+                    title=title, content="Traceback ...", user_id=test_user.id
+                )
+                db.session.add(paste)
+                db.session.commit()
+
+            assert ContentBlob.query.count() == 1
+            assert self._blob("Traceback ...").refcount == 2
+
+    def test_update_moves_reference(self, app, test_user):
+        """Test that editing a paste releases its old blob."""
+        with app.app_context():
+            paste = Paste(title="Edit me", content="before", user_id=test_user.id)
+            db.session.add(paste)
+            db.session.commit()
+
+            paste = db.session.get(Paste, paste.id)
+            paste.content = "after"
+            db.session.commit()
+            db.session.expire_all()
+
+            assert self._blob("before") is None
+            assert self._blob("after").refcount == 1
+            assert db.session.get(Paste, paste.id).content == "after"
+
+    def test_delete_releases_blob(self, app, test_user):
+        """Test that a blob is dropped with its last reference."""
+        with app.app_context():
+            pastes = [
+                Paste(title=str(i), content="shared", user_id=test_user.id)
+                for i in range(2)
+            ]
+            db.session.add_all(pastes)
+            db.session.commit()
+
+            db.session.delete(pastes[0])
+            db.session.commit()
+            assert self._blob("shared").refcount == 1
+
+            db.session.delete(pastes[1])
+            db.session.commit()
+            assert self._blob("shared") is None
+
+    def test_duplicate_reuses_render(self, app, test_user, monkeypatch):
+        """Test that a duplicate paste copies the stored highlight."""
+        import app.models as models
+
+        with app.app_context():
+            first = Paste(
+                title="One", content="x = 1", language="python", user_id=test_user.id
+            )
+            first.prerender()
+            db.session.add(first)
+            db.session.commit()
+
+            def fail(*args, **kwargs):
+                raise AssertionError("duplicate should not be re-rendered")
+
+            monkeypatch.setattr(models, "render_paste", fail)
+            second = Paste(
+                title="Two", content="x = 1", language="python", user_id=test_user.id
+            )
+            assert second.prerender() is True
+            assert second.highlighted_html == first.highlighted_html
+
+
+class TestViewCounter:
+    """Test the write-behind view counter."""
+
+    def test_views_buffered_until_threshold(self, app, test_paste):
+        """Test that views are aggregated and flushed in one batch."""
+        counter = ViewCounter(app)
+        counter.flush_interval = 0
+        counter.flush_threshold = 3
+
+        with app.app_context():
+            counter.increment(test_paste.id)
+            counter.increment(test_paste.id)
+            assert counter.pending(test_paste.id) == 2
+            assert Paste.query.get(test_paste.id).views == 0
+
+            counter.increment(test_paste.id)
+            assert counter.pending(test_paste.id) == 0
+            db.session.expire_all()
+            assert Paste.query.get(test_paste.id).views == 3
+
+    def test_flush_writes_pending_views(self, app, test_paste):
+        """Test that an explicit flush writes buffered views."""
+        counter = ViewCounter(app)
+        counter.flush_interval = 0
+        counter.flush_threshold = 100
+
+        with app.app_context():
+            counter.increment(test_paste.id, count=5)
+            assert counter.flush() == 1
+            assert counter.flush() == 0
+            assert Paste.query.get(test_paste.id).views == 5
+
+
+class TestUniqueIdAllocator:
+    """Test block reservation of paste unique IDs."""
+
+    def test_block_excludes_taken_ids(self, app, test_paste, monkeypatch):
+        """Test that a reserved block filters out IDs already in use."""
+        import app.unique_ids as unique_ids
+
+        draws = iter([test_paste.unique_id, "Fresh001", "Fresh002"])
+        monkeypatch.setattr(unique_ids, "random_unique_id", lambda: next(draws))
+        allocator = UniqueIdAllocator(block_size=3)
+
+        with app.app_context():
+            assert sorted(allocator.next_id() for _ in range(2)) == [
+                "Fresh001",
+                "Fresh002",
+            ]
+
+
+class TestPasteLookupCache:
+    """Test cached paste snapshots for lookups by unique_id."""
+
+    def test_snapshot_served_from_cache(self, app, test_paste, record_queries):
+        """Test that a repeat lookup costs no query."""
+        with app.app_context():
+            with record_queries() as statements:
+                snapshot = paste_cache.load(test_paste.unique_id)
+            assert statements
+            assert snapshot.id == test_paste.id
+            assert snapshot.is_public is True
+
+            with record_queries() as statements:
+                snapshot = paste_cache.load(test_paste.unique_id)
+            assert statements == []
+            assert snapshot.content_hash == content_hash(test_paste.content)
+            # Other attributes load the full paste
+            assert snapshot.title == "Test Paste"
+
+    def test_missing_ids_are_cached_until_inserted(
+        self, app, test_user, record_queries
+    ):
+        """Test the negative cache and its invalidation on insert."""
+        with app.app_context():
+            assert paste_cache.load("NoSuchId") is None
+            with record_queries() as statements:
+                snapshot = paste_cache.load("NoSuchId")
+            assert snapshot is None and statements == []
+
+            paste = Paste(title="New", content="x", user_id=test_user.id)
+            paste.unique_id = "NoSuchId"
+            db.session.add(paste)
+            db.session.commit()
+
+            assert paste_cache.load("NoSuchId").id == paste.id
+
+    def test_update_invalidates_snapshot(self, app, test_paste):
+        """Test that editing a paste drops its cached snapshot."""
+        with app.app_context():
+            assert paste_cache.load(test_paste.unique_id).is_public is True
+
+            paste = db.session.get(Paste, test_paste.id)
+            paste.is_public = False
+            db.session.commit()
+
+            assert paste_cache.load(test_paste.unique_id).is_public is False
+
+    def test_stale_snapshot_does_not_leak_private_paste(self, app, test_paste):
+        """Test that a snapshot older than a privacy change refuses to load."""
+        from werkzeug.exceptions import NotFound
+
+        with app.app_context():
+            snapshot = paste_cache.load(test_paste.unique_id)
+            # As if another worker made the paste private
+            db.session.execute(
+                db.update(Paste)
+                .where(Paste.id == test_paste.id)
+                .values(is_public=False)
+            )
+
+            with pytest.raises(NotFound):
+                snapshot.content
+
+
+class TestHighlighterRegistry:
+    """Test reuse of lexers and formatters across renders."""
+
+    def test_lexers_and_formatters_are_shared(self, app):
+        """Test that one lexer and formatter serve every render."""
+        from app.highlighting import (
+            HIGHLIGHT_OPTIONS,
+            get_formatter,
+            get_lexer,
+            highlight_code,
+        )
+
+        assert get_lexer("python") is get_lexer("python")
+        assert get_formatter(**HIGHLIGHT_OPTIONS) is get_formatter(**HIGHLIGHT_OPTIONS)
+        assert 'class="highlight"' in highlight_code("x = 1", "python")
+
+    def test_unknown_language_is_plain_text_and_not_cached(self, app):
+        """Test that unknown languages fall back without growing the registry."""
+        import app.highlighting as highlighting
+
+        size = len(highlighting._lexers)
+
+        assert highlighting.get_lexer("no-such-language").name == "Text only"
+        assert len(highlighting._lexers) == size
+
+
+class TestHighlightService:
+    """Test highlighting in worker processes with a time budget."""
+
+    def test_pool_renders_and_falls_back_over_budget(self):
+        """Test that a slow job returns the fallback and a fast one its result."""
+        import time
+
+        from app.highlighting import highlight_window
+
+        service = HighlightService()
+        service.workers = 1
+        service.timeout = 0.1
+        try:
+            html, complete = service.render(
+                "fast",
+                highlight_window,
+                ("x = 1\n", "python", 1),
+                fallback=str,
+                budget=False,
+            )
+            assert complete is True
+            assert 'class="highlight"' in html
+
+            assert service.render("slow", time.sleep, (2,), lambda: "plain") == (
+                "plain",
+                False,
+            )
+            # A request arriving while the job runs does not wait for it again
+            started = time.monotonic()
+            assert service.render("slow", time.sleep, (2,), lambda: "plain")[1] is False
+            assert time.monotonic() - started < 0.1
+        finally:
+            service.shutdown()
+
+    def test_fallback_is_escaped_and_capped(self, monkeypatch):
+        """Test that the plain-text stand-in never runs over the whole body."""
+        import app.highlighting as highlighting
+
+        monkeypatch.setattr(highlighting, "FALLBACK_LENGTH", 10)
+        html, preview = highlighting.plain_render("<i>" * 100)
+
+        assert html.startswith('<div class="highlight"><pre>&lt;i&gt;')
+        assert html.count("&lt;i&gt;") == 3
+        assert "<i>" not in preview
+        assert highlighting.plain_render("x", windowed=True)[0] is None
+
+    def test_failed_render_keeps_highlight_stale(self, app, test_user, monkeypatch):
+        """Test that a plain-text fallback is shown but not stored as current."""
+        import app.models as models
+        from app.highlighting import render_paste
+
+        def fail(content, language, windowed=False):
+            raise RuntimeError("lexer blew up")
+
+        monkeypatch.setattr(models, "render_paste", fail)
+        with app.app_context():
+            paste = Paste(
+                title="Boom",
+                content="x = 1 < <b>2</b>",
+                language="python",
+                user_id=test_user.id,
+            )
+
+            assert paste.prerender() is True
+            assert "x = 1 &lt; &lt;b&gt;2&lt;/b&gt;" in paste.highlighted_html
+            assert "<b>" not in paste.preview_html
+            assert paste.highlight_key is None
+
+            # The failure is not retried until its delay has passed
+            monkeypatch.setattr(models, "render_paste", render_paste)
+            assert paste.prerender() is True
+            assert paste.highlight_key is None
+
+            highlight_service.failures.clear()
+            assert paste.prerender() is True
+            assert paste.highlight_key is not None
+
+    def test_failures_back_off(self):
+        """Test that a failed job is not run again until its retry delay passes."""
+        calls = []
+
+        def fail():
+            calls.append(1)
+            raise RuntimeError("lexer blew up")
+
+        service = HighlightService()
+        service.retry_delay = 60
+        assert service.render("bad", fail, (), lambda: "plain") == ("plain", False)
+        assert service.render("bad", fail, (), lambda: "plain") == ("plain", False)
+        assert len(calls) == 1
+
+        failures, retry_at = service.failures.get("bad")
+        service.failures.set("bad", (failures, 0))
+        service.render("bad", fail, (), lambda: "plain")
+        assert len(calls) == 2
+        # The second failure waits twice as long
+        assert service.failures.get("bad")[1] - time.time() > 100
+
+    def test_stuck_job_is_killed(self):
+        """Test that a job past the job limit is killed and not resubmitted."""
+        service = HighlightService()
+        service.workers = 1
+        service.timeout = 0.1
+        service.job_limit = 0.5
+        try:
+            assert service.render("stuck", time.sleep, (60,), lambda: "plain") == (
+                "plain",
+                False,
+            )
+            worker = next(iter(service._executor._processes.values()))
+            time.sleep(1)
+
+            assert service.render("stuck", time.sleep, (60,), lambda: "plain") == (
+                "plain",
+                False,
+            )
+            worker.join(5)
+            assert not worker.is_alive()
+            assert service.backing_off("stuck")
+            assert service._executor is None
+        finally:
+            service.shutdown(kill=True)
+
+    def test_pending_render_is_not_written(
+        self, app, client, test_paste, monkeypatch, record_queries
+    ):
+        """Test that views of a paste whose render is pending never update it."""
+        import app.models as models
+
+        def fail(content, language, windowed=False):
+            raise RuntimeError("lexer blew up")
+
+        monkeypatch.setattr(models, "render_paste", fail)
+        for _ in range(2):
+            with record_queries() as statements:
+                response = client.get(f"/paste/{test_paste.unique_id}")
+            assert response.status_code == 200
+            assert b"Hello" in response.data
+            # Only the buffered view count is written
+            assert not any("html" in s for s in statements if s.startswith("UPDATE"))
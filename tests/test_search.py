@@ -0,0 +1,144 @@
+"""
+Tests for full-text search.
+"""
+
+import json
+import re
+
+from app import db
+from app.models import Paste
+
+
+def search(client, term):
+    response = client.get(f"/api/pastes?search={term}")
+    assert response.status_code == 200
+    return json.loads(response.data)["pastes"]
+
+
+class TestSearch:
+    """Test the full-text search index behind /api/pastes?search=."""
+
+    def test_ranked_results_with_snippets(self, client, app, test_user):
+        """Test that title matches outrank content matches and snippets mark hits."""
+        with app.app_context():
+            db.session.add_all(
+                [
+                    Paste(
+                        title="Notes",
+                        content="we deploy the gunicorn workers here",
+                        user_id=test_user.id,
+                    ),
+                    Paste(
+                        title="Gunicorn config",
+                        content="bind = '0.0.0.0:5000'",
+                        user_id=test_user.id,
+                    ),
+                ]
+            )
+            db.session.commit()
+
+        results = search(client, "gunicorn")
+
+        assert [p["title"] for p in results] == ["Gunicorn config", "Notes"]
+        assert "<mark>gunicorn</mark>" in results[1]["snippet"]
+        assert "content" not in results[0]
+
+    def test_index_tracks_updates_and_deletes(self, client, app, test_paste):
+        """Test that edits and deletes are reflected in search results."""
+        assert len(search(client, "Hello")) == 1
+
+        with app.app_context():
+            paste = Paste.query.get(test_paste.id)
+            paste.content = "goodbye"
+            db.session.commit()
+
+        assert search(client, "Hello") == []
+        assert len(search(client, "goodbye")) == 1
+
+        with app.app_context():
+            db.session.delete(Paste.query.get(test_paste.id))
+            db.session.commit()
+
+        assert search(client, "goodbye") == []
+
+    def test_private_pastes_and_snippet_escaping(self, client, app, test_user):
+        """Test that private pastes are hidden and snippets are HTML-escaped."""
+        with app.app_context():
+            db.session.add_all(
+                [
+                    Paste(
+                        title="Public",
+                        content="<script>needle</script>",
+                        user_id=test_user.id,
+                    ),
+                    Paste(
+                        title="Private",
+                        content="needle",
+                        is_public=False,
+                        user_id=test_user.id,
+                    ),
+                ]
+            )
+            db.session.commit()
+
+        results = search(client, "needle")
+
+        assert [p["title"] for p in results] == ["Public"]
+        assert "<script>" not in results[0]["snippet"]
+        assert "&lt;script&gt;" in results[0]["snippet"]
+
+    def test_index_keeps_no_copy_of_bodies(self, client, app, test_user):
+        """Test that duplicate bodies are indexed once and never stored again."""
+        body = "alpha " * 50 + "needle in the middle " + "omega " * 50
+        with app.app_context():
+            db.session.add_all(
+                [
+                    Paste(title=f"Copy {n}", content=body, user_id=test_user.id)
+                    for n in range(3)
+                ]
+            )
+            db.session.commit()
+
+            assert db.session.scalar(db.text("SELECT count(*) FROM blob_search")) == 1
+            # Contentless: the index returns no column values
+            stored = db.session.execute(db.text("SELECT content FROM blob_fts"))
+            assert stored.scalars().all() == [None]
+
+        results = search(client, "needle")
+
+        assert len(results) == 3
+        snippet = results[0]["snippet"]
+        assert snippet.startswith("…") and snippet.endswith("…")
+        assert "<mark>needle</mark> in the middle" in snippet
+
+    def test_snippets_read_only_the_head_of_bodies(
+        self, client, app, test_user, record_queries
+    ):
+        """Test that search selects only the start of each inline body."""
+        body = "needle at the start " + "".join(f"word{n} " for n in range(40000))
+        with app.app_context():
+            db.session.add(Paste(title="Big", content=body, user_id=test_user.id))
+            db.session.commit()
+
+        with record_queries() as statements:
+            results = search(client, "needle")
+
+        assert "<mark>needle</mark> at the start" in results[0]["snippet"]
+        selected = [
+            match
+            for statement in statements
+            for match in re.findall(r"\w*\(?content_blob_\d+\.data\b", statement)
+        ]
+        assert selected and all(match.startswith("substr(") for match in selected)
+
+    def test_query_syntax_is_literal(self, client, test_paste):
+        """Test that FTS operators in user input do not cause errors."""
+        assert search(client, 'print" OR (') == []
+        assert len(search(client, "print")) == 1
+
+    def test_reindex_command(self, app, runner, test_paste):
+        """Test rebuilding the index from the CLI."""
+        result = runner.invoke(args=["reindex-search"])
+
+        assert result.exit_code == 0
+        assert "Indexed 1 paste(s)." in result.output
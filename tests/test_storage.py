@@ -0,0 +1,368 @@
+"""
+Tests for external blob storage of large pastes.
+"""
+
+import gzip
+import os
+import time
+
+import pytest
+
+from app import db
+from app.models import ContentBlob, Paste
+from app.storage import blob_store
+
+LARGE = "".join(f"line {i}: some log output\n" for i in range(200))
+
+
+@pytest.fixture
+def external_storage(app, tmp_path):
+    """Store pastes over 1 KB on disk under a temporary directory."""
+    app.config.update(
+        {
+            "BLOB_STORAGE": "filesystem",
+            "BLOB_STORAGE_PATH": str(tmp_path / "blobs"),
+            "BLOB_STORAGE_THRESHOLD": 1024,
+        }
+    )
+    blob_store.init_app(app)
+    yield blob_store
+    app.config["BLOB_STORAGE"] = ""
+    blob_store.init_app(app)
+
+
+def _create(app, test_user, content, title="Stored"):
+    with app.app_context():
+        paste = Paste(title=title, content=content, user_id=test_user.id)
+        db.session.add(paste)
+        db.session.commit()
+        return paste.unique_id, paste.content_hash
+
+
+def _backdate(path, seconds=2 * 24 * 3600):
+    """Make a stored file look older than the prune grace period"""
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+class TestExternalStorage:
+    """Test that large bodies live outside the database."""
+
+    def test_large_paste_stored_on_disk(self, app, test_user, external_storage):
+        """Test that bodies above the threshold are written to files."""
+        unique_id, digest = _create(app, test_user, LARGE)
+
+        with app.app_context():
+            blob = db.session.get(ContentBlob, digest)
+            assert blob.data is None
+            assert blob.location == "filesystem"
+            path = external_storage.local_path(blob)
+            assert gzip.decompress(open(path, "rb").read()).decode() == LARGE
+
+            db.session.expire_all()
+            paste = Paste.query.filter_by(unique_id=unique_id).one()
+            assert paste.content == LARGE
+
+    def test_small_paste_stays_inline(self, app, test_user, external_storage):
+        """Test that bodies under the threshold are kept in the row."""
+        _, digest = _create(app, test_user, "short")
+
+        with app.app_context():
+            blob = db.session.get(ContentBlob, digest)
+            assert blob.location is None
+            assert gzip.decompress(blob.data).decode() == "short"
+
+    def test_raw_streams_stored_file(self, app, client, test_user, external_storage):
+        """Test that raw endpoints serve external blobs without loading them."""
+        unique_id, _ = _create(app, test_user, LARGE)
+
+        for url in (f"/paste/{unique_id}/raw", f"/api/pastes/{unique_id}/raw"):
+            response = client.get(url, headers={"Accept-Encoding": "gzip"})
+            assert response.status_code == 200
+            assert response.headers["Content-Encoding"] == "gzip"
+            assert response.cache_control.public
+            assert not response.cache_control.no_cache
+            assert gzip.decompress(response.get_data()).decode() == LARGE
+
+            response = client.get(url)
+            assert response.status_code == 200
+            assert response.is_streamed
+            assert response.content_length == len(LARGE.encode())
+            assert response.get_data(as_text=True) == LARGE
+
+    def test_prune_removes_unreferenced_files(
+        self, app, runner, test_user, external_storage
+    ):
+        """Test that files are only removed by the prune command."""
+        unique_id, digest = _create(app, test_user, LARGE)
+        with app.app_context():
+            blob = db.session.get(ContentBlob, digest)
+            path = external_storage.local_path(blob)
+            db.session.delete(Paste.query.filter_by(unique_id=unique_id).one())
+            db.session.commit()
+            assert db.session.get(ContentBlob, digest) is None
+
+        assert os.path.exists(path)
+        _backdate(path)
+        result = runner.invoke(args=["prune-blob-files"])
+
+        assert result.exit_code == 0
+        assert "Pruned 1 blob file(s)." in result.output
+        assert not os.path.exists(path)
+
+    def test_prune_spares_files_of_uploads_in_progress(
+        self, app, runner, test_user, external_storage
+    ):
+        """Test that recently written files survive until their row commits."""
+        data = gzip.compress(LARGE.encode("utf-8"))
+        with app.app_context():
+            # Written by an upload whose paste is not committed yet
+            external_storage.write("ab" * 32, data)
+            path = external_storage.backend.path("ab" * 32)
+
+            result = runner.invoke(args=["prune-blob-files"])
+            assert "Pruned 0 blob file(s)." in result.output
+            assert os.path.exists(path)
+
+            # Storing the same body again makes an old file recent again
+            _backdate(path)
+            external_storage.write("ab" * 32, data)
+            result = runner.invoke(args=["prune-blob-files"])
+            assert "Pruned 0 blob file(s)." in result.output
+
+            _backdate(path)
+            result = runner.invoke(args=["prune-blob-files"])
+            assert "Pruned 1 blob file(s)." in result.output
+
+    def test_streamed_upload_written_to_storage(
+        self, app, client, test_user, external_storage
+    ):
+        """Test that large text/plain uploads go straight to external storage."""
+        import base64
+
+        auth_string = base64.b64encode(b"testuser:testpass").decode("utf-8")
+        response = client.post(
+            "/api/pastes?title=Huge",
+            headers={
+                "Content-Type": "text/plain",
+                "Authorization": f"Basic {auth_string}",
+            },
+            data=LARGE.encode("utf-8"),
+        )
+        assert response.status_code == 201
+        unique_id = response.get_json()["id"]
+
+        with app.app_context():
+            paste = Paste.query.filter_by(unique_id=unique_id).one()
+            assert paste.blob.location == "filesystem"
+            assert paste.blob.data is None
+            assert paste.line_count == 200
+            assert paste.content == LARGE
+
+        response = client.get(f"/paste/{unique_id}/raw")
+        assert response.get_data(as_text=True) == LARGE
+
+    def test_windowed_upload_never_decoded_whole(
+        self, app, client, test_user, external_storage, monkeypatch
+    ):
+        """Test that long external pastes are detected and rendered from their head."""
+        import base64
+
+        from app import models
+
+        def decompress_whole(data):
+            raise AssertionError("whole body decompressed")
+
+        monkeypatch.setattr(models, "decompress_text", decompress_whole)
+        body = "#!/usr/bin/env python3\n" + "print('line')\n" * 3000
+        auth_string = base64.b64encode(b"testuser:testpass").decode("utf-8")
+        response = client.post(
+            "/api/pastes?title=Long",
+            headers={
+                "Content-Type": "text/plain",
+                "Authorization": f"Basic {auth_string}",
+            },
+            data=body.encode("utf-8"),
+        )
+        assert response.status_code == 201
+        unique_id = response.get_json()["id"]
+
+        with app.app_context():
+            paste = Paste.query.filter_by(unique_id=unique_id).one()
+            assert paste.windowed
+            # Rendered at upload time from the streamed head
+            assert paste.preview_html is not None
+            assert paste.detected_language == "python"
+
+            paste.highlight_key = paste.detected_language = None
+            paste.keep_updated_at()
+            db.session.commit()
+
+        response = client.get(f"/paste/{unique_id}")
+        assert response.status_code == 200
+        with app.app_context():
+            paste = Paste.query.filter_by(unique_id=unique_id).one()
+            assert paste.detected_language == "python"
+            assert paste.highlight_key is not None
+
+
+class TestRawSlicing:
+    """Test byte ranges and line ranges on raw pastes."""
+
+    LINES = [f"line {i:05d} of a long build log\n" for i in range(1, 20001)]
+    TEXT = "".join(LINES)
+
+    @pytest.fixture
+    def long_paste(self, app, test_user):
+        unique_id, _ = _create(app, test_user, self.TEXT, title="Long")
+        return unique_id
+
+    @pytest.fixture
+    def decompressed_blocks(self, monkeypatch):
+        """Record the size of every block the slicer decompresses."""
+        import app.slicing as slicing
+
+        sizes = []
+        decompress_block = slicing.decompress_block
+
+        def decompress(data):
+            block = decompress_block(data)
+            sizes.append(len(block))
+            return block
+
+        monkeypatch.setattr(slicing, "decompress_block", decompress)
+        return sizes
+
+    def test_byte_range(self, client, long_paste, decompressed_blocks):
+        """Test that a Range request returns 206 with just the bytes asked for."""
+        body = self.TEXT.encode()
+        start = 64 * 1024 - 10  # spans a block boundary
+        response = client.get(
+            f"/paste/{long_paste}/raw",
+            headers={"Range": f"bytes={start}-{start + 99}"},
+        )
+
+        assert response.status_code == 206
+        assert response.headers["Content-Range"] == (
+            f"bytes {start}-{start + 99}/{len(body)}"
+        )
+        assert response.data == body[start : start + 100]
+        assert len(decompressed_blocks) == 2
+
+    def test_byte_range_suffix_and_unsatisfiable(self, client, long_paste):
+        """Test suffix ranges and ranges past the end."""
+        body = self.TEXT.encode()
+        response = client.get(
+            f"/api/pastes/{long_paste}/raw", headers={"Range": "bytes=-20"}
+        )
+        assert response.status_code == 206
+        assert response.data == body[-20:]
+
+        response = client.get(
+            f"/api/pastes/{long_paste}/raw",
+            headers={"Range": f"bytes={len(body) + 5}-"},
+        )
+        assert response.status_code == 416
+        assert response.headers["Content-Range"] == f"bytes */{len(body)}"
+
+    def test_stale_if_range_returns_full_body(self, client, long_paste):
+        """Test that a Range with a mismatched If-Range gets the whole body."""
+        response = client.get(
+            f"/paste/{long_paste}/raw",
+            headers={"Range": "bytes=0-9", "If-Range": '"stale"'},
+        )
+
+        assert response.status_code == 200
+        assert response.data == self.TEXT.encode()
+        assert response.headers["Accept-Ranges"] == "bytes"
+
+    def test_stale_snapshot_validators_follow_the_row(self, client, app, long_paste):
+        """Test that a snapshot cached before an edit never labels the new body."""
+        from app.lookups import paste_cache
+
+        url = f"/paste/{long_paste}/raw"
+        old_etag = client.get(url).headers["ETag"]
+        entry = paste_cache._entries.get(long_paste)
+        with app.app_context():
+            paste = Paste.query.filter_by(unique_id=long_paste).one()
+            paste.content = "edited\n" + self.TEXT
+            db.session.commit()
+
+        # As if another worker still had the pre-edit snapshot cached
+        paste_cache._entries.set(long_paste, entry)
+        response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": old_etag})
+        assert response.status_code == 200
+        assert response.data.startswith(b"edited\n")
+        assert response.headers["ETag"] != old_etag
+        assert paste_cache._entries.get(long_paste) is None
+
+        paste_cache._entries.set(long_paste, entry)
+        response = client.get(url)
+        assert response.data.startswith(b"edited\n")
+        assert response.headers["ETag"] != old_etag
+
+    def test_line_range(self, client, long_paste, decompressed_blocks):
+        """Test that ?lines= uses the line index instead of scanning the body."""
+        response = client.get(f"/paste/{long_paste}/raw?lines=3001-3003")
+
+        assert response.status_code == 200
+        assert response.get_data(as_text=True) == "".join(self.LINES[3000:3003])
+        assert response.headers["X-Total-Lines"] == "20000"
+        # The block holding the lines (once per end) and the last block
+        assert len(decompressed_blocks) <= 3
+
+    def test_line_range_forms(self, client, long_paste):
+        """Test single lines, open ranges and tails."""
+        url = f"/api/pastes/{long_paste}/raw"
+
+        assert client.get(f"{url}?lines=1").get_data(as_text=True) == self.LINES[0]
+        assert client.get(f"{url}?lines=19999-").get_data(as_text=True) == "".join(
+            self.LINES[19998:]
+        )
+        assert client.get(f"{url}?lines=-2").get_data(as_text=True) == "".join(
+            self.LINES[-2:]
+        )
+        assert client.get(f"{url}?lines=30000-30001").status_code == 416
+        assert client.get(f"{url}?lines=abc").status_code == 400
+
+    def test_line_range_on_external_blob(
+        self, app, client, test_user, external_storage
+    ):
+        """Test that slicing reads external blobs the same way."""
+        unique_id, _ = _create(app, test_user, LARGE)
+
+        response = client.get(f"/paste/{unique_id}/raw?lines=200")
+
+        assert response.get_data(as_text=True) == "line 199: some log output\n"
+        assert response.headers["X-Total-Lines"] == "200"
+
+    @pytest.mark.parametrize("stored", ["inline", "external"])
+    def test_compressed_body_is_a_single_gzip_member(
+        self, app, client, test_user, tmp_path, stored
+    ):
+        """Test that clients decoding one gzip member get the whole body."""
+        import zlib
+
+        if stored == "external":
+            app.config.update(
+                {
+                    "BLOB_STORAGE": "filesystem",
+                    "BLOB_STORAGE_PATH": str(tmp_path / "blobs"),
+                    "BLOB_STORAGE_THRESHOLD": 1024,
+                }
+            )
+            blob_store.init_app(app)
+        try:
+            unique_id, _ = _create(app, test_user, self.TEXT, title="Long")
+            response = client.get(
+                f"/paste/{unique_id}/raw", headers={"Accept-Encoding": "gzip"}
+            )
+        finally:
+            app.config["BLOB_STORAGE"] = ""
+            blob_store.init_app(app)
+
+        assert response.headers["Content-Encoding"] == "gzip"
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        assert decoder.decompress(response.data).decode() == self.TEXT
+        assert decoder.eof
+        assert decoder.unused_data == b""
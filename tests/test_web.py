@@ -47,6 +47,114 @@ class TestHomeRoutes:
         response = client.get("/?page=2")
         assert response.status_code == 200
 
+    def test_home_page_cursor_pagination(self, client, app, test_user):
+        """Test home page keyset pagination via ?after= cursors."""
+        with app.app_context():
+            for i in range(25):
+                db.session.add(
+                    Paste(
+                        title=f"Paste {i}", content=f"Content {i}", user_id=test_user.id
+                    )
+                )
+            db.session.commit()
+
+        response = client.get("/?after=")
+        assert response.status_code == 200
+        assert b"Paste 24" in response.data
+        assert b"Older" in response.data
+
+        response = client.get("/?after=bogus")
+        assert response.status_code == 400
+
+    def test_home_page_uses_stored_previews(self, client, app, test_paste):
+        """Test that the home page serves stored previews without re-rendering."""
+        with app.app_context():
+            paste = Paste.query.get(test_paste.id)
+            paste.prerender()
+            paste.preview_html = "stored preview marker"
+            db.session.commit()
+
+        response = client.get("/")
+
+        assert response.status_code == 200
+        assert b"stored preview marker" in response.data
+
+
+class TestListingFragments:
+    """Test cached listing pages for anonymous visitors."""
+
+    def test_front_page_served_from_cache(
+        self, client, app, test_paste, shared_cache, record_queries
+    ):
+        """Test that a repeat anonymous hit does not query the pastes."""
+        with app.app_context():
+            db.session.get(Paste, test_paste.id).prerender()
+            db.session.commit()
+
+        with record_queries() as statements:
+            first = client.get("/")
+        assert statements
+
+        with record_queries() as statements:
+            second = client.get("/")
+        assert statements == []
+        assert second.data == first.data
+        assert test_paste.title.encode() in second.data
+
+    def test_public_changes_invalidate_listings(
+        self, client, app, test_user, test_paste, shared_cache
+    ):
+        """Test that creating or hiding a public paste refreshes the page."""
+        client.get("/")
+        client.get("/language/python")
+
+        with app.app_context():
+            db.session.add(
+                Paste(
+                    title="Fresh Paste",
+                    content="x = 1",
+                    language="python",
+                    user_id=test_user.id,
+                )
+            )
+            db.session.commit()
+
+        assert b"Fresh Paste" in client.get("/").data
+        assert b"Fresh Paste" in client.get("/language/python").data
+
+        with app.app_context():
+            paste = Paste.query.filter_by(title="Fresh Paste").first()
+            paste.is_public = False
+            db.session.commit()
+
+        assert b"Fresh Paste" not in client.get("/").data
+
+    def test_memory_backend_does_not_cache_listings(
+        self, client, test_paste, record_queries
+    ):
+        """Test that per-worker caches never hold listings other workers miss."""
+        client.get("/")
+
+        with record_queries() as statements:
+            client.get("/")
+
+        assert statements
+
+    def test_private_changes_keep_listings(self, client, app, test_user, shared_cache):
+        """Test that private pastes do not invalidate the public listings."""
+        from app.fragments import fragment_cache
+
+        with app.app_context():
+            version = fragment_cache.version()
+            db.session.add(
+                Paste(
+                    title="Secret", content="x", user_id=test_user.id, is_public=False
+                )
+            )
+            db.session.commit()
+
+            assert fragment_cache.version() == version
+
 
 class TestPasteRoutes:
     """Test paste-related routes."""
@@ -105,6 +213,80 @@ class TestPasteRoutes:
         assert b"<html>" not in response.data
         assert b"<!DOCTYPE" not in response.data
 
+    def test_raw_paste_conditional_get(self, client, test_paste):
+        """Test that raw pastes revalidate with ETag and Last-Modified."""
+        url = f"/paste/{test_paste.unique_id}/raw"
+        response = client.get(url)
+
+        assert response.headers["ETag"]
+        assert response.headers["Last-Modified"]
+        assert response.cache_control.public
+        assert response.cache_control.max_age == 300
+
+        response = client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+        assert response.status_code == 304
+        assert response.data == b""
+
+        last_modified = client.get(url).headers["Last-Modified"]
+        response = client.get(url, headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+
+    def test_raw_paste_served_precompressed(self, client, test_paste):
+        """Test that gzip-capable clients get the stored bytes directly."""
+        import gzip
+
+        url = f"/paste/{test_paste.unique_id}/raw"
+        response = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert gzip.decompress(response.data).decode() == test_paste.content
+
+        plain = client.get(url)
+        assert "Content-Encoding" not in plain.headers
+        assert plain.data.decode() == test_paste.content
+        assert plain.headers["ETag"] != response.headers["ETag"]
+
+    def test_raw_paste_etag_changes_on_edit(self, client, app, test_paste):
+        """Test that editing a paste invalidates cached copies."""
+        url = f"/paste/{test_paste.unique_id}/raw"
+        etag = client.get(url).headers["ETag"]
+
+        with app.app_context():
+            paste = Paste.query.get(test_paste.id)
+            paste.content = "edited content"
+            paste.prerender()
+            db.session.commit()
+
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.data == b"edited content"
+        assert response.headers["ETag"] != etag
+
+    def test_view_paste_conditional_get(self, client, app, test_paste):
+        """Test that paste pages revalidate and still count views."""
+        url = f"/paste/{test_paste.unique_id}"
+        response = client.get(url)
+        assert response.cache_control.no_cache
+        assert not response.cache_control.public
+
+        response = client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+        assert response.status_code == 304
+
+        with app.app_context():
+            assert Paste.query.get(test_paste.id).views == 2
+
+    def test_view_counts_keep_updated_at(self, client, app, test_paste):
+        """Test that flushing views does not change a paste's validators."""
+        url = f"/paste/{test_paste.unique_id}/raw"
+        etag = client.get(url).headers["ETag"]
+
+        client.get(f"/paste/{test_paste.unique_id}")
+
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
     def test_paste_view_count(self, client, app, test_paste):
         """Test that paste views are incremented."""
         with app.app_context():
@@ -117,6 +299,164 @@ class TestPasteRoutes:
             updated_paste = Paste.query.get(test_paste.id)
             assert updated_paste.views == initial_views + 1
 
+    def test_view_paste_uses_stored_highlight(self, client, app, test_paste):
+        """Test that viewing a paste serves the pre-rendered highlight."""
+        with app.app_context():
+            paste = Paste.query.get(test_paste.id)
+            paste.prerender()
+            paste.highlighted_html = '<div class="highlight">cached render</div>'
+            db.session.commit()
+
+        response = client.get(f"/paste/{test_paste.unique_id}")
+
+        assert response.status_code == 200
+        assert b"cached render" in response.data
+
+    def test_long_paste_renders_first_window(self, client, app, test_user):
+        """Test that a long paste only renders its first window inline."""
+        unique_id = self._long_paste(app, test_user)
+
+        response = client.get(f"/paste/{unique_id}")
+
+        assert response.status_code == 200
+        assert b'id="codeWindows"' in response.data
+        assert b"x_500" in response.data
+        assert b"x_501" not in response.data
+
+    def test_paste_window_endpoint(self, client, app, test_user):
+        """Test loading further windows of a long paste as JSON."""
+        unique_id = self._long_paste(app, test_user)
+
+        response = client.get(f"/paste/{unique_id}/windows/1")
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["first_line"] == 501
+        assert data["next"] == 2
+        assert "x_501" in data["html"] and "x_1001" not in data["html"]
+
+        last = client.get(f"/paste/{unique_id}/windows/4").get_json()
+        assert last["next"] is None
+        assert client.get(f"/paste/{unique_id}/windows/5").status_code == 404
+
+    def test_paste_window_private_and_short(self, client, app, test_user, test_paste):
+        """Test that private long pastes and short pastes have no windows."""
+        unique_id = self._long_paste(app, test_user, is_public=False)
+
+        assert client.get(f"/paste/{unique_id}/windows/1").status_code == 404
+        assert client.get(f"/paste/{test_paste.unique_id}/windows/0").status_code == 404
+
+    def test_long_lines_appear_once_across_windows(self, client, app, test_user):
+        """Test that windows cut by size continue where the previous one stopped."""
+        lines = [f"L{n:04d} " + "x" * 1018 + "\n" for n in range(1, 1001)]
+        unique_id = self._create(app, test_user, "".join(lines))
+
+        windows = self._windows(client, unique_id)
+
+        assert len(windows) > 2
+        html = "".join(window["html"] for window in windows)
+        for n in range(1, 1001):
+            assert html.count(f"L{n:04d} ") == 1
+        # Each window reports the line it really starts at
+        for window in windows:
+            first = window["first_line"]
+            assert f"L{first:04d} " in window["html"]
+            assert f"L{first - 1:04d} " not in window["html"]
+
+    def test_huge_single_line_paste_is_split(self, client, app, test_user):
+        """Test that a line too long for one window continues in the next."""
+        text = "y" * (600 * 1024)
+        unique_id = self._create(app, test_user, text)
+
+        windows = self._windows(client, unique_id)
+
+        assert len(windows) == 3
+        assert [window["first_line"] for window in windows] == [1, 1, 1]
+        assert sum(window["html"].count("y") for window in windows) == len(text)
+
+    def test_fallback_page_is_not_cached(self, client, test_paste, monkeypatch):
+        """Test that a plain-text fallback gets no validators and is not stored."""
+        import app.models as models
+        from app.rendering import highlight_service
+
+        def fail(content, language, windowed=False):
+            raise RuntimeError("lexer blew up")
+
+        monkeypatch.setattr(models, "render_paste", fail)
+        url = f"/paste/{test_paste.unique_id}"
+        response = client.get(url)
+
+        assert response.status_code == 200
+        assert response.cache_control.no_store
+        assert "ETag" not in response.headers
+        assert "Last-Modified" not in response.headers
+
+        monkeypatch.undo()
+        highlight_service.failures.clear()
+        response = client.get(url)
+        assert not response.cache_control.no_store
+        assert response.headers["ETag"]
+
+    def test_fallback_window_is_not_cached(self, client, app, test_user, monkeypatch):
+        """Test that a window served as plain text is neither public nor validated."""
+        import app.models as models
+
+        highlight_window = models.highlight_window
+
+        def fail(text, language, first):
+            if language != "text":
+                raise RuntimeError("lexer blew up")
+            return highlight_window(text, language, first)
+
+        unique_id = self._long_paste(app, test_user)
+        monkeypatch.setattr(models, "highlight_window", fail)
+        response = client.get(f"/paste/{unique_id}/windows/1")
+
+        assert response.status_code == 200
+        assert "x_501" in response.get_json()["html"]
+        assert response.cache_control.no_store
+        assert not response.cache_control.public
+        assert "ETag" not in response.headers
+
+    @staticmethod
+    def _create(app, user, content):
+        with app.app_context():
+            paste = Paste(
+                title="Wide", content=content, language="text", user_id=user.id
+            )
+            paste.prerender()
+            db.session.add(paste)
+            db.session.commit()
+            assert paste.windowed
+            assert paste.highlighted_html is None
+            return paste.unique_id
+
+    @staticmethod
+    def _windows(client, unique_id):
+        assert client.get(f"/paste/{unique_id}").status_code == 200
+        windows, number = [], 0
+        while number is not None:
+            response = client.get(f"/paste/{unique_id}/windows/{number}")
+            assert response.status_code == 200
+            windows.append(response.get_json())
+            number = windows[-1]["next"]
+        return windows
+
+    @staticmethod
+    def _long_paste(app, user, is_public=True):
+        with app.app_context():
+            paste = Paste(
+                title="Long",
+                content="".join(f"x_{i} = {i}\n" for i in range(1, 2501)),
+                language="python",
+                is_public=is_public,
+                user_id=user.id,
+            )
+            paste.prerender()
+            db.session.add(paste)
+            db.session.commit()
+            assert paste.highlighted_html is None
+            return paste.unique_id
+
     def test_create_paste_get(self, client, auth, test_user):
         """Test GET /create - create paste form."""
         auth.login("testuser", "testpass")
@@ -371,6 +711,49 @@ class TestDocumentationRoutes:
         assert b"Tools" in response.data or b"Command Line" in response.data
 
 
+class TestStylesheets:
+    """Test the fingerprinted site stylesheet."""
+
+    def _stylesheet_url(self, client):
+        import re
+
+        html = client.get("/api-docs").get_data(as_text=True)
+        return re.search(r'href="(/assets/site-[^"]+\.css)"', html).group(1)
+
+    def test_pages_link_stylesheet_instead_of_inlining(self, client):
+        """Test that pages no longer carry the Pygments rules inline."""
+        response = client.get("/api-docs")
+
+        assert b".highlight .k {" not in response.data
+        assert self._stylesheet_url(client).startswith("/assets/site-tango.")
+
+    def test_stylesheet_cached_for_a_year(self, client):
+        """Test that the bundle has far-future headers and revalidates."""
+        url = self._stylesheet_url(client)
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.mimetype == "text/css"
+        assert response.cache_control.max_age == 365 * 24 * 3600
+        assert response.cache_control.immutable
+        assert b".highlight .k {" in response.data
+        assert b".highlight-preview .k {" in response.data
+
+        cached = client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+        assert cached.status_code == 304
+        assert client.get("/assets/site-tango.stale.css").status_code == 404
+
+    def test_each_theme_has_its_own_bundle(self, app, client):
+        """Test that other configured themes are served under their own URL."""
+        from app.assets import stylesheets
+
+        with app.test_request_context():
+            tango, monokai = stylesheets.url(), stylesheets.url("monokai")
+
+        assert tango != monokai
+        assert client.get(monokai).data != client.get(tango).data
+
+
 class TestErrorHandling:
     """Test error handling and edge cases."""
 